@@ -1,10 +1,17 @@
 import sys
-from db_initial_connection import base, session
-from table_classes import ProductsDict, InstrumentsDict, PricesCurveDict, CurvesDict, Curves, DeliveryPoint
+import argparse
+from db_initial_connection import connect, get_session
+from prices_table_classes import ProductsDict, InstrumentsDict, PricesCurveDict, CurvesDict, Curves, DeliveryPoint, get_table
 import pandas as pd
 import numpy as np
 from gas_parser import GASParser
 from power_parser import POWERParser
+from parsed_storage import iter_parsed
+from parse_cache import ParseCache
+from pipeline import Pipeline, iter_batches, QUEUE_SIZE
+from dimension_cache import dimensions
+from metrics import metrics
+from profiling import add_profile_argument, start_profiling
 import datetime
 import tqdm
 
@@ -13,6 +20,13 @@ from dotenv import load_dotenv
 
 load_dotenv('/srv/sstd/.env')
 
+# columns of parsed data used by the loader, other columns are not read from parquet files
+loader_columns = ['date', 'prices_name', 'price', 'hub', 'hub2', 'unit', 'currency', 'price_type', 'products',
+                  'product_type']
+# columns of the instrument (and its products) and of the prices curve searched in the database
+instrument_columns = ['hub', 'hub2', 'currency', 'unit', 'product_type', 'products', 'date']
+prices_curve_columns = ['id_instrument', 'price_type']
+
 class Loader42fs:
     def __init__(self):
         self.curves_class = Curves()
@@ -29,27 +43,27 @@ class Loader42fs:
                     source: str = '42 Financial Services'):
         country = self._countries[point_name]
 
-        search_country = session.query(
-            base.classes.country_dict.id).filter(
-            base.classes.country_dict.country_name == country).all()
+        search_country = get_session().query(
+            get_table('country_dict').id).filter(
+            get_table('country_dict').country_name == country).all()
 
         if len(search_country) != 1:
             raise IndexError(country)
         else:
             id_country = search_country[0]
 
-        search_point_type = session.query(
-            base.classes.delivery_point_types_dict.id).filter(
-            base.classes.delivery_point_types_dict.point_type == point_type).all()
+        search_point_type = get_session().query(
+            get_table('delivery_point_types_dict').id).filter(
+            get_table('delivery_point_types_dict').point_type == point_type).all()
 
         if len(search_point_type) != 1:
             raise IndexError(point_type)
         else:
             id_type = search_point_type[0]
 
-        search_source = session.query(
-            base.classes.source_dict.id).filter(
-            base.classes.source_dict.source_name == source).all()
+        search_source = get_session().query(
+            get_table('source_dict').id).filter(
+            get_table('source_dict').source_name == source).all()
 
         if len(search_source) != 1:
             raise IndexError(source)
@@ -64,9 +78,9 @@ class Loader42fs:
         beg_date = date
         end_date = date
 
-        search_dp = session.query(
-            base.classes.delivery_point_dict.id).filter(
-            base.classes.delivery_point_dict.point_name == point_name).all()
+        search_dp = get_session().query(
+            get_table('delivery_point_dict').id).filter(
+            get_table('delivery_point_dict').point_name == point_name).all()
 
         match len(search_dp):
             case 0:
@@ -76,44 +90,44 @@ class Loader42fs:
             case _:
                 raise IndexError(f'there are more than one record in delivery_point_dict with a name {point_name}')
 
-        search_market = session.query(
-            base.classes.markets_dict.id).filter(
-            base.classes.markets_dict.market_name == market).all()
+        search_market = get_session().query(
+            get_table('markets_dict').id).filter(
+            get_table('markets_dict').market_name == market).all()
 
         if len(search_market) != 1:
             raise IndexError(market)
         else:
             id_market = search_market[0]
 
-        search_currency = session.query(
-            base.classes.currencies_dict.id).filter(
-            base.classes.currencies_dict.currency_code == currency).all()
+        search_currency = get_session().query(
+            get_table('currencies_dict').id).filter(
+            get_table('currencies_dict').currency_code == currency).all()
 
         if len(search_currency) != 1:
             raise IndexError(currency)
         else:
             id_currency = search_currency[0]
 
-        search_unit = session.query(
-            base.classes.units_dict.id).filter(
-            base.classes.units_dict.unit_name == unit).all()
+        search_unit = get_session().query(
+            get_table('units_dict').id).filter(
+            get_table('units_dict').unit_name == unit).all()
 
         if len(search_unit) != 1:
             raise IndexError(unit)
         else:
             id_unit = search_unit[0]
 
-        search_product_type = session.query(
-            base.classes.product_types_dict.id).filter(
-            base.classes.product_types_dict.product_type == product_type).all()
+        search_product_type = get_session().query(
+            get_table('product_types_dict').id).filter(
+            get_table('product_types_dict').product_type == product_type).all()
 
         if len(search_product_type) != 1:
             raise IndexError(product_type)
         else:
             id_product_type = search_product_type[0]
 
-        products_table = base.classes.products_dict
-        check_exists = session.query(products_table.id).filter(
+        products_table = get_table('products_dict')
+        check_exists = get_session().query(products_table.id).filter(
             products_table.id_delivery_point == id_dp,
             products_table.id_currency == id_currency[0],
             products_table.id_unit == id_unit[0],
@@ -152,17 +166,17 @@ class Loader42fs:
             instrument_type = 'Spread'
             id_product2 = self.validate_product(hub2, currency, unit, product_type, market, code, date)
 
-        search_instrument_type = session.query(
-            base.classes.instrument_types_dict.id).filter(
-            base.classes.instrument_types_dict.instrument_type == instrument_type).all()
+        search_instrument_type = get_session().query(
+            get_table('instrument_types_dict').id).filter(
+            get_table('instrument_types_dict').instrument_type == instrument_type).all()
 
         if len(search_instrument_type) != 1:
             raise IndexError(instrument_type)
         else:
             id_instrument_type = search_instrument_type[0]
 
-        instruments_table = base.classes.instruments_dict
-        check_exists = session.query(instruments_table.id).filter(
+        instruments_table = get_table('instruments_dict')
+        check_exists = get_session().query(instruments_table.id).filter(
             instruments_table.id_product_1 == id_product1,
             instruments_table.id_product_2 == id_product2,
             instruments_table.id_instrument_type == id_instrument_type[0]).all()
@@ -180,26 +194,26 @@ class Loader42fs:
                                  f'\nid_product_2 = {id_product2}')
 
     def validate_prices_curve(self, source: str, id_instrument: int, price_type: str, description: str):
-        search_source = session.query(
-            base.classes.source_dict.id).filter(
-            base.classes.source_dict.source_name == source).all()
+        search_source = get_session().query(
+            get_table('source_dict').id).filter(
+            get_table('source_dict').source_name == source).all()
 
         if len(search_source) != 1:
             raise IndexError(source)
         else:
             id_source = search_source[0]
 
-        search_price_type = session.query(
-            base.classes.prices_type_dict.id).filter(
-            base.classes.prices_type_dict.price_type == price_type).all()
+        search_price_type = get_session().query(
+            get_table('prices_type_dict').id).filter(
+            get_table('prices_type_dict').price_type == price_type).all()
 
         if len(search_price_type) != 1:
             raise IndexError(price_type)
         else:
             id_type = search_price_type[0]
 
-        prices_curve_table = base.classes.prices_curve_dict
-        check_exists = session.query(prices_curve_table.id).filter(
+        prices_curve_table = get_table('prices_curve_dict')
+        check_exists = get_session().query(prices_curve_table.id).filter(
             prices_curve_table.id_source == id_source[0],
             prices_curve_table.id_instrument == id_instrument,
             prices_curve_table.id_type == id_type[0]).all()
@@ -217,17 +231,17 @@ class Loader42fs:
                                  f'\nid_instrument = {id_instrument}')
 
     def validate_curves_dict(self, id_prices_curves: int, sector_name: str):
-        search_sector = session.query(
-            base.classes.sector_dict.id).filter(
-            base.classes.sector_dict.sector_name == sector_name).all()
+        search_sector = get_session().query(
+            get_table('sector_dict').id).filter(
+            get_table('sector_dict').sector_name == sector_name).all()
 
         if len(search_sector) != 1:
             raise IndexError(sector_name)
         else:
             id_sector = search_sector[0]
 
-        curves_dict_table = base.classes.curves_dict
-        check_exists = session.query(curves_dict_table.id).filter(
+        curves_dict_table = get_table('curves_dict')
+        check_exists = get_session().query(curves_dict_table.id).filter(
             curves_dict_table.id_prices_curves == id_prices_curves,
             curves_dict_table.id_sector == id_sector[0]).all()
 
@@ -242,8 +256,52 @@ class Loader42fs:
                                  f'\nid_prices_curves = {id_prices_curves}'
                                  f'\nid_sector = {id_sector}')
 
-    def insert_42fs(self, source: str = '42 Financial Services', sector: str = 'currency prices',
-                    df_fs: pd.DataFrame = None, market_type: str = None):
+    def resolve_ids(self, data: pd.DataFrame, market: str, source: str = '42 Financial Services',
+                    sector: str = 'currency prices') -> pd.DataFrame:
+        # every distinct combination of values is searched in database only once,
+        # found ids are kept in the dimension cache shared by all loaders
+        # (products are searched and inserted with the date as beg_date and end_date, so the date is in the key)
+        instruments = data[instrument_columns].drop_duplicates()
+        instruments['id_instrument'] = [
+            dimensions.get(('instruments_dict', x.hub, x.hub2, x.currency, x.unit, x.product_type, market,
+                            x.products, x.date),
+                           lambda x=x: self.validate_instrument(x.hub, x.hub2, x.currency, x.unit, x.product_type,
+                                                                market, x.products, x.date))
+            for x in instruments.itertuples(index=False)]
+        data = data.merge(instruments, on=instrument_columns, how='left')
+
+        # the description of the curve is taken from the first row of the curve
+        prices_curves = data.drop_duplicates(subset=prices_curve_columns)[[*prices_curve_columns, 'prices_name']]
+        prices_curves['id_prices_curves'] = [
+            dimensions.get(('prices_curve_dict', source, x.id_instrument, x.price_type),
+                           lambda x=x: self.validate_prices_curve(source, x.id_instrument, x.price_type,
+                                                                  x.prices_name))
+            for x in prices_curves.itertuples(index=False)]
+        data = data.merge(prices_curves.drop(columns='prices_name'), on=prices_curve_columns, how='left')
+
+        curves_dict = data[['id_prices_curves']].drop_duplicates()
+        curves_dict['id_curve'] = [
+            dimensions.get(('curves_dict', 'id_prices_curves', id_prices_curves, sector),
+                           lambda id_prices_curves=id_prices_curves: self.validate_curves_dict(id_prices_curves,
+                                                                                                sector))
+            for id_prices_curves in curves_dict['id_prices_curves']]
+        return data.merge(curves_dict, on='id_prices_curves', how='left')
+
+    def insert_curves(self, data: pd.DataFrame) -> None:
+        data = data[['id_curve', 'date', 'price']].to_numpy()
+        for row in tqdm.tqdm(data):
+            try:
+                self.curves_class.insert_new_data(row[0], row[1], float(row[2]))
+            except:
+                sys.exit(1)
+        metrics.inc('rows_written', len(data), source='42fs')
+
+    def insert_batches(self, batches, source: str = '42 Financial Services', sector: str = 'currency prices',
+                       market_type: str = None, queue_size: int = QUEUE_SIZE):
+        """
+        resolves ids and inserts data by batches,
+        ids of the next batches are resolved while the previous batch is inserted
+        """
         match market_type:
             case 'gas':
                 market = 'Natural Gas'
@@ -252,29 +310,47 @@ class Loader42fs:
             case _:
                 raise ValueError('wrong market_type, it can only be "gas" or "power"')
 
-        data = df_fs
-        data['id_instrument'] = data.apply(
-            lambda x: self.validate_instrument(
-                x.hub, x.hub2, x.currency, x.unit, x.product_type, market, x.products, x.date), axis=1)
-        data['id_prices_curves'] = data.apply(
-            lambda x: self.validate_prices_curve(
-                source, x.id_instrument, x.price_type, x.prices_name), axis=1)
-        data['id_curve'] = data.apply(
-            lambda x: self.validate_curves_dict(x.id_prices_curves, sector), axis=1)
-        data = data[['id_curve', 'date', 'price']].to_numpy()
-        for row in tqdm.tqdm(data):
-            try:
-                self.curves_class.insert_new_data(row[0], row[1], np.float64(row[2]))
-            except:
-                sys.exit(1)
+        def resolve_ids(data: pd.DataFrame) -> pd.DataFrame:
+            return self.resolve_ids(data, market, source=source, sector=sector)
+
+        Pipeline(stages=[resolve_ids, self.insert_curves],
+                 queue_size=queue_size,
+                 # sessions of the stage threads go back to the shared pool
+                 on_stage_exit=lambda: get_session().close(),
+                 name=f'42fs {market_type} loader').run(batches)
         return 'ok'
 
+    def insert_42fs(self, source: str = '42 Financial Services', sector: str = 'currency prices',
+                    df_fs: pd.DataFrame = None, market_type: str = None):
+        return self.insert_batches(iter_batches(df_fs), source=source, sector=sector, market_type=market_type)
+
 
 if __name__ == '__main__':
-    file_name_gas = r'ClosingDayPricesGAS2023.xlsx'
-    result_gas = GASParser(file_name_gas)
-    Loader42fs().insert_42fs(df_fs=result_gas.df, market_type='gas')
-    file_name_power = r'ClosingDayPricesPOWER2023.xlsx'
-    result_power = POWERParser(file_name_power)
-    result_gas = pd.read_csv(r'ClosingDayPricesGAS2023.csv')
-    Loader42fs().insert_42fs(df_fs=result_power.df, market_type='power')
+    arg_parser = argparse.ArgumentParser(description='loads 42 Financial Services closing prices into the database')
+    arg_parser.add_argument('--input-format', choices=('xlsx', 'parquet'), default='xlsx',
+                            help='parse xlsx files or read parquet files written by gas_parser.py and power_parser.py')
+    arg_parser.add_argument('--start-date', type=datetime.date.fromisoformat, default=None,
+                            help='first day to load from parquet files (YYYY-MM-DD)')
+    arg_parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=None,
+                            help='last day to load from parquet files (YYYY-MM-DD)')
+    arg_parser.add_argument('--no-parse-cache', action='store_true',
+                            help='parse xlsx files again instead of taking unchanged files from the parse cache')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
+
+    if args.input_format == 'parquet':
+        for market_type in ('gas', 'power'):
+            Loader42fs().insert_batches(iter_parsed('42fs', market_type, columns=loader_columns,
+                                                    start_date=args.start_date, end_date=args.end_date),
+                                        market_type=market_type)
+    else:
+        parse_cache = None if args.no_parse_cache else ParseCache(folder='parsed_data/parse_cache')
+        file_name_gas = r'ClosingDayPricesGAS2023.xlsx'
+        result_gas = GASParser(file_name_gas, parse_cache=parse_cache)
+        Loader42fs().insert_42fs(df_fs=result_gas.df, market_type='gas')
+        file_name_power = r'ClosingDayPricesPOWER2023.xlsx'
+        result_power = POWERParser(file_name_power, parse_cache=parse_cache)
+        result_gas = pd.read_csv(r'ClosingDayPricesGAS2023.csv')
+        Loader42fs().insert_42fs(df_fs=result_power.df, market_type='power')
+    connect.close()
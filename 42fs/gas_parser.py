@@ -1,10 +1,20 @@
+import os
+import sys
+import argparse
 import datetime
 import math
 
-import openpyxl
 import pandas as pd
 from pathlib import Path
 import re
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../GRTgaz'))
+from parsed_storage import PARSED_DATA_FOLDER, write_parsed
+from parse_cache import ParseCache
+from metrics import metrics
+from profiling import add_profile_argument, start_profiling
+
+# change it when parsing of the files is changed, so files parsed before are parsed again
+PARSER_VERSION = 'gas_parser/1'
 
 
 class DataRow:
@@ -121,9 +131,17 @@ class GASParser:
     """
     class to read the xlsx file
     """
-    def __init__(self, file_name):
+    def __init__(self, file_name, parse_cache: ParseCache = None):
         self.file_name = file_name
         self.xlsx_file = Path('', self.file_name)
+        with metrics.stage('parse', source='42fs', data_type='gas'):
+            if parse_cache is None:
+                self.df = self.read_file(file_name)
+            else:
+                self.df = parse_cache.parse(file_name, self.read_file, parser_version=PARSER_VERSION)
+        metrics.inc('rows_parsed', len(self.df.index), source='42fs', data_type='gas')
+
+    def read_file(self, file_name):
         self.df = pd.DataFrame(columns=['date', 'prices_name', 'price', 'hub', 'hub2', 'unit', 'currency', 'price_type',
                                         'products', 'source', 'product_type'])
 
@@ -140,8 +158,10 @@ class GASParser:
                                    'Q124':'Q1/24', 'Q224':'Q2/24', 'Q324':'Q3/24', 'Q424':'Q4/24',
                                    'Tue': 'Tuesday', 'Wed': 'Wednesday', 'Thu': 'Thursday',
                                    'Fri': 'Friday', 'Sat': 'Saturday', 'Sun': 'Sunday'})
+        return self.df
 
     def get_sheets_from_file(self):
+        import openpyxl
         wb = openpyxl.load_workbook(self.xlsx_file, data_only=True)
         for sheet_ in wb.worksheets:
             new_GAS_sheet = GASSheet(sheet_)
@@ -156,11 +176,24 @@ class GASParser:
     def write_df_to_csv(self):
         self.df.to_csv(self.xlsx_file.stem + '.csv')
 
-
-if __name__ == '__main__':
-    file_name = r'ClosingDayPricesGAS2023.xlsx'
-    new_parser = GASParser(file_name)
-    new_parser.df.to_csv(r'ClosingDayPricesGAS2023.csv')
+    def write_df_to_parquet(self, folder: str = PARSED_DATA_FOLDER):
+        write_parsed(self.df, source='42fs', data_type='gas', folder=folder)
 
 
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='parses 42 Financial Services closing prices')
+    arg_parser.add_argument('--output-format', choices=('csv', 'parquet'), default='parquet',
+                            help='parquet files partitioned by year or one csv file')
+    arg_parser.add_argument('--no-parse-cache', action='store_true',
+                            help='parse the file again instead of taking it from the parse cache')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
 
+    file_name = r'ClosingDayPricesGAS2023.xlsx'
+    parse_cache = None if args.no_parse_cache else ParseCache(folder='parsed_data/parse_cache')
+    new_parser = GASParser(file_name, parse_cache=parse_cache)
+    if args.output_format == 'parquet':
+        new_parser.write_df_to_parquet()
+    else:
+        new_parser.df.to_csv(r'ClosingDayPricesGAS2023.csv')
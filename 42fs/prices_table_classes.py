@@ -1,21 +1,34 @@
-from db_initial_connection import engine, base, session
+from db_initial_connection import get_engine, get_base, get_session
 from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 import numpy as np
 
+# only these tables are reflected from the database by the loader
+TABLES = ('products_dict', 'instruments_dict', 'prices_curve_dict', 'curves_dict', 'curves',
+          'delivery_point_dict', 'delivery_point_types_dict', 'country_dict', 'source_dict', 'markets_dict',
+          'currencies_dict', 'units_dict', 'product_types_dict', 'instrument_types_dict', 'prices_type_dict',
+          'sector_dict')
+
+
+def get_table(table_name: str):
+    """
+    returns the class of the table, the schema is reflected on first use
+    """
+    return get_base(TABLES).classes[table_name]
+
 
 class ProductsDict:
     def __init__(self):
         # products_dict
-        self._products_table = base.classes.products_dict
+        self._products_table = get_table('products_dict')
 
     @staticmethod
     def next_table_id():
-        return session.execute('SELECT nextval('"'curves_id_seq'"');').scalar()
+        return get_session().execute('SELECT nextval('"'curves_id_seq'"');').scalar()
 
     def insert_new_data(self, id_dp: int, id_currency: int, id_unit: int, id_market: int, id_product_type: int,
                         beg_date: datetime, end_date: datetime, code: str):
-        insert_statement = insert(self._products_table, bind=engine).values(
+        insert_statement = insert(self._products_table, bind=get_engine()).values(
             id_delivery_point=id_dp,
             id_currency=id_currency,
             id_unit=id_unit,
@@ -32,18 +45,18 @@ class ProductsDict:
                             'id_product_type', 'beg_date', 'end_date', 'code'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
 
 
 class InstrumentsDict:
     def __init__(self):
         # instruments_dict
-        self._instruments_table = base.classes.instruments_dict
+        self._instruments_table = get_table('instruments_dict')
 
     def insert_new_data(self, id_product_1: int, id_product_2: int, id_instrument_type: int):
-        insert_statement = insert(self._instruments_table, bind=engine).values(
+        insert_statement = insert(self._instruments_table, bind=get_engine()).values(
             id_product_1=id_product_1,
             id_product_2=id_product_2,
             id_instrument_type=id_instrument_type,
@@ -54,18 +67,18 @@ class InstrumentsDict:
             index_elements=['id_product_1', 'id_product_2', 'id_instrument_type'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
 
 
 class PricesCurveDict:
     def __init__(self):
         # prices_curve_dict
-        self._prices_curve_table = base.classes.prices_curve_dict
+        self._prices_curve_table = get_table('prices_curve_dict')
 
     def insert_new_data(self, id_source: int, id_instrument: int, id_type: int, description: str):
-        insert_statement = insert(self._prices_curve_table, bind=engine).values(
+        insert_statement = insert(self._prices_curve_table, bind=get_engine()).values(
             id_source=id_source,
             id_instrument=id_instrument,
             id_type=id_type,
@@ -77,18 +90,18 @@ class PricesCurveDict:
             index_elements=['id_source', 'id_instrument', 'id_type'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
 
 
 class CurvesDict:
     def __init__(self):
         # curves_dict
-        self._curves_dict_table = base.classes.curves_dict
+        self._curves_dict_table = get_table('curves_dict')
 
     def insert_new_data(self, id_sector, id_prices_curves: int):
-        insert_statement = insert(self._curves_dict_table, bind=engine).values(
+        insert_statement = insert(self._curves_dict_table, bind=get_engine()).values(
             id_sector=id_sector,
             id_prices_curves=id_prices_curves,
             update_time=datetime.today()
@@ -98,18 +111,18 @@ class CurvesDict:
             index_elements=['id'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
 
 
 class Curves:
     def __init__(self):
         # curves
-        self._curves_table = base.classes.curves
+        self._curves_table = get_table('curves')
 
     def insert_new_data(self, id_curve, date: datetime, value: np.float64):
-        insert_statement = insert(self._curves_table, bind=engine).values(
+        insert_statement = insert(self._curves_table, bind=get_engine()).values(
             id_curve=id_curve,
             date=date,
             value=value,
@@ -121,18 +134,18 @@ class Curves:
             set_={'value': insert_statement.excluded.value,
                   'update_time': insert_statement.excluded.update_time},
         )
-        session.execute(update_statement)
-        session.commit()
+        get_session().execute(update_statement)
+        get_session().commit()
 
 
 class DeliveryPoint:
     def __init__(self):
         # delivery_point
-        self._dp_table = base.classes.delivery_point_dict
+        self._dp_table = get_table('delivery_point_dict')
         # self._countries = {'Chech_base': 'Czechia'}
 
     def insert_new_data(self, id_type: int, id_country: int, id_source: int, point_name: str):
-        insert_statement = insert(self._dp_table, bind=engine).values(
+        insert_statement = insert(self._dp_table, bind=get_engine()).values(
             id_type=id_type,
             # id_country=id_country,
             id_source=id_source,
@@ -144,6 +157,6 @@ class DeliveryPoint:
             index_elements=['id'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
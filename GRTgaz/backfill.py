@@ -0,0 +1,194 @@
+import os
+import json
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Literal, List, Mapping
+from loguru import logger
+
+Chunk_Size = Literal['year', 'quarter', 'month']
+
+CHUNK_MONTHS: Mapping['Chunk_Size', int] = {
+    'year': 12,
+    'quarter': 3,
+    'month': 1
+}
+
+CHECKPOINT_FILE_NAME = 'checkpoint.json'
+
+
+@dataclass(slots=True, frozen=True)
+class Chunk:
+    start: date
+    end: date
+    # the last day of the calendar year / quarter / month of the chunk (end is cut with the end date)
+    period_end: date = None
+
+    def is_open(self, today: date = None) -> bool:
+        """
+        checks if data of the chunk can still change: its period is not over
+        """
+        today = date.today() if today is None else today
+        return (self.period_end or self.end) >= today
+
+    @property
+    def key(self) -> str:
+        """
+        returns the name used for the chunk output and in the checkpoint file,
+        the chunk of the current period is named by its period, so it does not get a new name every day
+        """
+        end = self.period_end if self.period_end is not None and self.is_open() else self.end
+        return f'{self.start.isoformat()}_{end.isoformat()}'
+
+
+def split_date_range(start_date: date, end_date: date, chunk_size: Chunk_Size = 'year') -> List[Chunk]:
+    """
+    splits the date range into calendar aligned chunks,
+    the first and the last chunks are cut with start_date and end_date
+    """
+    months = CHUNK_MONTHS[chunk_size]
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        # first day of the next calendar year / quarter / month
+        month_index = (chunk_start.month - 1) // months * months + months
+        next_start = date(chunk_start.year + month_index // 12, month_index % 12 + 1, 1)
+        period_end = next_start - timedelta(days=1)
+        chunks.append(Chunk(start=chunk_start, end=min(period_end, end_date), period_end=period_end))
+        chunk_start = next_start
+    return chunks
+
+
+class Backfill:
+    """
+    class to collect historical data chunk by chunk,
+    every finished chunk is saved with a checkpoint so an interrupted backfill resumes
+    from the first missing chunk;
+    chunks of periods which are not over are collected again by every run
+    """
+    def __init__(self, name: str, folder: str = 'checkpoints', chunk_size: Chunk_Size = 'year'):
+        self.name = name
+        self.chunk_size = chunk_size
+        self._folder = os.path.join(folder, name)
+        self._checkpoint_file = os.path.join(self._folder, CHECKPOINT_FILE_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(self._folder, exist_ok=True)
+        self._done = self._read_checkpoint()
+
+    def _read_checkpoint(self) -> set:
+        """
+        reads keys of finished chunks from the checkpoint file
+        """
+        if not os.path.exists(self._checkpoint_file):
+            return set()
+        with open(self._checkpoint_file) as f:
+            return set(json.load(f)['done'])
+
+    def _write_checkpoint(self) -> None:
+        """
+        rewrites the checkpoint file, the old file is replaced only when the new one is written
+        """
+        temp_file = f'{self._checkpoint_file}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'chunk_size': self.chunk_size, 'done': sorted(self._done)}, f, indent=2)
+        os.replace(temp_file, self._checkpoint_file)
+
+    def chunk_file(self, chunk: Chunk) -> str:
+        """
+        returns the file name of the parsed chunk output
+        """
+        return os.path.join(self._folder, f'{chunk.key}.pkl')
+
+    def chunks(self, start_date: date, end_date: date) -> List[Chunk]:
+        """
+        returns all chunks of the date range
+        """
+        return split_date_range(start_date=start_date, end_date=end_date, chunk_size=self.chunk_size)
+
+    def is_done(self, chunk: Chunk) -> bool:
+        """
+        checks if the chunk is already finished
+        """
+        return chunk.key in self._done
+
+    def pending_chunks(self, start_date: date, end_date: date) -> List[Chunk]:
+        """
+        returns chunks of the date range that are not finished yet
+        """
+        return [chunk for chunk in self.chunks(start_date, end_date) if not self.is_done(chunk)]
+
+    def mark_done(self, chunk: Chunk) -> None:
+        """
+        puts the chunk in the checkpoint file,
+        the chunk of the period which is not over is not put, as its data can still change
+        """
+        if chunk.is_open():
+            return
+        with self._lock:
+            self._done.add(chunk.key)
+            self._write_checkpoint()
+
+    def remove_stale(self, chunks: List[Chunk]) -> None:
+        """
+        deletes outputs and checkpoints of chunks which start as chunks but have another end
+        (saved for the period which was not over and named by the day they were collected)
+        """
+        keys = {chunk.key for chunk in chunks}
+        starts = tuple(f'{chunk.start.isoformat()}_' for chunk in chunks)
+        stale_done = {key for key in self._done if key.startswith(starts) and key not in keys}
+        for file_name in os.listdir(self._folder):
+            key, extension = os.path.splitext(file_name)
+            if extension == '.pkl' and key.startswith(starts) and key not in keys:
+                os.unlink(os.path.join(self._folder, file_name))
+        if stale_done:
+            with self._lock:
+                self._done -= stale_done
+                self._write_checkpoint()
+
+    def save_chunk(self, chunk: Chunk, df: pd.DataFrame) -> None:
+        """
+        saves parsed data of the chunk and marks it as finished
+        """
+        file_name = self.chunk_file(chunk)
+        df.to_pickle(f'{file_name}.tmp', compression=None)
+        os.replace(f'{file_name}.tmp', file_name)
+        self.mark_done(chunk)
+
+    def load_chunk(self, chunk: Chunk) -> pd.DataFrame:
+        """
+        reads parsed data of the finished chunk
+        """
+        return pd.read_pickle(self.chunk_file(chunk), compression=None)
+
+    def _collect_chunk(self, fetch: Callable[[date, date], pd.DataFrame], chunk: Chunk) -> None:
+        """
+        collects data of the chunk and saves it
+        """
+        logger.info(f'Collecting {self.name} data from {chunk.start} till {chunk.end}...')
+        self.save_chunk(chunk, fetch(chunk.start, chunk.end))
+
+    def run(self, fetch: Callable[[date, date], pd.DataFrame], start_date: date, end_date: date,
+            workers: int = 1) -> pd.DataFrame:
+        """
+        collects data with fetch(start, end) for every chunk that is not finished yet
+        and returns data of the whole date range
+        (if workers > 1 chunks are collected concurrently, so fetch must be thread-safe)
+        """
+        chunks = self.chunks(start_date, end_date)
+        if not chunks:
+            return pd.DataFrame()
+        self.remove_stale(chunks)
+        pending = [chunk for chunk in chunks if not self.is_done(chunk)]
+        if workers > 1 and len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(self._collect_chunk, fetch, chunk) for chunk in pending]:
+                    future.result()
+        else:
+            for chunk in pending:
+                self._collect_chunk(fetch, chunk)
+
+        df = pd.concat([self.load_chunk(chunk) for chunk in chunks], sort=False, axis=0)
+        df.reset_index(drop=True, inplace=True)
+        return df
@@ -1,5 +1,5 @@
 ﻿import os
-from typing import Literal, Mapping, Callable
+from typing import Literal, Mapping, Callable, Union
 from dotenv import load_dotenv
 
 from sqlalchemy.exc import ArgumentError
@@ -11,6 +11,9 @@ ENV_VAR_NAME_PREFIXES: Mapping['DatabaseName', str] = {
     'analytics_base_test': 'ANALYTICS_TEST'
 }
 DatabaseName = Literal["analytics_base", "analytics_base_test"]
+GRTGAZ_BASE_URL = 'https://www.smart.grtgaz.com'
+# set it to collect from another server (e.g. the fixture server of benchmarks/fixture_server.py)
+GRTGAZ_BASE_URL_ENV_VAR = 'GRTGAZ_BASE_URL'
 
 
 class NoSuchDatabase(Exception):
@@ -57,14 +60,44 @@ class DatabaseConfig:
 
     @property
     def db_name(self) -> str:
-        """Returns name of database from environmental variables"""
-        return self._db_name
+        """Returns name of database from environmental variables (default `db_name`)"""
+        return os.environ.get(f'{self._env_var_name_prefix}_DATABASE_NAME') or self._db_name
 
     @property
     def user(self) -> str:
         """Returns database username from environmental variables"""
         return os.environ.get(f'{self._env_var_name_prefix}_DATABASE_USERNAME')
 
+    @property
+    def pool_size(self) -> int:
+        """Returns number of connections kept open in the pool from environmental variables (default 5)"""
+        return int(os.environ.get('DATABASE_POOL_SIZE', 5))
+
+    @property
+    def max_overflow(self) -> int:
+        """Returns number of connections opened above `pool_size` under load from environmental variables
+        (default 10)"""
+        return int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+
+    @property
+    def pool_pre_ping(self) -> bool:
+        """Returns True if connections are checked before they are taken from the pool (default True)"""
+        return os.environ.get('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+    @property
+    def query_cache_size(self) -> int:
+        """Returns size of the compiled statements cache from environmental variables (default 500)"""
+        return int(os.environ.get('DATABASE_QUERY_CACHE_SIZE', 500))
+
+    def get_engine_options(self) -> Mapping[str, Union[int, bool]]:
+        """Returns options of the pool and the statement cache used when creating the engine"""
+        return {
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_pre_ping': self.pool_pre_ping,
+            'query_cache_size': self.query_cache_size
+        }
+
     def get_config(self) -> str:
         """Returns string with database configuration"""
         return (f"{self.source_name}+{self.driver}://"
@@ -96,6 +129,11 @@ class DatabaseConfig:
         return True if self._db_name in ENV_VAR_NAME_PREFIXES else False
 
 
+def get_grtgaz_base_url(base_url: str = None) -> str:
+    """Returns `base_url` if it is set, else the URL from environmental variable GRTGAZ_BASE_URL or the GRTgaz site"""
+    return (base_url or os.environ.get(GRTGAZ_BASE_URL_ENV_VAR) or GRTGAZ_BASE_URL).rstrip('/')
+
+
 def _catch_bad_config(get_connection_func: Callable) -> Callable:
     """Catch `BadConnectionConfig` when creation the database configuration"""
 
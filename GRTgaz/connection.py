@@ -1,13 +1,17 @@
-﻿import sys
-from typing import Optional
+﻿import os
+import sys
+import threading
+from typing import Iterable, Mapping, Optional, Union
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from sqlalchemy.ext.automap import automap_base
 from loguru import logger
 
 from config import DatabaseName, DatabaseConfig, _catch_bad_config
+from schema_cache import reflect_metadata
+from metrics import metrics
 
 
 logger.remove(0)
@@ -24,7 +28,8 @@ class DatabaseConnection:
 
     Database connection is `Engine` instance of SQLAlchemy package.
     Connection is used when reading, inserting, deleting and updating
-    data in database.
+    data in database. One pooled engine is shared by all loaders, every thread
+    gets its own session from the session factory.
     """
 
     def __init__(self, *, db_name: DatabaseName) -> None:
@@ -37,20 +42,34 @@ class DatabaseConnection:
         self._config: str = self.create_db_connection_config()
         logger.info("Created confing for {database!r}".format(database=self._db_name))
         self._connection: Optional[Engine] = None
+        self._session_factory: Optional[scoped_session] = None
+        self._bases: Mapping[Optional[frozenset], automap_base] = {}
+        self._lock = threading.RLock()
 
     def create_db_connection_config(self) -> str:
         """Creates database configuration by database name `db_name`"""
         config = DatabaseConfig(db_name=self._db_name)
         return config.get_config()
 
+    def get_engine_options(self) -> Mapping[str, Union[int, bool]]:
+        """Returns options of the pool and the statement cache.
+
+        Options are read from environmental variables when the engine is created, not on import,
+        so entry points can set them (e.g. the pool size for their number of jobs) before first use.
+        """
+        return DatabaseConfig(db_name=self._db_name).get_engine_options()
+
     @_catch_bad_config
     def get_connection(self) -> Engine:
         """Returns database connection"""
-        if not self._check_if_connection_exists():
-            connection = create_engine(url=self._config)
-            self._save_connection(connection)
-            logger.info("Created connection to {database!r}".format(database=self._db_name))
-        return self._connection
+        with self._lock:
+            if not self._check_if_connection_exists():
+                connection = create_engine(url=self._config, **self.get_engine_options())
+                # DB round trips and commits are counted for metrics of the run
+                metrics.instrument_engine(connection)
+                self._save_connection(connection)
+                logger.info("Created connection to {database!r}".format(database=self._db_name))
+            return self._connection
 
     def _check_if_connection_exists(self) -> bool:
         """Returns True if database connection exists"""
@@ -62,30 +81,85 @@ class DatabaseConnection:
 
     def close(self) -> None:
         """Closes connection if exists"""
-        if self._check_if_connection_exists():
-            self._connection.dispose()
-            logger.info("Closed connection to {database!r}".format(database=self._db_name))
-            self._reset_connection()
+        with self._lock:
+            if self._check_if_connection_exists():
+                if self._session_factory is not None:
+                    self._session_factory.remove()
+                self._connection.dispose()
+                logger.info("Closed connection to {database!r}".format(database=self._db_name))
+                self._reset_connection()
 
     def _reset_connection(self) -> None:
-        """Resets connection if it was disposed"""
+        """Resets connection and session factory if connection was disposed"""
         self._connection = None
+        self._session_factory = None
 
-    def get_session(self) -> Session:
-        """create db session"""
-        out_session = Session(bind=self._connection)
-        return out_session
+    def reset_after_fork(self) -> None:
+        """Drops connections inherited from the parent process.
 
-    def get_initial_base(self) -> classmethod:
-        """create db schema via automap"""
-        out_base = automap_base()
-        out_base.prepare(self._connection,
-                         reflect=True)
-        return out_base
+        Connections of the parent process are not closed, so the parent can still use them,
+        the child process opens its own connections on first use.
+        """
+        self._lock = threading.RLock()
+        if self._check_if_connection_exists():
+            self._connection.dispose(close=False)
+        self._session_factory = None
 
+    def get_session(self) -> Session:
+        """Returns db session of the current thread, session and connection are created on first use"""
+        with self._lock:
+            if self._session_factory is None:
+                self._session_factory = scoped_session(sessionmaker(bind=self.get_connection()))
+            session_factory = self._session_factory
+        return session_factory()
 
-# connection
+    def get_initial_base(self, tables: Optional[Iterable[str]] = None) -> classmethod:
+        """Returns db schema via automap, schema is reflected once for every set of tables.
+
+        Args:
+            tables: names of tables to reflect (tables referenced by their foreign keys
+                are reflected too), all tables are reflected if it is None
+        """
+        key = None if tables is None else frozenset(tables)
+        with self._lock:
+            if key not in self._bases:
+                metadata = reflect_metadata(self.get_connection(), tables=key)
+                out_base = automap_base(metadata=metadata)
+                out_base.prepare()
+                self._bases[key] = out_base
+                logger.info("Reflected {count} tables of {database!r}".format(count=len(metadata.tables),
+                                                                               database=self._db_name))
+            return self._bases[key]
+
+
+# connection, engine, session and schema are created on first use
+# and are shared by GRTgaz, Fluxys, National Grid and 42fs loaders
 connect = DatabaseConnection(db_name='analytics_base')
-engine = connect.get_connection()
-session = connect.get_session()
-base = connect.get_initial_base()
+os.register_at_fork(after_in_child=connect.reset_after_fork)
+
+
+def get_engine() -> Engine:
+    """Returns database engine"""
+    return connect.get_connection()
+
+
+def get_session() -> Session:
+    """Returns database session"""
+    return connect.get_session()
+
+
+def get_base(tables: Optional[Iterable[str]] = None) -> classmethod:
+    """Returns automap schema with `tables` (all tables if it is None)"""
+    return connect.get_initial_base(tables)
+
+
+def __getattr__(name: str):
+    """Creates `engine`, `session` and `base` on first access to them (PEP 562)"""
+    match name:
+        case 'engine':
+            return get_engine()
+        case 'session':
+            return get_session()
+        case 'base':
+            return get_base()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
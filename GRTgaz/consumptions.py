@@ -1,23 +1,25 @@
 import requests
-import openpyxl
 from pathlib import Path
 from datetime import datetime, timedelta
 from copy import copy
+from config import get_grtgaz_base_url
 
 
 class ConsumptionsParser:
     @staticmethod
-    def get_data_from_grtgaz(file_name: str, params: dict):
+    def get_data_from_grtgaz(file_name: str, params: dict, base_url: str = None):
         """
         function to get .xlsx data from GRTgaz
+        (from base_url if it is set, see config.get_grtgaz_base_url)
         """
-        url = 'https://www.smart.grtgaz.com/api/v1/en/consommation/export/Zone.xls'
+        url = f'{get_grtgaz_base_url(base_url)}/api/v1/en/consommation/export/Zone.xls'
         r = requests.get(url, params=params)
+        r.raise_for_status()
         with open(file_name + '.xlsx', 'wb') as f:
             f.write(r.content)
 
     @staticmethod
-    def get_current_data(file_name):
+    def get_current_data(file_name, base_url: str = None):
         """
         get data for the past two days
         """
@@ -27,15 +29,16 @@ class ConsumptionsParser:
             'endDate': str(datetime.now().date()),
             'range': 'daily'
         }
-        ConsumptionsParser.get_data_from_grtgaz(file_name, params)
+        ConsumptionsParser.get_data_from_grtgaz(file_name, params, base_url=base_url)
         xls = XLSXParser(file_name)
         xls.save()
 
     @staticmethod
-    def get_historical_data(file_name):
+    def get_historical_data(file_name, base_url: str = None):
         """
         function to get historical data from 01.04.2015 till now into .xlsx file
         """
+        import openpyxl
         start_year = 2015
         end_year = datetime.now().year
 
@@ -82,7 +85,7 @@ class ConsumptionsParser:
             if year == end_year:
                 params['endDate'] = str(datetime.now().date())
 
-            ConsumptionsParser.get_data_from_grtgaz(file_name, params)
+            ConsumptionsParser.get_data_from_grtgaz(file_name, params, base_url=base_url)
 
             if year == start_year:
                 xls = XLSXParser(file_name)
@@ -99,6 +102,7 @@ class XLSXParser:
     class to read the xlsx file
     """
     def __init__(self, file_name):
+        import openpyxl
         self.file_name = file_name
         self.xlsx_file = Path('', self.file_name + '.xlsx')
         self.wb = openpyxl.load_workbook(self.xlsx_file, data_only=True)
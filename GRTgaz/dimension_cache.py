@@ -0,0 +1,59 @@
+import threading
+from typing import Callable, Dict, Hashable, TypeVar
+from metrics import metrics
+
+T = TypeVar('T')
+
+
+class DimensionCache:
+    """
+    class to keep ids of dictionary records found or inserted by the loaders,
+    every record is searched in the database only once per process;
+    the cache is shared by all loaders and threads,
+    a record is searched by one thread at a time, so the same record is not inserted twice
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: Dict[Hashable, object] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, search: Callable[[], T]) -> T:
+        """
+        returns the id of the record with key, search() is called only if the key is not in the cache yet
+        (errors of search are not cached)
+        """
+        with self._lock:
+            if key in self._ids:
+                self.hits += 1
+                metrics.inc('dimension_cache_hits')
+                return self._ids[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._ids:
+                    self.hits += 1
+                    metrics.inc('dimension_cache_hits')
+                    return self._ids[key]
+            value = search()
+            with self._lock:
+                self._ids[key] = value
+                self._key_locks.pop(key, None)
+                self.misses += 1
+        metrics.inc('dimension_cache_misses')
+        return value
+
+    def clear(self) -> None:
+        """
+        forgets all ids (for example after dictionaries were changed in the database)
+        """
+        with self._lock:
+            self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# ids are shared by GRTgaz, Fluxys, National Grid and 42fs loaders in one process
+dimensions = DimensionCache()
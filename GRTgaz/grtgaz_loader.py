@@ -1,10 +1,21 @@
 import sys
+import argparse
+import requests
 import pandas as pd
 import numpy as np
 import tqdm
-from typing import Literal, Mapping, Union
-from connection import connect, session, base
-from table_classes import CurvesDict, Curves, FlowCurves
+from datetime import date
+from itertools import chain
+from typing import Iterable, Literal, Mapping, Union, get_args
+from connection import connect, get_session
+from table_classes import CurvesDict, Curves, FlowCurves, get_table
+from grtgaz_parser import GRTgazParser, DATA_TYPES
+from watermarks import WatermarkStore, OVERLAP_DAYS
+from parsed_storage import Output_Format, iter_parsed
+from pipeline import Pipeline, iter_batches, QUEUE_SIZE
+from dimension_cache import dimensions
+from metrics import metrics
+from profiling import add_profile_argument, start_profiling
 
 attr_dict: Mapping[str, 'one_attr_tables'] = {
     'unit': 'units_dict', 'delivery_point': 'delivery_point_dict',
@@ -33,25 +44,25 @@ def search_record_in_table(table_name: one_attr_tables, attr: str) -> int:
     table = field = None
     match table_name:
         case 'units_dict':
-            table = base.classes.units_dict
+            table = get_table('units_dict')
             field = table.unit_name
         case 'delivery_point_dict':
-            table = base.classes.delivery_point_dict
+            table = get_table('delivery_point_dict')
             field = table.point_name
         case 'country_dict':
-            table = base.classes.country_dict
+            table = get_table('country_dict')
             field = table.country_2
         case 'flow_types':
-            table = base.classes.flow_types
+            table = get_table('flow_types')
             field = table.flow_type
         case 'source_dict':
-            table = base.classes.source_dict
+            table = get_table('source_dict')
             field = table.source_name
         case 'sector_dict':
-            table = base.classes.sector_dict
+            table = get_table('sector_dict')
             field = table.sector_name
 
-    search_record = session.query(
+    search_record = get_session().query(
         table.id).filter(
         field == attr).all()
 
@@ -64,53 +75,142 @@ def search_record_in_table(table_name: one_attr_tables, attr: str) -> int:
             raise IndexError(f'there are more than one record in {table_name} with a name {attr}')
 
 
+# columns of parsed data used by the loader, other columns are not read from parquet files
+loader_columns = ['date', 'delivery_point', 'from_country', 'to_country', 'flow_type', 'curve_name', 'value']
+flow_curves_columns = ['id_source', 'id_point', 'id_unit', 'from_country', 'to_country',
+                       'from_company', 'to_company', 'id_type', 'curve_name']
+curves_dict_columns = ['id_sector', 'id_flow_curves']
+
+
 class GRTgazLoader:
-    def __init__(self):
+    def __init__(self, source: str = additional_columns['source']):
+        # Fluxys data is loaded by the same loader with its own source
+        self.source = source
         self.curves = Curves()
         self.curves_dict = CurvesDict()
         self.flow_curves = FlowCurves()
 
-    def insert_grtgaz(self, df_fs: pd.DataFrame = None):
-        data = df_fs
-
-        # convert all string data to id where possible
+    def resolve_ids(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        converts all string data to id,
+        every distinct value or combination of values is searched in database only once
+        and found ids are kept in the dimension cache shared by all loaders
+        """
         for col_name, value in additional_columns.items():
             data[col_name] = value
+        data['source'] = self.source
         for old_col, new_col in new_columns.items():
-            data[new_col] = data.apply(
-                lambda x: search_record_in_table(
-                    table_name=attr_dict[old_col], attr=x[old_col]), axis=1)
+            table_name = attr_dict[old_col]
+            ids = {attr: dimensions.get((table_name, attr),
+                                        lambda: search_record_in_table(table_name=table_name, attr=attr))
+                   for attr in data[old_col].unique()}
+            data[new_col] = data[old_col].map(ids)
 
         # get id_flow_curves from table flow_curves
-        data['id_flow_curves'] = data.apply(
-            lambda x: self.flow_curves.search_data(
+        flow_curves = data[flow_curves_columns].drop_duplicates()
+        flow_curves['id_flow_curves'] = [
+            dimensions.get(('flow_curves', *x), lambda x=x: self.flow_curves.search_data(
                 id_source=x.id_source, id_point=x.id_point,
                 id_unit=x.id_unit, from_country=x.from_country,
                 from_company=x.from_company, to_company=x.to_company,
                 to_country=x.to_country, id_type=x.id_type,
-                curve_name=x.curve_name), axis=1)
+                curve_name=x.curve_name)) for x in flow_curves.itertuples(index=False)]
+        data = data.merge(flow_curves, on=flow_curves_columns, how='left')
 
         # get id_curve from table curves_dict
-        data['id_curve'] = data.apply(
-            lambda x: self.curves_dict.search_data(
-                id_sector=x.id_sector, id_flow_curves=x.id_flow_curves), axis=1)
-
-        # insert data into table curves
+        curves_dict = data[curves_dict_columns].drop_duplicates()
+        curves_dict['id_curve'] = [
+            dimensions.get(('curves_dict', *x), lambda x=x: self.curves_dict.search_data(
+                id_sector=x.id_sector, id_flow_curves=x.id_flow_curves)) for x in curves_dict.itertuples(index=False)]
+        return data.merge(curves_dict, on=curves_dict_columns, how='left')
+
+    def insert_curves(self, data: pd.DataFrame) -> None:
+        """
+        inserts data into table curves
+        """
         data = data[['id_curve', 'date', 'value']].to_numpy()
         for row in tqdm.tqdm(data):
             try:
                 self.curves.insert_new_data(id_curve=row[0],
                                             date=row[1],
-                                            value=np.float64(row[2]))
+                                            value=float(row[2]))
             except:
                 sys.exit(1)
-            connect.close()
+        metrics.inc('rows_written', len(data), source=self.source)
+
+    def insert_batches(self, batches: Iterable[pd.DataFrame], queue_size: int = QUEUE_SIZE):
+        """
+        resolves ids and inserts data by batches,
+        ids of the next batches are resolved while the previous batch is inserted
+        and at most queue_size batches wait for every stage
+        """
+        Pipeline(stages=[self.resolve_ids, self.insert_curves], queue_size=queue_size,
+                 # sessions of the stage threads go back to the shared pool, the engine is kept warm
+                 on_stage_exit=lambda: get_session().close(),
+                 name=f'{self.source} loader').run(batches)
         return 'ok'
 
+    def insert_grtgaz(self, df_fs: pd.DataFrame = None):
+        return self.insert_batches(iter_batches(df_fs))
+
+    def insert_grtgaz_types(self, dfs: Mapping[str, pd.DataFrame]):
+        """
+        inserts data of several data types at once through one pipeline
+        """
+        return self.insert_batches(chain.from_iterable(iter_batches(df) for df in dfs.values()))
+
+
+def load_incremental(store: WatermarkStore, overlap: int = OVERLAP_DAYS,
+                     data_types=DATA_TYPES, start_date: date = date(2015, 4, 1)):
+    """
+    collects and inserts data of every data type from its watermark minus overlap days till today,
+    the watermark is moved only when data is inserted
+    """
+    loader = GRTgazLoader()
+    with requests.Session() as http_session:
+        for data_type in data_types:
+            parser = GRTgazParser(data_type, session=http_session)
+            store.run(source=additional_columns['source'], data_type=data_type,
+                      fetch=parser.get_data_between, load=loader.insert_grtgaz,
+                      default_start=start_date, overlap=overlap)
+
 
 if __name__ == '__main__':
-    data_types = ('consumptions', 'commercial_flow', 'physical_flow')
-    data_type = data_types[2]
-    folder = 'parsed_data/'
-    result = pd.read_excel(f'{folder}/all_GRTgaz_{data_type}.xlsx', index_col=False)
-    GRTgazLoader().insert_grtgaz(df_fs=result)
+    arg_parser = argparse.ArgumentParser(description='loads GRTgaz data into the database')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='collect and load data from the last loaded gas day minus overlap till today')
+    arg_parser.add_argument('--overlap', type=int, default=OVERLAP_DAYS,
+                            help='days before the last loaded gas day to collect again')
+    arg_parser.add_argument('--state-file', default='parsed_data/watermarks.json',
+                            help='file with the last loaded gas days')
+    arg_parser.add_argument('--input-format', choices=get_args(Output_Format), default='parquet',
+                            help='format of parsed data written by grtgaz_parser.py')
+    arg_parser.add_argument('--start-date', type=date.fromisoformat, default=None,
+                            help='first gas day to load from parquet files (YYYY-MM-DD)')
+    arg_parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help='last gas day to load from parquet files (YYYY-MM-DD)')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
+
+    if args.incremental:
+        load_incremental(WatermarkStore(args.state_file), overlap=args.overlap)
+    else:
+        data_types = ('consumptions', 'commercial_flow', 'physical_flow')
+        folder = 'parsed_data/'
+        match args.input_format:
+            case 'parquet':
+                # parquet files are read by batches while previous batches are loaded
+                GRTgazLoader().insert_batches(chain.from_iterable(
+                    iter_parsed('GRTgaz', data_type, columns=loader_columns, start_date=args.start_date,
+                                end_date=args.end_date, folder=f'{folder}parquet')
+                    for data_type in data_types))
+            case 'csv':
+                results = {data_type: pd.read_csv(f'{folder}/all_GRTgaz_{data_type}.csv', index_col=False)
+                           for data_type in data_types}
+                GRTgazLoader().insert_grtgaz_types(dfs=results)
+            case _:
+                results = {data_type: pd.read_excel(f'{folder}/all_GRTgaz_{data_type}.xlsx', index_col=False)
+                           for data_type in data_types}
+                GRTgazLoader().insert_grtgaz_types(dfs=results)
+    connect.close()
@@ -1,15 +1,28 @@
+import os
+import argparse
 import requests
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import unicodedata
-from typing import Literal, Union
+from typing import Literal, Mapping, Tuple, Union, get_args
+from backfill import Backfill, Chunk_Size
+from raw_archive import RawArchive, is_closed_period
+from parsed_storage import Output_Format, write_parsed
+from parse_cache import ParseCache
+from metrics import metrics
+from profiling import add_profile_argument, start_profiling
+from config import get_grtgaz_base_url
 
 
 Data_Type = Literal['consumptions', 'commercial_flow', 'physical_flow']
+DATA_TYPES: Tuple['Data_Type', ...] = ('consumptions', 'commercial_flow', 'physical_flow')
 columns = ['date', 'delivery_point', 'from_country', 'to_country',
            'curve_type', 'flow_type', 'value', 'curve_name']
+# change it when parsing of the files is changed, so files parsed before are parsed again
+PARSER_VERSION = 'grtgaz_parser/1'
 
 
 def strip_accents(string_: str):
@@ -20,13 +33,25 @@ def strip_accents(string_: str):
                    if unicodedata.category(char_) != 'Mn')
 
 
-def get_data_from_resource(file_name: str, url: str, params: dict):
+def get_data_from_resource(file_name: str, url: str, params: dict, session: requests.Session = None,
+                           archive: RawArchive = None, immutable: bool = False):
     """
     function to get data as a file from resource set with url with set parameters
+    (if session is set the request is sent through it to reuse its connections,
+    if archive is set the file is taken from it when it is not changed)
     """
-    result = requests.get(url, params=params)
-    with open(file_name, 'wb') as f:
-        f.write(result.content)
+    with metrics.stage('download', source='GRTgaz'):
+        if archive is not None:
+            fetch_result = archive.fetch(url, file_name, params=params, session=session, immutable=immutable)
+            metrics.inc('raw_archive_fetches', source='GRTgaz', result=fetch_result)
+            if fetch_result == 'downloaded':
+                metrics.inc('bytes_downloaded', os.path.getsize(file_name), source='GRTgaz')
+            return
+        result = (session or requests).get(url, params=params)
+        result.raise_for_status()
+        with open(file_name, 'wb') as f:
+            f.write(result.content)
+        metrics.inc('bytes_downloaded', len(result.content), source='GRTgaz')
 
 
 class DataRow:
@@ -116,7 +141,6 @@ class XLSData:
             self.read_consumptions(file_name)
         else:
             self.read_flows(file_name)
-        Path(file_name).unlink()
 
     def read_consumptions(self, file_name):
         """
@@ -226,9 +250,15 @@ class GRTgazParser:
     """
     class to get data from GRTgaz in the DataFrame form
     """
-    def __init__(self, data_type: Data_Type):
+    def __init__(self, data_type: Data_Type, session: requests.Session = None, archive: RawArchive = None,
+                 parse_cache: ParseCache = None, folder: str = '', base_url: str = None):
         type_param = param = ''
         self.data_type = data_type
+        self.session = session
+        self.archive = archive
+        self.parse_cache = parse_cache
+        # downloaded files are saved into folder (current directory by default) and deleted after parsing
+        self.folder = folder
         match self.data_type:
             case 'consumptions':
                 type_param = 'consommation'
@@ -239,69 +269,115 @@ class GRTgazParser:
             case 'physical_flow':
                 type_param = 'flux_physiques'
                 param = 'PIR'
-        self.url = f'https://www.smart.grtgaz.com/api/v1/en/{type_param}/export/{param}.xls'
+        self.url = f'{get_grtgaz_base_url(base_url)}/api/v1/en/{type_param}/export/{param}.xls'
         self.dt_today = date.today()
         self.dt_format = '%-Y-%-m-%-d'
 
-    def get_current_data(self):
+    def _get_data(self, start_date: date, end_date: date, file_name: str) -> pd.DataFrame:
         """
-        function to get data for the past two days in the DataFrame form
+        function to get data from start date till end date in the DataFrame form
         """
-        file_name = 'current.xlsx'
         params = {
-            'startDate': (self.dt_today - timedelta(days=2)).strftime(self.dt_format),
-            'endDate': self.dt_today.strftime(self.dt_format)
+            'startDate': start_date.strftime(self.dt_format),
+            'endDate': end_date.strftime(self.dt_format)
         }
         if self.data_type == 'commercial_flow':
             params['range'] = 'daily'
-        get_data_from_resource(file_name, self.url, params)
-        return XLSData(file_name, self.data_type).df.reset_index(drop=True, inplace=True)
+        get_data_from_resource(file_name, self.url, params, self.session,
+                               archive=self.archive, immutable=is_closed_period(end_date))
+        df = self._parse(file_name)
+        Path(file_name).unlink()
+        return df
 
-    def get_historical_data(self, start_date=date(2015, 4, 1), end_date=date.today()):
+    def _parse(self, file_name: str) -> pd.DataFrame:
         """
-        function to get historical data from start date till end date in the DataFrame form
-        (default from 01.04.2015 till now)
+        function to parse the downloaded file,
+        the file is taken from the parse cache if it is not changed since the last parsing
         """
-        df = pd.DataFrame(columns=['date', 'delivery_point', 'from_country',
-                                   'to_country', 'curve_type', 'flow_type', 'value'])
-        for year in range(start_date.year, end_date.year + 1):
-            params = {
-                'startDate': date(year, 1, 1).strftime(self.dt_format),
-                'endDate': date(year, 12, 31).strftime(self.dt_format)
-            }
-            if self.data_type == 'commercial_flow':
-                params['range'] = 'daily'
-
-            match year:
-                case start_date.year:
-                    params['startDate'] = start_date.strftime(self.dt_format)
-
-                case end_date.year:
-                    params['endDate'] = end_date.strftime(self.dt_format)
-
-            file_name = 'temp.xlsx'
-            get_data_from_resource(file_name, self.url, params)
-            temp_df = XLSData(file_name, self.data_type).df
-            df = pd.concat([df, temp_df], sort=False, axis=0)
-            df.reset_index(drop=True, inplace=True)
+        with metrics.stage('parse', source='GRTgaz', data_type=self.data_type):
+            if self.parse_cache is None:
+                df = XLSData(file_name, self.data_type).df
+            else:
+                df = self.parse_cache.parse(file_name, lambda file_: XLSData(file_, self.data_type).df,
+                                            parser_version=f'{PARSER_VERSION}:{self.data_type}')
+        metrics.inc('rows_parsed', len(df.index), source='GRTgaz', data_type=self.data_type)
         return df
 
+    def get_data_between(self, start_date: date, end_date: date) -> pd.DataFrame:
+        """
+        function to get data from start date till end date in the DataFrame form
+        (used by incremental runs)
+        """
+        df = self._get_data(start_date, end_date, os.path.join(self.folder, f'window_{self.data_type}.xlsx'))
+        return df.reset_index(drop=True)
 
-if __name__ == '__main__':
-    data_types = ('consumptions', 'commercial_flow', 'physical_flow')
-    data_type = data_types[2]
-    cparser = GRTgazParser(data_type)
-    historical_data = cparser.get_historical_data()
-    # # current_data = cparser.get_current_data()
-    folder = 'parsed_data/'
-    historical_data.to_excel(f'{folder}all_GRTgaz_{data_type}.xlsx', index=False)
-    # # current_date = date.today().strftime('%d.%m.%Y')
-    # # current_data.to_excel(f'{folder}GRTgaz_{data_type}_{current_date}.xlsx')
-
-
+    def get_current_data(self):
+        """
+        function to get data for the past two days in the DataFrame form
+        """
+        df = self._get_data(self.dt_today - timedelta(days=2), self.dt_today,
+                            os.path.join(self.folder, f'current_{self.data_type}.xlsx'))
+        return df.reset_index(drop=True)
 
+    def get_historical_data(self, start_date=date(2015, 4, 1), end_date: date = None,
+                            chunk_size: Chunk_Size = 'year', folder: str = 'checkpoints'):
+        """
+        function to get historical data from start date till end date in the DataFrame form
+        (default from 01.04.2015 till now)
+        data is collected by chunks of chunk_size, finished chunks are saved in folder
+        and are not collected again when the backfill is restarted
+        """
+        end_date = date.today() if end_date is None else end_date
+        backfill = Backfill(name=f'GRTgaz_{self.data_type}', folder=folder, chunk_size=chunk_size)
+        file_name = os.path.join(self.folder, f'temp_{self.data_type}.xlsx')
+        return backfill.run(fetch=lambda chunk_start, chunk_end: self._get_data(chunk_start, chunk_end, file_name),
+                            start_date=start_date,
+                            end_date=end_date)
 
 
+def get_all_types_data(historical: bool = True, data_types: Tuple['Data_Type', ...] = DATA_TYPES,
+                       archive: RawArchive = None, parse_cache: ParseCache = None, base_url: str = None,
+                       **kwargs) -> Mapping['Data_Type', pd.DataFrame]:
+    """
+    function to get data of several data types at once,
+    data types are downloaded and parsed concurrently through one HTTP session
+    (kwargs are passed to get_historical_data)
+    """
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=len(data_types)) as executor:
+        futures = {}
+        for data_type in data_types:
+            parser = GRTgazParser(data_type, session=session, archive=archive, parse_cache=parse_cache,
+                                  base_url=base_url)
+            if historical:
+                futures[data_type] = executor.submit(parser.get_historical_data, **kwargs)
+            else:
+                futures[data_type] = executor.submit(parser.get_current_data)
+        return {data_type: future.result() for data_type, future in futures.items()}
 
 
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='collects GRTgaz data')
+    arg_parser.add_argument('--output-format', choices=get_args(Output_Format), default='parquet',
+                            help='parquet files partitioned by data type and year or one file for every data type')
+    arg_parser.add_argument('--no-parse-cache', action='store_true',
+                            help='parse all files again instead of taking unchanged files from the parse cache')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
 
+    folder = 'parsed_data/'
+    # set offline=True to parse archived files without requests
+    raw_archive = RawArchive(folder=f'{folder}raw_archive', offline=False)
+    parse_cache = None if args.no_parse_cache else ParseCache(folder=f'{folder}parse_cache')
+    all_data = get_all_types_data(archive=raw_archive, parse_cache=parse_cache, folder=f'{folder}checkpoints')
+    # # all_data = get_all_types_data(historical=False, archive=raw_archive)
+    for data_type, historical_data in all_data.items():
+        if args.output_format == 'parquet':
+            write_parsed(historical_data, source='GRTgaz', data_type=data_type, folder=f'{folder}parquet')
+        elif args.output_format == 'csv':
+            historical_data.to_csv(f'{folder}all_GRTgaz_{data_type}.csv', index=False)
+        else:
+            historical_data.to_excel(f'{folder}all_GRTgaz_{data_type}.xlsx', index=False)
+    # # current_date = date.today().strftime('%d.%m.%Y')
+    # # for data_type, current_data in all_data.items():
+    # #     current_data.to_excel(f'{folder}GRTgaz_{data_type}_{current_date}.xlsx')
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Mapping, Tuple
+from profiling import profiler
+
+PROMETHEUS_PREFIX = 'gpe'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _atomic_write(file_name: str, text: str) -> None:
+    """
+    writes text into file_name through a temporary file, so readers never see a half written file
+    """
+    folder = os.path.dirname(file_name)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_file_name = f'{file_name}.{uuid.uuid4().hex}.tmp'
+    with open(temp_file_name, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_file_name, file_name)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    class to count what collectors, parsers and loaders do during the run:
+    wall and CPU time of stages, bytes downloaded, rows parsed, dropped and written,
+    DB round trips and commits, cache hits and misses;
+    all metrics are counters with labels (source, stage and others),
+    labels set by labels() are added to all metrics counted in the same thread
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._local = threading.local()
+        self.started = datetime.now(timezone.utc)
+
+    def _labels(self, labels: Mapping[str, object]) -> Labels:
+        thread_labels = getattr(self._local, 'labels', {})
+        merged = {**thread_labels, **{name: value for name, value in labels.items() if value is not None}}
+        return tuple(sorted((name, str(value)) for name, value in merged.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        adds value to the counter name with labels
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def current_labels(self) -> Mapping[str, object]:
+        """
+        returns labels set by labels() in this thread (to pass them to threads started by it)
+        """
+        return dict(getattr(self._local, 'labels', {}))
+
+    @contextmanager
+    def labels(self, **labels) -> Iterator[None]:
+        """
+        adds labels to all metrics counted in this thread inside the block
+        """
+        old_labels = getattr(self._local, 'labels', {})
+        self._local.labels = {**old_labels, **labels}
+        try:
+            yield
+        finally:
+            self._local.labels = old_labels
+
+    @contextmanager
+    def stage(self, stage: str, **labels) -> Iterator[None]:
+        """
+        counts wall time, CPU time of the thread and calls of the stage inside the block
+        (CPU time of other threads and processes started by the stage is not counted),
+        the block is profiled if the profiler is started
+        """
+        merged = dict(self._labels(labels))
+        name = '.'.join(part for part in (merged.get('source') or merged.get('pipeline'), stage,
+                                          merged.get('data_type')) if part)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            with profiler.stage(name):
+                yield
+        finally:
+            self.inc('stage_wall_seconds', time.perf_counter() - wall_start, stage=stage, **labels)
+            self.inc('stage_cpu_seconds', time.thread_time() - cpu_start, stage=stage, **labels)
+            self.inc('stage_calls', 1, stage=stage, **labels)
+
+    def snapshot(self) -> Mapping[str, list]:
+        """
+        returns all counters: {name: [{'labels': {...}, 'value': value}, ...]}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        result: Dict[str, list] = {}
+        for (name, labels), value in sorted(counters.items()):
+            result.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        return result
+
+    def merge(self, snapshot: Mapping[str, list]) -> None:
+        """
+        adds counters of snapshot() taken in another process (e.g. a worker of a process pool),
+        labels set by labels() in this thread are added to them
+        """
+        for name, values in snapshot.items():
+            for item in values:
+                self.inc(name, item['value'], **item['labels'])
+
+    def value(self, name: str, **labels) -> float:
+        """
+        returns the sum of counters name having all labels
+        """
+        wanted = {(label, str(value)) for label, value in labels.items()}
+        with self._lock:
+            return sum(value for (counter_name, counter_labels), value in self._counters.items()
+                       if counter_name == name and wanted <= set(counter_labels))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+        self.started = datetime.now(timezone.utc)
+
+    def to_json(self, **extra) -> str:
+        return json.dumps({'started': self.started.isoformat(timespec='seconds'),
+                           'written': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                           **extra,
+                           'metrics': self.snapshot()}, indent=1, default=str)
+
+    def to_prometheus(self, prefix: str = PROMETHEUS_PREFIX) -> str:
+        """
+        returns counters in Prometheus text format
+        """
+        lines = []
+        for name, values in self.snapshot().items():
+            metric = f'{prefix}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for item in values:
+                labels = ','.join(f'{label}="{_escape(value)}"' for label, value in item['labels'].items())
+                lines.append(f'{metric}{{{labels}}} {item["value"]}' if labels else f'{metric} {item["value"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, json_file: str = None, prometheus_file: str = None, **extra) -> None:
+        """
+        writes counters into the JSON file and into the Prometheus textfile collector file (*.prom),
+        files are not written if their names are None
+        """
+        if json_file is not None:
+            _atomic_write(json_file, self.to_json(**extra))
+        if prometheus_file is not None:
+            _atomic_write(prometheus_file, self.to_prometheus())
+
+    def instrument_engine(self, engine) -> None:
+        """
+        counts DB round trips (executed statements) and commits of the engine
+        """
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def count_round_trip(conn, cursor, statement, parameters, context, executemany):
+            self.inc('db_round_trips')
+
+        @event.listens_for(engine, 'commit')
+        def count_commit(conn):
+            self.inc('db_commits')
+
+
+# metrics of the run are shared by all sources in one process
+metrics = Metrics()
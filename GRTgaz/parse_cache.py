@@ -0,0 +1,116 @@
+import os
+import glob
+import uuid
+import hashlib
+import pandas as pd
+from typing import Callable, Optional
+from loguru import logger
+from metrics import metrics
+
+# pyarrow is imported only when the cache is read or written
+
+PARSE_CACHE_FOLDER = 'parse_cache'
+MAX_CACHE_SIZE = 2 * 1024 ** 3  # bytes, least recently used frames are deleted above it
+CHUNK_SIZE = 1024 * 1024
+CACHE_FILE_SUFFIX = '.arrow'
+
+
+class ParseCache:
+    """
+    class to keep parsed frames on disk by the hash of the raw file and the parser version,
+    so unchanged files are not parsed again;
+    frames are kept in Arrow IPC files that are read with memory mapping
+    and least recently used frames are deleted when the cache is bigger than max_size
+    """
+    def __init__(self, folder: str = PARSE_CACHE_FOLDER, max_size: int = MAX_CACHE_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+
+    @staticmethod
+    def key(file_name: str, parser_version: str) -> str:
+        """
+        returns the key of the parsed frame: sha256 of the raw file bytes and the parser version
+        """
+        file_hash = hashlib.sha256()
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        file_hash.update(parser_version.encode('utf-8'))
+        return file_hash.hexdigest()
+
+    def _path(self, key: str) -> str:
+        """
+        returns the path of the cached frame
+        """
+        return os.path.join(self.folder, f'{key}{CACHE_FILE_SUFFIX}')
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        returns the cached frame or None if there is no frame for the key
+        """
+        import pyarrow as pa
+        path = self._path(key)
+        try:
+            with pa.memory_map(path, 'r') as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas()
+            # modification time is the last use of the frame for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """
+        saves the frame and deletes least recently used frames if the cache is too big
+        (frames that can not be converted to Arrow are not cached)
+        """
+        import pyarrow as pa
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+            logger.warning(f'Parsed frame is not cached: {error}')
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        temp_path = f'{self._path(key)}.{uuid.uuid4().hex}.tmp'
+        with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        deletes least recently used frames until the cache is not bigger than max_size
+        """
+        files = []
+        for path in glob.glob(os.path.join(self.folder, f'*{CACHE_FILE_SUFFIX}')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def parse(self, file_name: str, parse: Callable[[str], pd.DataFrame], parser_version: str) -> pd.DataFrame:
+        """
+        returns the frame parsed from file_name with parse(file_name),
+        the file is parsed only if it or parser_version is changed since the last parsing
+        """
+        key = self.key(file_name, parser_version)
+        parser = parser_version.split('/')[0]
+        df = self.get(key)
+        if df is not None:
+            metrics.inc('parse_cache_hits', parser=parser)
+            logger.info(f'Took parsed {file_name} from cache')
+            return df
+        metrics.inc('parse_cache_misses', parser=parser)
+        df = parse(file_name)
+        self.put(key, df)
+        return df
@@ -0,0 +1,123 @@
+import os
+import pandas as pd
+from datetime import date
+from typing import Iterator, List, Literal, Optional
+from pipeline import BATCH_SIZE
+
+# pyarrow is imported only when parquet data is written or read
+
+Output_Format = Literal['excel', 'csv', 'parquet']
+
+PARSED_DATA_FOLDER = 'parsed_data/parquet'
+DATE_COLUMN = 'date'
+PARTITION_COLUMNS = ('source', 'data_type', 'year')
+
+
+def _partition_folder(folder: str, source: str, data_type: str) -> str:
+    """
+    returns the folder with all years of the source and data type
+    """
+    return os.path.join(folder, f'source={source}', f'data_type={data_type}')
+
+
+def _year_partitioning():
+    """
+    returns hive partitioning of the data type folder by years
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([('year', pa.int32())]), flavor='hive')
+
+
+def to_typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    returns the copy of df with datetime date column, numeric columns
+    and all other text columns as categories
+    """
+    df = df.infer_objects()
+    df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN]).astype('datetime64[ns]')
+    for column in df.columns:
+        if column != DATE_COLUMN and (pd.api.types.is_object_dtype(df[column])
+                                      or pd.api.types.is_string_dtype(df[column])):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def _scan(source: str, data_type: str, start_date: date = None, end_date: date = None,
+          folder: str = PARSED_DATA_FOLDER):
+    """
+    returns the dataset of the source and data type and the filter of dates from start_date till end_date
+    (dataset is None if nothing is written yet)
+    """
+    import pyarrow.dataset as ds
+    path = _partition_folder(folder, source, data_type)
+    if not os.path.isdir(path):
+        return None, None
+    dataset = ds.dataset(path, format='parquet', partitioning=_year_partitioning())
+    condition = None
+    if start_date is not None:
+        condition = (ds.field('year') >= start_date.year) & (ds.field(DATE_COLUMN) >= pd.Timestamp(start_date))
+    if end_date is not None:
+        end_condition = (ds.field('year') <= end_date.year) & (ds.field(DATE_COLUMN) <= pd.Timestamp(end_date))
+        condition = end_condition if condition is None else condition & end_condition
+    return dataset, condition
+
+
+def read_parsed(source: str, data_type: str, columns: Optional[List[str]] = None,
+                start_date: date = None, end_date: date = None,
+                folder: str = PARSED_DATA_FOLDER) -> pd.DataFrame:
+    """
+    reads parsed data of the source and data type from parquet files,
+    only columns are read (all columns if it is None)
+    and only files and row groups with dates from start_date till end_date
+    """
+    dataset, condition = _scan(source, data_type, start_date=start_date, end_date=end_date, folder=folder)
+    if dataset is None:
+        return pd.DataFrame(columns=columns)
+    df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    return df.drop(columns='year', errors='ignore') if columns is None else df
+
+
+def iter_parsed(source: str, data_type: str, columns: Optional[List[str]] = None,
+                start_date: date = None, end_date: date = None, folder: str = PARSED_DATA_FOLDER,
+                batch_size: int = BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    reads parsed data as read_parsed, but yields it by batches of at most batch_size rows,
+    so all the data does not have to be in memory at once
+    """
+    dataset, condition = _scan(source, data_type, start_date=start_date, end_date=end_date, folder=folder)
+    if dataset is None:
+        return
+    for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=batch_size):
+        if batch.num_rows == 0:
+            continue
+        df = batch.to_pandas()
+        yield df.drop(columns='year', errors='ignore') if columns is None else df
+
+
+def write_parsed(df: pd.DataFrame, source: str, data_type: str, folder: str = PARSED_DATA_FOLDER) -> None:
+    """
+    writes parsed data into parquet files partitioned by source, data type and year,
+    already written data of the same dates is replaced, data of other dates in the same years is kept
+    (columns source, data_type and year are taken by partitions and are not saved)
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    if df.empty:
+        return
+    df = to_typed_frame(df.drop(columns=list(PARTITION_COLUMNS), errors='ignore'))
+    start_date, end_date = df[DATE_COLUMN].min(), df[DATE_COLUMN].max()
+    # years are rewritten as a whole, so rows of other dates in these years are written again
+    old_df = read_parsed(source, data_type, start_date=date(start_date.year, 1, 1),
+                         end_date=date(end_date.year, 12, 31), folder=folder)
+    if not old_df.empty:
+        old_df = old_df.loc[~old_df[DATE_COLUMN].between(start_date, end_date)]
+        df = to_typed_frame(pd.concat([old_df, df], sort=False, axis=0, ignore_index=True))
+    df['year'] = df[DATE_COLUMN].dt.year.astype('int32')
+    df.sort_values(DATE_COLUMN, inplace=True, kind='stable')
+    ds.write_dataset(pa.Table.from_pandas(df, preserve_index=False),
+                     _partition_folder(folder, source, data_type),
+                     format='parquet',
+                     partitioning=_year_partitioning(),
+                     existing_data_behavior='delete_matching',
+                     basename_template='part-{i}.parquet')
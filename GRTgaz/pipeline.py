@@ -0,0 +1,118 @@
+import queue
+import threading
+import pandas as pd
+from typing import Any, Callable, Iterable, Iterator, List, Sequence
+from loguru import logger
+from metrics import metrics
+
+BATCH_SIZE = 10_000  # rows in one batch
+QUEUE_SIZE = 4  # batches waiting between two stages
+POLL_INTERVAL = 0.5  # seconds between checks if another stage has failed
+
+# put into the queue after the last batch
+_DONE = object()
+
+
+def iter_batches(df: pd.DataFrame, batch_size: int = BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    yields df by batches of batch_size rows
+    """
+    for start in range(0, len(df.index), batch_size):
+        yield df.iloc[start:start + batch_size].copy()
+
+
+class Pipeline:
+    """
+    class to pass batches through stages connected by bounded queues,
+    every stage works in its own thread, so stages work at the same time
+    and the pipeline works with the speed of its slowest stage;
+    a stage waits when the queue to the next stage is full,
+    so only a few batches are kept in memory at once
+    """
+    def __init__(self, stages: Sequence[Callable[[Any], Any]], queue_size: int = QUEUE_SIZE,
+                 on_stage_exit: Callable[[], None] = None, name: str = 'pipeline'):
+        """
+        stages: functions called with the result of the previous stage (the first one with the batch),
+        the result of the last stage is not used
+        on_stage_exit: called in the thread of every stage when the stage is finished
+        (for example to return the DB session of the thread to the pool)
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_stage_exit = on_stage_exit
+        self.name = name
+
+    def run(self, batches: Iterable) -> int:
+        """
+        passes all batches through the stages and returns the number of batches passed,
+        the first error of any stage stops all stages and is raised
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        passed = [0]
+        # metrics of the stages get labels of the calling thread (for example the source of the job)
+        labels = metrics.current_labels()
+
+        def fail(error: BaseException) -> None:
+            errors.append(error)
+            stop.set()
+
+        def put(queue_: queue.Queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    queue_.put(item, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(queue_: queue.Queue):
+            while not stop.is_set():
+                try:
+                    return queue_.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def work(stage: Callable[[Any], Any], in_queue: queue.Queue, out_queue: queue.Queue = None) -> None:
+            stage_name = getattr(stage, '__name__', 'stage')
+            try:
+                with metrics.labels(**labels):
+                    while (batch := get(in_queue)) is not _DONE:
+                        with metrics.stage(stage_name, pipeline=self.name):
+                            result = stage(batch)
+                        if out_queue is None:
+                            passed[0] += 1
+                        elif not put(out_queue, result):
+                            return
+                if out_queue is not None:
+                    put(out_queue, _DONE)
+            # SystemExit of a stage is raised in the calling thread too
+            except BaseException as error:
+                fail(error)
+            finally:
+                if self.on_stage_exit is not None:
+                    self.on_stage_exit()
+
+        out_queues = queues[1:] + [None]
+        threads = [threading.Thread(target=work, args=(stage, in_queue, out_queue),
+                                    name=f'{self.name}-{getattr(stage, "__name__", index)}', daemon=True)
+                   for index, (stage, in_queue, out_queue) in enumerate(zip(self.stages, queues, out_queues))]
+        for thread in threads:
+            thread.start()
+        # batches are read in the calling thread
+        try:
+            for batch in batches:
+                if not put(queues[0], batch):
+                    break
+            else:
+                put(queues[0], _DONE)
+        except BaseException as error:
+            fail(error)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        logger.info(f'{self.name}: {passed[0]} batches passed')
+        return passed[0]
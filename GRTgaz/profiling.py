@@ -0,0 +1,196 @@
+import os
+import re
+import sys
+import time
+import atexit
+import pstats
+import argparse
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+from loguru import logger
+
+PROFILES_FOLDER = 'profiles'
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples of running stages
+TOP_FUNCTIONS = 40  # functions in the text report of a stage
+TOP_ALLOCATIONS = 30  # lines in the allocation report of a stage
+
+_unsafe = re.compile(r'[^\w.-]+')
+
+
+def _file_name(name: str) -> str:
+    return _unsafe.sub('_', name).strip('_') or 'stage'
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_qualname}'
+
+
+class Profiler:
+    """
+    class to profile stages of the run (stages counted by metrics: download, parse, loader stages):
+    cProfile of every stage (.pstats and a text report), stacks sampled every SAMPLE_INTERVAL
+    in collapsed format for flamegraph.pl or speedscope (.collapsed)
+    and memory allocated by the stage from tracemalloc snapshots (.allocations.txt);
+    calls of the same stage in all threads are added together,
+    a stage inside another stage of the same thread is profiled as part of the outer stage;
+    profiles are written to the run folder when the profiler is stopped
+    """
+    def __init__(self):
+        self.enabled = False
+        self.run_folder: Optional[str] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles: Dict[Tuple[str, int], cProfile.Profile] = {}
+        self._stacks: Dict[str, Counter] = {}
+        self._allocations: Dict[str, Counter] = {}
+        self._wall_seconds: Counter = Counter()
+        self._calls: Counter = Counter()
+        # stages running now by thread id, stacks of these threads are sampled
+        self._running: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self, run_folder: str = None) -> str:
+        """
+        starts profiling of stages, profiles are written into run_folder (profiles/<time> by default)
+        when stop() is called or the process exits
+        """
+        if self.enabled:
+            return self.run_folder
+        self.run_folder = run_folder or os.path.join(PROFILES_FOLDER, f'{datetime.now():%Y%m%d_%H%M%S}')
+        os.makedirs(self.run_folder, exist_ok=True)
+        tracemalloc.start()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+        self.enabled = True
+        atexit.register(self.stop)
+        logger.info(f'Profiles of stages will be written into {self.run_folder}')
+        return self.run_folder
+
+    def stop(self) -> None:
+        """
+        stops profiling and writes profiles of all stages into the run folder
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._sampler.join()
+        tracemalloc.stop()
+        self.write()
+        atexit.unregister(self.stop)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            with self._lock:
+                running = dict(self._running)
+            if not running:
+                continue
+            frames = sys._current_frames()
+            for thread_id, name in running.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self._stacks.setdefault(name, Counter())[';'.join(reversed(stack))] += 1
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        profiles the block as the stage name if the profiler is started
+        """
+        if not self.enabled or getattr(self._local, 'stage', None) is not None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        self._local.stage = name
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            profile = self._profiles.setdefault((name, thread_id), cProfile.Profile())
+            self._running[thread_id] = name
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._running.pop(thread_id, None)
+            # memory allocated by other threads at the same time is counted too
+            allocations = []
+            if tracemalloc.is_tracing():
+                allocations = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+            self._local.stage = None
+            with self._lock:
+                self._wall_seconds[name] += seconds
+                self._calls[name] += 1
+                counter = self._allocations.setdefault(name, Counter())
+                for statistic in allocations:
+                    if statistic.size_diff > 0:
+                        counter[str(statistic.traceback)] += statistic.size_diff
+
+    def write(self) -> None:
+        """
+        writes .pstats, text report, collapsed stacks and allocations of every stage
+        and summary.txt with wall time of all stages
+        """
+        with self._lock:
+            profiles = dict(self._profiles)
+            names = sorted(self._calls)
+        for name in names:
+            path = os.path.join(self.run_folder, _file_name(name))
+            stats = None
+            for (profile_name, _), profile in profiles.items():
+                if profile_name != name:
+                    continue
+                try:
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                # a profile which was never enabled has no stats
+                except TypeError:
+                    continue
+            if stats is not None:
+                stats.dump_stats(f'{path}.pstats')
+                with open(f'{path}.txt', 'w', encoding='utf-8') as f:
+                    pstats.Stats(f'{path}.pstats', stream=f).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            with open(f'{path}.collapsed', 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self._stacks.get(name, Counter()).items()):
+                    f.write(f'{stack} {count}\n')
+            with open(f'{path}.allocations.txt', 'w', encoding='utf-8') as f:
+                for line, size in self._allocations.get(name, Counter()).most_common(TOP_ALLOCATIONS):
+                    f.write(f'{size / 1024:12.1f} KiB  {line}\n')
+        with open(os.path.join(self.run_folder, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(f'{"stage":<60} {"calls":>7} {"seconds":>10}\n')
+            for name in sorted(names, key=lambda name: -self._wall_seconds[name]):
+                f.write(f'{name:<60} {self._calls[name]:>7} {self._wall_seconds[name]:>10.2f}\n')
+        logger.info(f'Profiles of {len(names)} stages are written into {self.run_folder}')
+
+
+def add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    """
+    adds --profile [RUN_FOLDER] to the arguments of the entry point
+    """
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='RUN_FOLDER',
+                        help='write CPU profiles, sampled stacks and allocations of every stage '
+                             f'into RUN_FOLDER (default {PROFILES_FOLDER}/<time>)')
+
+
+def start_profiling(run_folder: Optional[str]) -> None:
+    """
+    starts the profiler if --profile was set (run_folder is not None)
+    """
+    if run_folder is not None:
+        profiler.start(run_folder or None)
+
+
+# stages of all sources are profiled by one profiler in one process
+profiler = Profiler()
@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple
+from loguru import logger
+
+# sqlalchemy is imported only when the stats are attached to the engine
+
+REPEAT_THRESHOLD = 1000  # statements executed more times in a run are reported as N+1 suspects
+MAX_SAMPLES = 10_000  # durations kept for p95 of one statement, a random sample is kept above it
+EXPLAIN_TOP = 5
+# only frames of these files are taken as callers, frames of libraries are skipped
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOADER_FILE_SUFFIX = '_loader.py'
+# set in connection.info to skip statements of the stats themselves (EXPLAIN)
+_SKIP = 'query_stats_skip'
+_STARTS = 'query_stats_starts'
+
+_comments = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_strings = re.compile(r"'(?:[^']|'')*'")
+_numbers = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.I)
+_params = re.compile(r'%\(\w+\)s|%s|\?|:\w+|\$\d+')
+_lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_values = re.compile(r'(VALUES\s*\(\?\))(?:\s*,\s*\(\?\))+', re.I)
+_spaces = re.compile(r'\s+')
+
+
+def normalise(statement: str) -> str:
+    """
+    returns the statement without literals, parameters and whitespace differences,
+    so the same query with other values has the same text
+    """
+    statement = _comments.sub(' ', statement)
+    statement = _strings.sub('?', statement)
+    statement = _params.sub('?', statement)
+    statement = _numbers.sub('?', statement)
+    statement = _lists.sub('(?)', statement)
+    statement = _values.sub(r'\1', statement)
+    return _spaces.sub(' ', statement).strip()
+
+
+@lru_cache(maxsize=None)
+def _repo_module(file_name: str) -> Optional[str]:
+    """
+    returns the name of the module if the file is code of the repo (not a library and not this module)
+    """
+    file_name = os.path.abspath(file_name)
+    if not file_name.startswith(ROOT) or 'site-packages' in file_name or file_name == os.path.abspath(__file__):
+        return None
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+def _caller() -> str:
+    """
+    returns the loader method which caused the statement and the function of the repo which sent it,
+    for example 'grtgaz_loader:GRTgazLoader.resolve_ids > table_classes:FlowCurves.search_data'
+    (lambdas and comprehensions are skipped, the function they are defined in is taken)
+    """
+    frame = sys._getframe(2)
+    site = loader = None
+    while frame is not None:
+        module = _repo_module(frame.f_code.co_filename)
+        if module is not None and not frame.f_code.co_name.startswith('<'):
+            name = f'{module}:{frame.f_code.co_qualname}'
+            if site is None:
+                site = name
+            if frame.f_code.co_filename.endswith(LOADER_FILE_SUFFIX):
+                loader = name
+                break
+        frame = frame.f_back
+    if site is None:
+        return '<unknown>'
+    if loader is None or loader == site:
+        return site
+    return f'{loader} > {site}'
+
+
+def _p95(durations: List[float]) -> float:
+    if not durations:
+        return 0.0
+    durations = sorted(durations)
+    return durations[min(len(durations) - 1, int(0.95 * len(durations)))]
+
+
+@dataclass
+class StatementStats:
+    # normalised statement or calling loader method
+    name: str
+    count: int = 0
+    total_seconds: float = 0.0
+    samples: List[float] = field(default_factory=list)
+    # executions by callers of the statement or by statements of the caller
+    parts: Dict[str, int] = field(default_factory=dict)
+    # one real statement with parameters, it is explained for the top offenders
+    example: Optional[Tuple[str, object]] = None
+    executemany: bool = False
+
+    def add(self, seconds: float, part: str) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.parts[part] = self.parts.get(part, 0) + 1
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            index = random.randrange(self.count)
+            if index < MAX_SAMPLES:
+                self.samples[index] = seconds
+
+    def to_dict(self, name: str = 'statement', parts: str = 'callers') -> Mapping[str, object]:
+        return {name: self.name, 'count': self.count,
+                'total_seconds': round(self.total_seconds, 6),
+                'mean_ms': round(1000 * self.total_seconds / self.count, 3) if self.count else 0.0,
+                'p95_ms': round(1000 * _p95(self.samples), 3),
+                parts: dict(sorted(self.parts.items(), key=lambda item: -item[1]))}
+
+
+class QueryStats:
+    """
+    class to count statements sent to the database by the loaders:
+    count, total and p95 time for every normalised statement and for every calling loader method;
+    statements executed more than threshold times are reported as N+1 suspects
+    (a query in a loop which should be one query for the whole batch);
+    it is attached to the engine only when it is asked for, it walks the stack on every statement
+    """
+    def __init__(self, threshold: int = REPEAT_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._statements: Dict[str, StatementStats] = {}
+        self._callers: Dict[str, StatementStats] = {}
+        self._engine = None
+        self.explained: Dict[str, str] = {}
+
+    def attach(self, engine) -> None:
+        """
+        starts counting statements of the engine
+        """
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engine = engine
+
+    def detach(self) -> None:
+        """
+        stops counting statements
+        """
+        from sqlalchemy import event
+        if self._engine is not None:
+            event.remove(self._engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(self._engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engine = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not conn.info.get(_SKIP):
+            conn.info.setdefault(_STARTS, []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get(_SKIP) or not conn.info.get(_STARTS):
+            return
+        seconds = time.perf_counter() - conn.info[_STARTS].pop()
+        caller = _caller()
+        normalised = normalise(statement)
+        with self._lock:
+            stats = self._statements.get(normalised)
+            if stats is None:
+                stats = self._statements[normalised] = StatementStats(normalised, example=(statement, parameters),
+                                                                      executemany=executemany)
+            stats.add(seconds, caller)
+            caller_stats = self._callers.get(caller)
+            if caller_stats is None:
+                caller_stats = self._callers[caller] = StatementStats(caller)
+            caller_stats.add(seconds, normalised)
+
+    def statements(self) -> List[StatementStats]:
+        """
+        returns stats of statements, the longest in total first
+        """
+        with self._lock:
+            return sorted(self._statements.values(), key=lambda stats: -stats.total_seconds)
+
+    def callers(self) -> List[StatementStats]:
+        """
+        returns stats of calling loader methods, the longest in total first
+        """
+        with self._lock:
+            return sorted(self._callers.values(), key=lambda stats: -stats.total_seconds)
+
+    def offenders(self) -> List[StatementStats]:
+        """
+        returns statements executed more than threshold times, the most frequent first
+        """
+        return sorted((stats for stats in self.statements() if stats.count > self.threshold),
+                      key=lambda stats: -stats.count)
+
+    def explain(self, top: int = EXPLAIN_TOP) -> Mapping[str, str]:
+        """
+        returns plans of the top offenders (or of the longest statements if there are no offenders)
+        by EXPLAIN (ANALYZE, BUFFERS) of their example statements;
+        the statement is really executed by ANALYZE, so it is run in a transaction which is rolled back;
+        works only for PostgreSQL, statements executed by executemany are not explained
+        """
+        if self._engine is None or self._engine.dialect.name != 'postgresql':
+            logger.warning('Plans are only explained for PostgreSQL')
+            return {}
+        candidates = self.offenders() or self.statements()
+        for stats in [stats for stats in candidates if not stats.executemany][:top]:
+            statement, parameters = stats.example
+            with self._engine.connect() as connection:
+                connection.info[_SKIP] = True
+                transaction = connection.begin()
+                try:
+                    rows = connection.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                    self.explained[stats.name] = '\n'.join(row[0] for row in rows)
+                except Exception as error:
+                    logger.warning(f'Plan of {stats.name!r} was not explained: {error}')
+                finally:
+                    transaction.rollback()
+                    connection.info.pop(_SKIP, None)
+        return self.explained
+
+    def report(self) -> Mapping[str, object]:
+        statements = self.statements()
+        return {'threshold': self.threshold,
+                'statements_executed': sum(stats.count for stats in statements),
+                'seconds_in_database': round(sum(stats.total_seconds for stats in statements), 6),
+                'offenders': [stats.name for stats in self.offenders()],
+                'statements': [stats.to_dict() for stats in statements],
+                'callers': [stats.to_dict(name='caller', parts='statements') for stats in self.callers()],
+                'explained': self.explained}
+
+    def log_offenders(self) -> None:
+        for stats in self.offenders():
+            callers = ', '.join(f'{caller} ({count})' for caller, count in stats.to_dict()['callers'].items())
+            logger.warning(f'Statement executed {stats.count} times (p95 {1000 * _p95(stats.samples):.1f} ms, '
+                           f'{stats.total_seconds:.1f} s in total) by {callers}: {stats.name[:200]}')
+
+    def write(self, file_name: str) -> None:
+        """
+        writes the report into the JSON file
+        """
+        folder = os.path.dirname(file_name)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=1, default=str)
@@ -0,0 +1,147 @@
+import os
+import gzip
+import json
+import uuid
+import shutil
+import hashlib
+import requests
+from datetime import date, datetime
+from typing import Literal, Mapping, Optional
+
+ARCHIVE_FOLDER = 'raw_archive'
+COMPRESS_LEVEL = 6
+CHUNK_SIZE = 64 * 1024
+
+Fetch_Result = Literal['archive', 'not_modified', 'downloaded']
+
+
+class ArchiveMiss(Exception):
+    """Raises if archive is offline and there is no file for the request"""
+    ...
+
+
+def is_closed_period(end_date: date, today: date = None) -> bool:
+    """
+    checks if data for the period ending with end_date can not change anymore:
+    the year of end_date is over
+    """
+    today = date.today() if today is None else today
+    return end_date.year < today.year
+
+
+class RawArchive:
+    """
+    class to keep downloaded files compressed on disk by url and request parameters,
+    archived files are refreshed with conditional requests (If-None-Match / If-Modified-Since)
+    and files of closed periods are taken from archive without any request;
+    in offline mode all files are taken from archive
+    """
+    def __init__(self, folder: str = ARCHIVE_FOLDER, offline: bool = False):
+        self.folder = folder
+        self.offline = offline
+
+    @staticmethod
+    def key(url: str, params: Optional[Mapping] = None) -> str:
+        """
+        returns the key of the request
+        """
+        request = json.dumps({'url': url, 'params': dict(params or {})}, sort_keys=True, default=str)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        """
+        returns the path of the archived file without extension
+        """
+        return os.path.join(self.folder, key[:2], key)
+
+    def has(self, key: str) -> bool:
+        """
+        checks if there is the archived file for the key
+        """
+        return os.path.exists(f'{self._path(key)}.gz') and os.path.exists(f'{self._path(key)}.json')
+
+    def meta(self, key: str) -> Mapping:
+        """
+        returns url, parameters and response headers of the archived file
+        """
+        with open(f'{self._path(key)}.json') as f:
+            return json.load(f)
+
+    def conditional_headers(self, key: str) -> Mapping[str, str]:
+        """
+        returns headers to ask the server to send the file only if it is changed
+        """
+        if not self.has(key):
+            return {}
+        meta = self.meta(key)
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def restore(self, key: str, file_name: str) -> None:
+        """
+        writes the archived file into file_name
+        """
+        temp_file_name = f'{file_name}.{uuid.uuid4().hex}.tmp'
+        with gzip.open(f'{self._path(key)}.gz', 'rb') as archived, open(temp_file_name, 'wb') as f:
+            shutil.copyfileobj(archived, f, CHUNK_SIZE)
+        os.replace(temp_file_name, file_name)
+
+    def store(self, key: str, file_name: str, url: str, params: Optional[Mapping] = None,
+              headers: Optional[Mapping[str, str]] = None) -> None:
+        """
+        puts the downloaded file_name into archive with its response headers
+        """
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        suffix = uuid.uuid4().hex
+        with open(file_name, 'rb') as f, gzip.open(f'{path}.gz.{suffix}', 'wb', compresslevel=COMPRESS_LEVEL) as archived:
+            shutil.copyfileobj(f, archived, CHUNK_SIZE)
+        with open(f'{path}.json.{suffix}', 'w') as f:
+            json.dump({
+                'url': url,
+                'params': dict(params or {}),
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'fetched_at': datetime.now().isoformat(timespec='seconds')
+            }, f, indent=2, default=str)
+        os.replace(f'{path}.gz.{suffix}', f'{path}.gz')
+        os.replace(f'{path}.json.{suffix}', f'{path}.json')
+
+    def fetch(self, url: str, file_name: str, params: Optional[Mapping] = None,
+              session: requests.Session = None, immutable: bool = False, timeout: float = None) -> Fetch_Result:
+        """
+        saves the file from url with params into file_name and returns where it is taken from:
+        'archive' - file is not requested because it is immutable or archive is offline,
+        'not_modified' - server answered that archived file is not changed,
+        'downloaded' - file is downloaded and archived
+        """
+        key = self.key(url, params)
+        if self.has(key) and (immutable or self.offline):
+            self.restore(key, file_name)
+            return 'archive'
+        if self.offline:
+            raise ArchiveMiss(f'there is no archived file for {url} with params {params}')
+
+        temp_file_name = f'{file_name}.{uuid.uuid4().hex}.part'
+        with (session or requests).get(url, params=params, headers=self.conditional_headers(key),
+                                       stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                self.restore(key, file_name)
+                return 'not_modified'
+            response.raise_for_status()
+            try:
+                with open(temp_file_name, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+            except BaseException:
+                os.unlink(temp_file_name)
+                raise
+            response_headers = response.headers
+        os.replace(temp_file_name, file_name)
+        self.store(key, file_name, url=url, params=params, headers=response_headers)
+        return 'downloaded'
@@ -0,0 +1,69 @@
+import os
+import json
+import uuid
+import pickle
+import hashlib
+from typing import Iterable, Optional
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.engine import Engine
+from loguru import logger
+
+SCHEMA_CACHE_FOLDER_ENV_VAR = 'SCHEMA_CACHE_FOLDER'
+SCHEMA = 'public'
+
+_FINGERPRINT_QUERY = text(
+    "SELECT table_name, column_name, data_type, is_nullable, column_default "
+    "FROM information_schema.columns "
+    "WHERE table_schema = :schema "
+    "ORDER BY table_name, ordinal_position"
+)
+
+
+def schema_fingerprint(engine: Engine, tables: Optional[Iterable[str]] = None) -> str:
+    """Returns fingerprint of the database schema and the reflected tables.
+
+    Columns of all tables are used, so the fingerprint changes also when tables
+    referenced by foreign keys of the reflected tables are changed.
+    """
+    with engine.connect() as connection:
+        columns = [list(row) for row in connection.execute(_FINGERPRINT_QUERY, {'schema': SCHEMA})]
+    schema = json.dumps({
+        'url': engine.url.render_as_string(hide_password=True),
+        'tables': None if tables is None else sorted(tables),
+        'columns': columns
+    }, default=str)
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+
+def reflect_metadata(engine: Engine, tables: Optional[Iterable[str]] = None,
+                     cache_folder: Optional[str] = None) -> MetaData:
+    """Returns `MetaData` with reflected tables (all tables if `tables` is None).
+
+    If `cache_folder` is set (default is environmental variable `SCHEMA_CACHE_FOLDER`),
+    reflected `MetaData` is pickled there and is taken from the cache while the schema
+    fingerprint is the same.
+    """
+    tables = None if tables is None else sorted(set(tables))
+    cache_folder = os.environ.get(SCHEMA_CACHE_FOLDER_ENV_VAR) if cache_folder is None else cache_folder
+    if not cache_folder:
+        metadata = MetaData()
+        metadata.reflect(bind=engine, only=tables)
+        return metadata
+
+    cache_file = os.path.join(cache_folder, f'{schema_fingerprint(engine, tables)}.pkl')
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            metadata = pickle.load(f)
+        logger.info("Took schema of {count} tables from cache".format(count=len(metadata.tables)))
+        return metadata
+
+    metadata = MetaData()
+    metadata.reflect(bind=engine, only=tables)
+    os.makedirs(cache_folder, exist_ok=True)
+    temp_file = f'{cache_file}.{uuid.uuid4().hex}.tmp'
+    with open(temp_file, 'wb') as f:
+        pickle.dump(metadata, f)
+    os.replace(temp_file, cache_file)
+    logger.info("Cached schema of {count} tables".format(count=len(metadata.tables)))
+    return metadata
@@ -1,17 +1,28 @@
-from connection import engine, base, session
+from connection import get_engine, get_base, get_session
 from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 import numpy as np
 
+# only these tables are reflected from the database by the flow loaders
+TABLES = ('units_dict', 'delivery_point_dict', 'delivery_point_types_dict', 'country_dict',
+          'source_dict', 'flow_types', 'sector_dict', 'flow_curves', 'curves_dict', 'curves')
+
+
+def get_table(table_name: str):
+    """
+    returns the class of the table, the schema is reflected on first use
+    """
+    return get_base(TABLES).classes[table_name]
+
 
 class FlowCurves:
     def __init__(self):
         # flow_curves
-        self._flow_curves = base.classes.flow_curves
+        self._flow_curves = get_table('flow_curves')
 
     def search_data(self, id_source: int, id_point: int, id_unit: int, from_country: int,
                         to_country: int, from_company: int, to_company: int, id_type: int, curve_name: str):
-        search_record = session.query(
+        search_record = get_session().query(
             self._flow_curves.id).filter(
             self._flow_curves.id_source == id_source,
             self._flow_curves.id_point == id_point,
@@ -50,7 +61,7 @@ class FlowCurves:
 
     def insert_new_data(self, id_source: int, id_point: int, id_unit: int, from_country: int,
                         to_country: int, from_company: int, to_company: int, id_type: int, curve_name: str):
-        insert_statement = insert(self._flow_curves, bind=engine).values(
+        insert_statement = insert(self._flow_curves, bind=get_engine()).values(
             id_source=id_source,
             id_point=id_point,
             id_unit=id_unit,
@@ -67,18 +78,18 @@ class FlowCurves:
             index_elements=['id'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
 
 
 class CurvesDict:
     def __init__(self):
         # curves_dict
-        self._curves_dict_table = base.classes.curves_dict
+        self._curves_dict_table = get_table('curves_dict')
 
     def search_data(self, id_sector: int, id_flow_curves: int):
-        search_record = session.query(
+        search_record = get_session().query(
             self._curves_dict_table.id).filter(
             self._curves_dict_table.id_sector == id_sector,
             self._curves_dict_table.id_flow_curves == id_flow_curves).all()
@@ -95,7 +106,7 @@ class CurvesDict:
                                  f'\nid_flow_curves = {id_flow_curves}')
 
     def insert_new_data(self, id_sector, id_flow_curves: int):
-        insert_statement = insert(self._curves_dict_table, bind=engine).values(
+        insert_statement = insert(self._curves_dict_table, bind=get_engine()).values(
             id_sector=id_sector,
             id_flow_curves=id_flow_curves,
             update_time=datetime.today()
@@ -105,18 +116,18 @@ class CurvesDict:
             index_elements=['id'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
 
 
 class Curves:
     def __init__(self):
         # curves
-        self._curves_table = base.classes.curves
+        self._curves_table = get_table('curves')
 
     def insert_new_data(self, id_curve, date: datetime, value: np.float64):
-        insert_statement = insert(self._curves_table, bind=engine).values(
+        insert_statement = insert(self._curves_table, bind=get_engine()).values(
             id_curve=id_curve,
             date=date,
             value=value,
@@ -128,6 +139,6 @@ class Curves:
             set_={'value': insert_statement.excluded.value,
                   'update_time': insert_statement.excluded.update_time},
         )
-        session.execute(update_statement)
-        session.commit()
+        get_session().execute(update_statement)
+        get_session().commit()
 
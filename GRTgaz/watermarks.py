@@ -0,0 +1,90 @@
+import os
+import json
+import threading
+import pandas as pd
+from datetime import date, timedelta
+from typing import Callable, Mapping, Optional, Tuple
+
+WATERMARKS_FILE = 'watermarks.json'
+OVERLAP_DAYS = 2  # days before the watermark that are collected again, sources revise the last days
+
+
+class WatermarkStore:
+    """
+    class to keep the last successfully loaded gas day of every source and data type in a local state file,
+    incremental runs collect data from the watermark minus overlap till today,
+    so a missed run is caught up by the next one
+    """
+    def __init__(self, file_name: str = WATERMARKS_FILE):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._watermarks = self._read()
+
+    def _read(self) -> Mapping[str, Mapping[str, str]]:
+        """
+        reads watermarks from the state file
+        """
+        if not os.path.exists(self.file_name):
+            return {}
+        with open(self.file_name) as f:
+            return json.load(f)
+
+    def _write(self) -> None:
+        """
+        rewrites the state file, the old file is replaced only when the new one is written
+        """
+        folder = os.path.dirname(self.file_name)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_file = f'{self.file_name}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(self._watermarks, f, indent=2, sort_keys=True)
+        os.replace(temp_file, self.file_name)
+
+    def get(self, source: str, data_type: str) -> Optional[date]:
+        """
+        returns the last loaded gas day or None if data was never loaded
+        """
+        watermark = self._watermarks.get(source, {}).get(data_type)
+        return None if watermark is None else date.fromisoformat(watermark)
+
+    def set(self, source: str, data_type: str, gas_day: date) -> None:
+        """
+        saves the last loaded gas day, the watermark is never moved back
+        """
+        with self._lock:
+            watermark = self.get(source, data_type)
+            if watermark is not None and watermark >= gas_day:
+                return
+            self._watermarks.setdefault(source, {})[data_type] = gas_day.isoformat()
+            self._write()
+
+    def window(self, source: str, data_type: str, default_start: date, overlap: int = OVERLAP_DAYS,
+               today: date = None) -> Tuple[date, date]:
+        """
+        returns the date range to collect: from the watermark minus overlap days till today
+        (from default_start if there is no watermark)
+        """
+        today = date.today() if today is None else today
+        watermark = self.get(source, data_type)
+        start_date = default_start if watermark is None else min(watermark - timedelta(days=overlap), today)
+        return start_date, today
+
+    def run(self, source: str, data_type: str, fetch: Callable[[date, date], pd.DataFrame],
+            load: Callable[[pd.DataFrame], object], default_start: date, overlap: int = OVERLAP_DAYS,
+            today: date = None) -> Optional[date]:
+        """
+        collects data of the incremental window with fetch(start, end), loads it with load(df)
+        and moves the watermark to the last gas day of the data only after load returns,
+        returns the new watermark
+        """
+        start_date, end_date = self.window(source, data_type, default_start=default_start, overlap=overlap,
+                                           today=today)
+        print(f'Collecting {source} {data_type} data from {start_date} till {end_date}...')
+        df = fetch(start_date, end_date)
+        if df.empty:
+            print(f'There is no new {source} {data_type} data')
+            return self.get(source, data_type)
+        load(df)
+        self.set(source, data_type, pd.Timestamp(df['date'].max()).date())
+        return self.get(source, data_type)
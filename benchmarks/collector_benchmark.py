@@ -0,0 +1,219 @@
+"""
+benchmark of the collectors against the local fixture server (benchmarks/fixture_server.py), without the real sites:
+
+    python benchmarks/collector_benchmark.py --concurrency 1,2,4,8 --latency 0.2 --bandwidth 1000000 --failure-rate 0.05
+
+GRTgaz exports of all data types (by monthly chunks, downloaded by concurrency threads through one session),
+National Grid files of all years (concurrency downloads at once, parsed by concurrency processes)
+and GRTgaz consumptions of ConsumptionsParser (always one request at once) are downloaded and parsed;
+every run is done in a new process, so its peak RSS is not raised by the runs before it;
+time, rows, bytes, requests and peak RSS of every run are written to benchmarks/results/collectors_<time>.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Mapping, Tuple
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS_FOLDER)
+for source_folder in ('GRTgaz', 'national_grid'):
+    sys.path.insert(1, os.path.join(ROOT, source_folder))
+
+from loguru import logger
+from fixture_server import add_server_arguments, server_from_arguments
+from loader_benchmark import RESULTS_FOLDER, git_commit, host, parse_list
+
+# changed when fields of results are changed, results of different versions are not compared
+RESULTS_VERSION = 1
+CONCURRENCY = (1, 2, 4, 8)
+COLLECTORS = ('grtgaz', 'ng', 'consumptions')
+# GRTgaz exports are requested for every month of the period
+GRTGAZ_START_DATE = date(2023, 1, 1)
+GRTGAZ_END_DATE = date(2023, 12, 31)
+NATIONAL_GRID_YEARS = (2015, 2023)
+RETRIES = 3
+BACKOFF = 0.1  # seconds, failures of the fixture server are retried without long delays
+
+
+def peak_rss_mb() -> Tuple[float, float]:
+    """
+    returns peak RSS of this process and the largest peak RSS of its finished child processes in MiB
+    """
+    # ru_maxrss is in KiB on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+
+def months(start_date: date, end_date: date) -> List[Tuple[date, date]]:
+    chunks = []
+    first_day = start_date.replace(day=1)
+    while first_day <= end_date:
+        next_month = date(first_day.year + first_day.month // 12, first_day.month % 12 + 1, 1)
+        chunks.append((max(first_day, start_date), min(date.fromordinal(next_month.toordinal() - 1), end_date)))
+        first_day = next_month
+    return chunks
+
+
+def collect_grtgaz(base_url: str, concurrency: int, folder: str) -> Tuple[int, int]:
+    """
+    downloads and parses all data types by monthly chunks, returns parsed rows and failed chunks
+    """
+    import requests
+    from grtgaz_parser import DATA_TYPES, GRTgazParser
+
+    def collect(data_type: str, start_date: date, end_date: date) -> int:
+        # every chunk is saved into its own folder, chunks are downloaded at the same time
+        chunk_folder = os.path.join(folder, f'{data_type}_{start_date:%Y%m}')
+        os.makedirs(chunk_folder)
+        parser = GRTgazParser(data_type, session=session, folder=chunk_folder, base_url=base_url)
+        return len(parser.get_data_between(start_date, end_date).index)
+
+    rows = errors = 0
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+        futures = [executor.submit(collect, data_type, start_date, end_date)
+                   for data_type in DATA_TYPES for start_date, end_date in months(GRTGAZ_START_DATE, GRTGAZ_END_DATE)]
+        for future in futures:
+            try:
+                rows += future.result()
+            except requests.RequestException as error:
+                logger.warning(f'GRTgaz chunk is not collected: {error}')
+                errors += 1
+    return rows, errors
+
+
+def collect_national_grid(base_url: str, concurrency: int, folder: str) -> Tuple[int, int]:
+    """
+    downloads files of all years and parses them, returns parsed rows and failed years
+    (nothing is parsed if a year is failed)
+    """
+    from national_grid_collector import main
+    from national_grid_processor import get_historical_data
+
+    start_year, end_year = NATIONAL_GRID_YEARS
+    file_name = os.path.join(folder, 'NG')
+    report = asyncio.run(main(file_name, years=range(start_year, end_year + 1), concurrency=concurrency,
+                              retries=RETRIES, backoff=BACKOFF, base_url=base_url))
+    errors = sum(not result.ok for result in report.values())
+    if errors:
+        return 0, errors
+    return len(get_historical_data(file_name, start_year=start_year, end_year=end_year,
+                                   workers=concurrency).index), errors
+
+
+def collect_consumptions(base_url: str, concurrency: int, folder: str) -> Tuple[int, int]:
+    """
+    downloads consumptions of all years into one workbook by ConsumptionsParser, returns its rows
+    """
+    import openpyxl
+    import requests
+    from consumptions import ConsumptionsParser
+
+    # the parser saves temporary files into the current directory
+    os.chdir(folder)
+    try:
+        ConsumptionsParser.get_historical_data(os.path.join(folder, 'consumptions'), base_url=base_url)
+    except requests.RequestException as error:
+        logger.warning(f'Consumptions are not collected: {error}')
+        return 0, 1
+    # the name of the workbook ends with the years
+    workbook = openpyxl.load_workbook(glob.glob(os.path.join(folder, 'consumptions_*.xlsx'))[0], read_only=True)
+    return workbook.active.max_row, 0
+
+
+COLLECT: Mapping[str, Callable[[str, int, str], Tuple[int, int]]] = {
+    'grtgaz': collect_grtgaz, 'ng': collect_national_grid, 'consumptions': collect_consumptions}
+
+
+def measure(collector: str, base_url: str, concurrency: int) -> dict:
+    """
+    runs the collector in this process (a new process started for the run) and returns its numbers
+    """
+    from metrics import metrics
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    with tempfile.TemporaryDirectory(prefix='gpe_collectors_') as folder:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        rows, errors = COLLECT[collector](base_url, concurrency, folder)
+        seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+    peak_rss, peak_children_rss = peak_rss_mb()
+    return {'seconds': round(seconds, 3), 'cpu_seconds': round(cpu_seconds, 3), 'rows': rows,
+            'rows_per_second': round(rows / seconds, 1), 'errors': errors,
+            'bytes_downloaded': int(metrics.value('bytes_downloaded')),
+            'stages': {stage: round(metrics.value('stage_wall_seconds', stage=stage), 3)
+                       for stage in ('download', 'parse')},
+            'peak_rss_mb': round(peak_rss, 1), 'peak_children_rss_mb': round(peak_children_rss, 1)}
+
+
+def run_benchmark(server, collectors: List[str], concurrencies: List[int], repeat: int = 1) -> List[dict]:
+    """
+    runs every collector with every concurrency (ConsumptionsParser only once) against the started fixture server
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for collector in collectors:
+        for concurrency in ([1] if collector == 'consumptions' else concurrencies):
+            for run in range(repeat):
+                stats_before = server.stats()
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(measure, collector, server.url, concurrency).result()
+                stats = server.stats()
+                result = {'collector': collector, 'concurrency': concurrency, 'run': run, **result,
+                          **{name: stats[name] - stats_before[name] for name in ('requests', 'failures')}}
+                logger.info(f'{collector} concurrency {concurrency}: {result["seconds"]} s, '
+                            f'{result["rows_per_second"]} rows/s, peak RSS {result["peak_rss_mb"]} MiB, '
+                            f'{result["failures"]} failures injected, {result["errors"]} errors')
+                results.append(result)
+    return results
+
+
+def print_results(results: List[dict]) -> None:
+    print(f'{"collector":<13} {"concurrency":>11} {"seconds":>9} {"rows/s":>10} {"peak RSS MiB":>13} '
+          f'{"requests":>9} {"failures":>9} {"errors":>7}')
+    for result in results:
+        print(f'{result["collector"]:<13} {result["concurrency"]:>11} {result["seconds"]:>9.2f} '
+              f'{result["rows_per_second"]:>10.1f} {result["peak_rss_mb"]:>13.1f} '
+              f'{result["requests"]:>9} {result["failures"]:>9} {result["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='benchmarks the collectors against the local fixture server')
+    arg_parser.add_argument('--concurrency', type=lambda value: parse_list(value, int), default=list(CONCURRENCY),
+                            help=f'comma separated concurrency settings (default {",".join(map(str, CONCURRENCY))})')
+    arg_parser.add_argument('--collectors', type=parse_list, default=list(COLLECTORS),
+                            help=f'comma separated collectors (default {",".join(COLLECTORS)})')
+    arg_parser.add_argument('--repeat', type=int, default=1, help='runs of every collector and concurrency')
+    add_server_arguments(arg_parser)
+    arg_parser.add_argument('--output', default=None,
+                            help='JSON file with results (default benchmarks/results/collectors_<time>.json)')
+    args = arg_parser.parse_args()
+    unknown = sorted(set(args.collectors) - set(COLLECTORS))
+    if unknown:
+        arg_parser.error(f'unknown collectors {unknown}, choose from {list(COLLECTORS)}')
+
+    started = datetime.now()
+    with server_from_arguments(args) as server:
+        results = run_benchmark(server, args.collectors, args.concurrency, repeat=args.repeat)
+        settings = server.settings()
+
+    output = args.output or os.path.join(RESULTS_FOLDER, f'collectors_{started:%Y%m%d_%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'benchmark': 'collectors', 'version': RESULTS_VERSION,
+                   'started': started.isoformat(timespec='seconds'), 'git_commit': git_commit(),
+                   'python': platform.python_version(), 'host': host(), 'server': settings,
+                   'concurrency': args.concurrency, 'results': results}, f, indent=1)
+    print_results(results)
+    print(f'Results are written to {output}')
@@ -0,0 +1,437 @@
+"""
+local HTTP server replaying GRTgaz exports (/api/v1/en/<data type>/export/<file>.xls)
+and National Grid files (/document/<id>/download) for benchmarks of the collectors:
+responses recorded by the collectors are taken from a raw archive (--raw-archive) when it has them,
+other responses are synthetic workbooks in the format read by the parsers;
+it also serves synthetic Fluxys exports (/fluxys/<data type>.<csv or xlsx>) for FluxysFixtureCollector,
+which takes the place of the browser of FluxysCollector;
+latency, bandwidth and failures are injected into every response
+
+    python benchmarks/fixture_server.py --port 8080 --latency 0.2 --bandwidth 1000000 --failure-rate 0.1
+
+the collectors request it when GRTGAZ_BASE_URL and NATIONAL_GRID_BASE_URL are set to its URL
+"""
+import io
+import os
+import csv
+import sys
+import time
+import zlib
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from typing import Dict, List, Mapping, Optional, Tuple
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS_FOLDER)
+for source_folder in ('GRTgaz', 'fluxys', 'national_grid'):
+    sys.path.insert(1, os.path.join(ROOT, source_folder))
+
+import requests
+from loguru import logger
+from raw_archive import RawArchive
+from fluxys_processor import DATE_FORMAT as FLUXYS_DATE_FORMAT, POINTS_COUNTRIES, VALUE_COLUMNS
+from config import GRTGAZ_BASE_URL, GRTGAZ_BASE_URL_ENV_VAR
+from national_grid_collector import BASE_URL_ENV_VAR as NATIONAL_GRID_BASE_URL_ENV_VAR, urls
+
+CHUNK_SIZE = 16 * 1024  # bytes sent at once, bandwidth is limited by pauses between chunks
+POINTS = 8  # sheets of GRTgaz flows and sites of National Grid files
+SEED = 42
+CONTENT_TYPE = 'application/vnd.ms-excel'
+# points known by grtgaz_parser.DataRow
+GRTGAZ_POINTS = ('Alveringem', 'Dunkerque', 'Jura', 'Midi', 'Obergailbach', 'Oltingue',
+                 'TIGF interconnection', 'Taisnieres B', 'Taisnieres H', 'VIP Virtualys')
+NATIONAL_GRID_OPERATOR_TYPES = ('LNG', 'STORAGE')
+FLUXYS_BALANCING_ZONES = ('H-Zone', 'L-Zone')
+FLUXYS_CLIENT_TYPES = ('Distribution', 'End User', 'Power Plant')
+FLUXYS_DIRECTIONS = ('Entry', 'Exit')
+NATIONAL_GRID_MONTHS = ('Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar')
+# year of the National Grid file by the path of its URL
+national_grid_years: Mapping[str, int] = {urlsplit(url).path: year for year, url in urls.items()}
+national_grid_site = urlsplit(urls[min(urls)])._replace(path='').geturl()
+
+
+def _days(start_date: date, end_date: date) -> List[date]:
+    return [start_date + timedelta(days=day) for day in range((end_date - start_date).days + 1)]
+
+
+def _workbook_bytes(workbook) -> bytes:
+    stream = io.BytesIO()
+    workbook.save(stream)
+    return stream.getvalue()
+
+
+def grtgaz_workbook(type_param: str, start_date: date, end_date: date, points: int = POINTS,
+                    seed: int = SEED) -> bytes:
+    """
+    returns the GRTgaz export of the data type (type_param of the URL) from start_date till end_date:
+    one sheet for consumptions, one sheet for every point for physical and commercial flows
+    """
+    import openpyxl
+    rng = random.Random(seed)
+    days = _days(start_date, end_date)
+    workbook = openpyxl.Workbook(write_only=True)
+    if type_param == 'consommation':
+        sheet = workbook.create_sheet('Zone')
+        sheet.append(['GRTgaz consumptions'])
+        sheet.append([])
+        sheet.append(['Date', 'Total', 'Industrial', 'Public distribution', 'Power production', 'Other'])
+        for day in days:
+            values = [rng.uniform(1e7, 1e9) for _ in range(4)]
+            sheet.append([datetime.combine(day, datetime.min.time()), sum(values), *values])
+        return _workbook_bytes(workbook)
+
+    for point in GRTGAZ_POINTS[:points]:
+        sheet = workbook.create_sheet(point)
+        if type_param == 'flux_physiques':
+            sheet.append(['GRTgaz physical flows', point])
+            sheet.append([])
+            sheet.append([])
+            sheet.append(['Date', 'Physical flow'])
+            sheet.append([None, 'kWh/d'])
+            for day in days:
+                sheet.append([datetime.combine(day, datetime.min.time()), rng.uniform(0, 1e9)])
+        else:
+            sheet.append(['GRTgaz commercial flows', point])
+            sheet.append([])
+            sheet.append(['Gas day', 'Technical capacity', 'Technical capacity', "Shippers' nomination",
+                          "Shippers' nomination", 'Allocation', 'Allocation'])
+            sheet.append([None, 'Entry', 'Exit', 'Entry', 'Exit', 'Entry', 'Exit'])
+            for number, day in enumerate(days):
+                entry, exit_ = rng.uniform(0, 1e9), rng.uniform(0, 1e9)
+                # the last days are not allocated yet, nominations are taken for them
+                allocated = number < len(days) - 2
+                sheet.append([datetime.combine(day, datetime.min.time()), 2e9, 2e9, entry, exit_,
+                              entry * 0.99 if allocated else None, exit_ * 0.99 if allocated else None])
+    return _workbook_bytes(workbook)
+
+
+def national_grid_workbook(year: int, points: int = POINTS, seed: int = SEED, today: date = None) -> bytes:
+    """
+    returns the National Grid file of the gas year (April of the year till March of the next year, till today):
+    a sheet for every month and the sheet 'Today' with the last day, ended by a note as in real files
+    """
+    import openpyxl
+    rng = random.Random(seed)
+    today = date.today() if today is None else today
+    # the first file has only months till September
+    months = NATIONAL_GRID_MONTHS[:6] if year == min(urls) else NATIONAL_GRID_MONTHS
+    last_day = date(year, 9, 30) if year == min(urls) else date(year + 1, 3, 31)
+    days = _days(date(year, 4, 1), min(last_day, today))
+    header = ['Gasday', 'Site Name', 'Operator Type', 'Opening Stock', 'Closing Stock',
+              'Available Capacity', 'Injectability', 'Deliverability']
+    sites = [(f'Site {number}', NATIONAL_GRID_OPERATOR_TYPES[number % 2]) for number in range(points)]
+
+    def rows(day: date):
+        for site, operator_type in sites:
+            opening = rng.uniform(0, 1e9)
+            yield [day.strftime('%d-%b-%Y'), site, operator_type, opening, opening + rng.uniform(-1e7, 1e7),
+                   2e9, 1e7, 1e7]
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Today')
+    sheet.append(header)
+    if days:
+        for row in rows(days[-1]):
+            sheet.append(row)
+    sheet.append([None, 'Data is provisional and subject to change'])
+    for month in months:
+        sheet = workbook.create_sheet(month)
+        sheet.append(header)
+        for day in days:
+            if day.strftime('%b') == month:
+                for row in rows(day):
+                    sheet.append(row)
+    return _workbook_bytes(workbook)
+
+
+def fluxys_export(data_type: str, export_format: str, start_date: date, end_date: date, points: int = POINTS,
+                  seed: int = SEED) -> bytes:
+    """
+    returns the Fluxys export of the data type from start_date till end_date in csv or excel format:
+    domestic flows of every balancing zone and client type or flows of the first points of POINTS_COUNTRIES
+    """
+    rng = random.Random(seed)
+    if data_type == 'domestic':
+        keys = [(zone, client_type) for zone in FLUXYS_BALANCING_ZONES for client_type in FLUXYS_CLIENT_TYPES]
+        header = ['Gas day', 'Balancing Zone ', 'Client Type', 'Subgrid', 'Nature', *VALUE_COLUMNS,
+                  'Allocations (kWh)', 'GCV']
+    else:
+        keys = [(point,) for point in list(POINTS_COUNTRIES)[:points]]
+        header = ['Gas day', 'Interconnection Point', 'Direction', *VALUE_COLUMNS,
+                  'Allocations (kWh)', 'Measured GCV\n(kWh/m³(n))']
+    rows = []
+    for day in _days(start_date, end_date):
+        for key in keys:
+            for direction in FLUXYS_DIRECTIONS:
+                values = [rng.uniform(0, 1e9) for _ in VALUE_COLUMNS]
+                extra = [values[-1], 11.5]
+                if data_type == 'domestic':
+                    rows.append([day.strftime(FLUXYS_DATE_FORMAT), *key, 'HP', direction, *values, *extra])
+                else:
+                    rows.append([day.strftime(FLUXYS_DATE_FORMAT), *key, direction, *values, *extra])
+    if export_format == 'csv':
+        stream = io.StringIO()
+        writer = csv.writer(stream)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return stream.getvalue().encode('utf-8')
+
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Report')
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    return _workbook_bytes(workbook)
+
+
+def _parse_date(value: Optional[str], default: date) -> date:
+    # GRTgaz dates are sent without leading zeros, e.g. 2023-1-5
+    return default if not value else date(*map(int, value.split('-')))
+
+
+class Fixtures:
+    """
+    class to answer requests of the collectors: recorded responses from the raw archive
+    or synthetic workbooks, both are kept in memory after the first request
+    """
+    def __init__(self, points: int = POINTS, raw_archive: str = None, seed: int = SEED):
+        self.points = points
+        self.archive = None if raw_archive is None else RawArchive(folder=raw_archive, offline=True)
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._responses: Dict[Tuple[str, str], Optional[bytes]] = {}
+
+    def _recorded(self, site: str, path: str, params: Mapping[str, str]) -> Optional[bytes]:
+        """
+        returns the response recorded for the request to the real site
+        """
+        if self.archive is None:
+            return None
+        key = self.archive.key(f'{site}{path}', params or None)
+        if not self.archive.has(key):
+            return None
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'response')
+            self.archive.restore(key, file_name)
+            with open(file_name, 'rb') as f:
+                return f.read()
+
+    def _synthetic(self, path: str, params: Mapping[str, str]) -> Optional[bytes]:
+        # the same request gets the same data
+        seed = zlib.crc32(f'{self.seed}{path}{sorted(params.items())}'.encode('utf-8'))
+        parts = path.strip('/').split('/')
+        if parts[:3] == ['api', 'v1', 'en'] and len(parts) == 6 and parts[4] == 'export':
+            today = date.today()
+            return grtgaz_workbook(parts[3], _parse_date(params.get('startDate'), today - timedelta(days=2)),
+                                   _parse_date(params.get('endDate'), today), points=self.points, seed=seed)
+        if parts[0] == 'fluxys' and len(parts) == 2:
+            data_type, export_format = os.path.splitext(parts[1])
+            return fluxys_export(data_type, 'csv' if export_format == '.csv' else 'excel',
+                                 datetime.strptime(params['fromDate'], FLUXYS_DATE_FORMAT).date(),
+                                 datetime.strptime(params['toDate'], FLUXYS_DATE_FORMAT).date(),
+                                 points=self.points, seed=seed)
+        if path in national_grid_years:
+            return national_grid_workbook(national_grid_years[path], points=self.points, seed=seed)
+        return None
+
+    def response(self, path: str, query: str) -> Optional[bytes]:
+        """
+        returns the body of the response to the request or None if the path is unknown
+        """
+        with self._lock:
+            if (path, query) in self._responses:
+                return self._responses[(path, query)]
+        params = dict(parse_qsl(query))
+        site = GRTGAZ_BASE_URL if path.startswith('/api/') else national_grid_site
+        body = self._recorded(site, path, params)
+        if body is None:
+            body = self._synthetic(path, params)
+        with self._lock:
+            self._responses[(path, query)] = body
+        return body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # connections are kept alive, so sessions of the collectors reuse them as with the real sites
+    protocol_version = 'HTTP/1.1'
+    server: '_Server'
+
+    def do_GET(self):
+        fixture_server = self.server.fixture_server
+        url = urlsplit(self.path)
+        body = fixture_server.fixtures.response(url.path, url.query)
+        fixture_server.count('requests')
+        if fixture_server.latency:
+            time.sleep(fixture_server.latency)
+        if body is None:
+            self.send_error(404)
+            return
+        if fixture_server.fail():
+            fixture_server.count('failures')
+            self.send_error(fixture_server.failure_status)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if fixture_server.bandwidth:
+                time.sleep(len(chunk) / fixture_server.bandwidth)
+        fixture_server.count('bytes_sent', len(body))
+
+    def log_message(self, format, *args):
+        # requests are counted by the server instead of logging every one of them
+        return
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fixture_server: 'FixtureServer'
+
+
+class FixtureServer:
+    """
+    class to run the fixture HTTP server in a thread of the benchmark:
+    every response is delayed by latency seconds, sent with bandwidth bytes per second (per connection)
+    and is replaced by an error with failure_status with probability failure_rate
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, bandwidth: float = None,
+                 failure_rate: float = 0.0, failure_status: int = 503, points: int = POINTS,
+                 raw_archive: str = None, seed: int = SEED):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.fixtures = Fixtures(points=points, raw_archive=raw_archive, seed=seed)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats: Counter = Counter()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def stats(self) -> Mapping[str, int]:
+        """
+        returns requests, injected failures and bytes sent since the server is started
+        """
+        with self._lock:
+            return {name: self._stats[name] for name in ('requests', 'failures', 'bytes_sent')}
+
+    def settings(self) -> Mapping[str, object]:
+        return {'latency': self.latency, 'bandwidth': self.bandwidth, 'failure_rate': self.failure_rate,
+                'failure_status': self.failure_status, 'points': self.fixtures.points,
+                'raw_archive': None if self.fixtures.archive is None else self.fixtures.archive.folder}
+
+    def start(self) -> 'FixtureServer':
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.fixture_server = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fixture-server', daemon=True)
+        self._thread.start()
+        logger.info(f'Fixture server is started on {self.url}')
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> 'FixtureServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class FluxysFixtureCollector:
+    """
+    class to collect Fluxys exports from the fixture server instead of the Fluxys site,
+    it is passed to fluxys_processor.collect_data as the collector, so everything except the browser is run
+    """
+    def __init__(self, base_url: str, path_to_save: str):
+        self.base_url = base_url.rstrip('/')
+        self.path_to_save = path_to_save
+        self._session = requests.Session()
+
+    def collect(self, data_type: str, from_date: str, to_date: str, file_name: str,
+                export_format: str = 'excel') -> str:
+        """
+        saves the export for the date range (dates in fluxys_processor.DATE_FORMAT) and returns its path
+        """
+        extension = 'csv' if export_format == 'csv' else 'xlsx'
+        response = self._session.get(f'{self.base_url}/fluxys/{data_type}.{extension}',
+                                     params={'fromDate': from_date, 'toDate': to_date})
+        response.raise_for_status()
+        file_path = os.path.join(self.path_to_save, file_name)
+        with open(file_path, 'wb') as f:
+            f.write(response.content)
+        return file_path
+
+    def close(self) -> None:
+        self._session.close()
+
+    def __enter__(self) -> 'FluxysFixtureCollector':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    adds arguments of the fixture server to the arguments of the benchmark
+    """
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='bytes per second sent to every connection (default unlimited)')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='share of responses replaced by errors, e.g. 0.1')
+    parser.add_argument('--failure-status', type=int, default=503, help='HTTP status of injected errors')
+    parser.add_argument('--points', type=int, default=POINTS,
+                        help='GRTgaz points and National Grid sites in synthetic files')
+    parser.add_argument('--raw-archive', default=None,
+                        help='raw archive of the collectors (e.g. GRTgaz/parsed_data/raw_archive), '
+                             'recorded responses are replayed from it, other responses are synthetic')
+
+
+def server_from_arguments(args: argparse.Namespace, port: int = 0) -> FixtureServer:
+    return FixtureServer(port=port, latency=args.latency, bandwidth=args.bandwidth, failure_rate=args.failure_rate,
+                         failure_status=args.failure_status, points=args.points, raw_archive=args.raw_archive)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='serves GRTgaz and National Grid files for the collectors')
+    arg_parser.add_argument('--port', type=int, default=8080)
+    add_server_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    fixture_server = server_from_arguments(args, port=args.port).start()
+    print(f'export {GRTGAZ_BASE_URL_ENV_VAR}={fixture_server.url} {NATIONAL_GRID_BASE_URL_ENV_VAR}={fixture_server.url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fixture_server.stop()
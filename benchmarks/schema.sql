@@ -0,0 +1,109 @@
+-- subset of analytics_base used by GRTgaz, Fluxys, National Grid and 42fs loaders
+-- (only columns the loaders read or write, unique keys used by their ON CONFLICT clauses)
+
+DROP TABLE IF EXISTS curves, curves_dict, flow_curves, prices_curve_dict, instruments_dict, products_dict,
+    delivery_point_dict, delivery_point_types_dict, country_dict, source_dict, units_dict, flow_types,
+    sector_dict, markets_dict, currencies_dict, product_types_dict, instrument_types_dict, prices_type_dict CASCADE;
+
+CREATE TABLE source_dict (id serial PRIMARY KEY, source_name text NOT NULL UNIQUE);
+CREATE TABLE units_dict (id serial PRIMARY KEY, unit_name text NOT NULL UNIQUE);
+CREATE TABLE country_dict (id serial PRIMARY KEY, country_2 char(2) NOT NULL UNIQUE, country_name text NOT NULL);
+CREATE TABLE flow_types (id serial PRIMARY KEY, flow_type text NOT NULL UNIQUE);
+CREATE TABLE sector_dict (id serial PRIMARY KEY, sector_name text NOT NULL UNIQUE);
+CREATE TABLE delivery_point_types_dict (id serial PRIMARY KEY, point_type text NOT NULL UNIQUE);
+CREATE TABLE markets_dict (id serial PRIMARY KEY, market_name text NOT NULL UNIQUE);
+CREATE TABLE currencies_dict (id serial PRIMARY KEY, currency_code text NOT NULL UNIQUE);
+CREATE TABLE product_types_dict (id serial PRIMARY KEY, product_type text NOT NULL UNIQUE);
+CREATE TABLE instrument_types_dict (id serial PRIMARY KEY, instrument_type text NOT NULL UNIQUE);
+CREATE TABLE prices_type_dict (id serial PRIMARY KEY, price_type text NOT NULL UNIQUE);
+
+CREATE TABLE delivery_point_dict (
+    id serial PRIMARY KEY,
+    id_type integer,
+    id_country integer,
+    id_source integer,
+    point_name text NOT NULL,
+    update_time timestamp,
+    UNIQUE (point_name, id_type)
+);
+
+CREATE TABLE flow_curves (
+    id serial PRIMARY KEY,
+    id_source integer NOT NULL,
+    id_point integer NOT NULL,
+    id_unit integer NOT NULL,
+    from_country integer,
+    to_country integer,
+    from_company integer,
+    to_company integer,
+    id_type integer NOT NULL,
+    curve_name text,
+    update_time timestamp
+);
+
+CREATE TABLE products_dict (
+    id serial PRIMARY KEY,
+    id_delivery_point integer NOT NULL,
+    id_currency integer NOT NULL,
+    id_unit integer NOT NULL,
+    id_market integer NOT NULL,
+    id_product_type integer NOT NULL,
+    beg_date timestamp,
+    end_date timestamp,
+    code text,
+    update_time timestamp,
+    UNIQUE (id_delivery_point, id_currency, id_unit, id_market, id_product_type, beg_date, end_date, code)
+);
+
+CREATE TABLE instruments_dict (
+    id serial PRIMARY KEY,
+    id_product_1 integer NOT NULL,
+    id_product_2 integer,
+    id_instrument_type integer NOT NULL,
+    update_time timestamp,
+    UNIQUE (id_product_1, id_product_2, id_instrument_type)
+);
+
+CREATE TABLE prices_curve_dict (
+    id serial PRIMARY KEY,
+    id_source integer NOT NULL,
+    id_instrument integer NOT NULL,
+    id_type integer NOT NULL,
+    description text,
+    update_time timestamp,
+    UNIQUE (id_source, id_instrument, id_type)
+);
+
+-- one foreign key to every referenced table, so automap gives relationships unique names
+CREATE TABLE curves_dict (
+    id serial PRIMARY KEY,
+    id_sector integer NOT NULL REFERENCES sector_dict (id),
+    id_flow_curves integer REFERENCES flow_curves (id),
+    id_prices_curves integer REFERENCES prices_curve_dict (id),
+    update_time timestamp
+);
+
+CREATE TABLE curves (
+    id_curve integer NOT NULL REFERENCES curves_dict (id),
+    date timestamp NOT NULL,
+    value double precision,
+    update_time timestamp,
+    PRIMARY KEY (id_curve, date)
+);
+
+-- dictionaries which the loaders only search in
+INSERT INTO source_dict (source_name) VALUES ('GRTgaz'), ('Fluxys'), ('NationalGrid'), ('42 Financial Services');
+INSERT INTO units_dict (unit_name) VALUES ('kWh'), ('MWh');
+INSERT INTO country_dict (country_2, country_name) VALUES
+    ('FR', 'France'), ('BE', 'Belgium'), ('DE', 'Germany'), ('ES', 'Spain'), ('CH', 'Switzerland'),
+    ('GB', 'United Kingdom'), ('CZ', 'Czechia'), ('HU', 'Hungary'), ('PL', 'Poland'), ('SK', 'Slovakia'),
+    ('NL', 'Netherlands'), ('LU', 'Luxembourg'), ('NO', 'Norway');
+INSERT INTO flow_types (flow_type) VALUES ('physical_flow'), ('commercial_flow'), ('consumptions'), ('nomination');
+INSERT INTO sector_dict (sector_name) VALUES ('flows'), ('currency prices');
+INSERT INTO delivery_point_types_dict (point_type) VALUES
+    ('interconnection'), ('lng_terminal'), ('ugs'), ('hub'), ('electricity_region');
+INSERT INTO markets_dict (market_name) VALUES ('Natural Gas'), ('Electricity');
+INSERT INTO currencies_dict (currency_code) VALUES ('EUR'), ('GBP'), ('PLN');
+INSERT INTO product_types_dict (product_type) VALUES ('Daily'), ('Week'), ('Month'), ('Quarter'), ('Season'), ('Year');
+INSERT INTO instrument_types_dict (instrument_type) VALUES ('Single'), ('Spread');
+INSERT INTO prices_type_dict (price_type) VALUES ('bid'), ('offer');
@@ -1,19 +1,36 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+# selenium is imported only when a browser is used, reading of exported files does not need it
 import os
+import glob
 import time
+import queue
+import threading
+import shutil
+import tempfile
+import uuid
 from typing import Literal, Mapping
 
 Data_Type = Literal['domestic', 'interconnection']
+Export_Format = Literal['excel', 'csv']
+
+URL = 'https://gasdata.fluxys.com/en/transmission-ztp-trading-services/flow-data/'
+
+REPORT_TIMEOUT = 60  # seconds to wait for the report to be rendered
+DOWNLOAD_TIMEOUT = 120  # seconds to wait for the export file
+POLL_INTERVAL = 0.2  # seconds between checks of the download directory
+RETRIES = 2  # how many times to collect date range again after timeout
+PARTIAL_DOWNLOAD_SUFFIX = '.crdownload'
 
 X_PATHS: Mapping[str, str] = {
     'from_date': '//*[@id="ctl00_ctl00_Content_ChildContentLeft_PeriodControl_PeriodFromDatePicker"]',
     'to_date': '//*[@id="ctl00_ctl00_Content_ChildContentLeft_PeriodControl_PeriodToDatePicker"]',
     'load_button': '//*[@id="ctl00_ctl00_Content_LoadDataButton2"]',
+    # ReportViewer keeps its outer element on async postbacks and replaces only the rendered report
+    'report_content': '//*[@id="ctl00_ctl00_Content_ReportViewerControl"]'
+                      '//div[starts-with(@id, "VisibleReportContent")]',
+    'report_loading': '//*[@id="ctl00_ctl00_Content_ReportViewerControl_AsyncWait"]',
     'save_icon': '//*[@id="ctl00_ctl00_Content_ReportViewerControl_ctl05_ctl04_ctl00_ButtonLink"]',
-    'excel_type': '//*[@id="ctl00_ctl00_Content_ReportViewerControl_ctl05_ctl04_ctl00_Menu"]/div[2]/a'
+    'excel_type': '//*[@id="ctl00_ctl00_Content_ReportViewerControl_ctl05_ctl04_ctl00_Menu"]/div[2]/a',
+    'csv_type': '//*[@id="ctl00_ctl00_Content_ReportViewerControl_ctl05_ctl04_ctl00_Menu"]//a[contains(., "CSV")]'
 }
 
 DEPENDING_X_PATHS: Mapping['Data_Type', Mapping[str, str]] = {
@@ -28,10 +45,17 @@ DEPENDING_X_PATHS: Mapping['Data_Type', Mapping[str, str]] = {
 }
 
 
+class DownloadTimeout(Exception):
+    """Raises if export file is not saved in time"""
+    ...
+
+
 def create_driver(path_to_save: str):
     """
     function to create web driver with chrome options
     """
+    from selenium import webdriver
+
     user_agent = 'Mozilla/5.0 (X11; Linux x86_64) ' \
                  'AppleWebKit/537.36 (KHTML, like Gecko) ' \
                  'Chrome/33.0.1750.517 ' \
@@ -52,53 +76,252 @@ def create_driver(path_to_save: str):
     return driver
 
 
+def remove_partial_downloads(path_to_save: str) -> None:
+    """
+    deletes files that chrome did not finish to download
+    """
+    for file_path in glob.glob(os.path.join(path_to_save, f'*{PARTIAL_DOWNLOAD_SUFFIX}')):
+        os.unlink(file_path)
+
+
+def wait_for_download(file_path: str, timeout: float = DOWNLOAD_TIMEOUT, poll_interval: float = POLL_INTERVAL) -> str:
+    """
+    waits until the file is downloaded:
+    file exists, there are no partial downloads in its directory and its size is the same for two checks
+    """
+    folder = os.path.dirname(file_path) or '.'
+    deadline = time.monotonic() + timeout
+    last_size = -1
+    while time.monotonic() < deadline:
+        if os.path.exists(file_path) and not glob.glob(os.path.join(folder, f'*{PARTIAL_DOWNLOAD_SUFFIX}')):
+            size = os.path.getsize(file_path)
+            if size > 0 and size == last_size:
+                return file_path
+            last_size = size
+        time.sleep(poll_interval)
+    raise DownloadTimeout(f'{file_path} was not downloaded in {timeout} seconds')
+
+
+class FluxysCollector:
+    """
+    class to collect data from fluxys with one web driver,
+    the page is loaded once and only dates and granularity are set again for every date range
+    """
+    def __init__(self, path_to_save: str = None):
+        self.path_to_save = os.getcwd() if path_to_save is None else path_to_save
+        self._driver = None
+        self._data_type = None
+
+    def _open_page(self, data_type: Data_Type) -> None:
+        """
+        opens flow data page (starts the driver if it is not started yet) and chooses nominations and flows
+        """
+        from selenium.webdriver.common.by import By
+
+        if self._driver is None:
+            self._driver = create_driver(self.path_to_save)
+        self._driver.get(URL)
+        self._driver.find_element(By.XPATH, DEPENDING_X_PATHS[data_type]['points_type']).click()
+        self._data_type = data_type
+
+    def _report_content(self) -> str:
+        """
+        returns html of the rendered report (empty string if the report is not rendered)
+        """
+        from selenium.webdriver.common.by import By
+
+        content = self._driver.find_elements(By.XPATH, X_PATHS['report_content'])
+        return content[0].get_attribute('innerHTML') if content else ''
+
+    def _wait_for_report(self, old_content: str) -> None:
+        """
+        waits until the report for the new date range is rendered:
+        the postback was started (the loading overlay was shown or the report was changed),
+        the overlay is hidden again and the report is not the one of the previous date range
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.wait import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import StaleElementReferenceException
+
+        loading_seen = False
+
+        def report_is_loaded(driver) -> bool:
+            nonlocal loading_seen
+            loading = driver.find_elements(By.XPATH, X_PATHS['report_loading'])
+            if loading and loading[0].is_displayed():
+                loading_seen = True
+                return False
+            content = self._report_content()
+            # a short postback can finish between two checks, then only the changed report shows it
+            return bool(content) and (loading_seen or content != old_content)
+
+        wait = WebDriverWait(self._driver, REPORT_TIMEOUT, poll_frequency=POLL_INTERVAL,
+                             ignored_exceptions=(StaleElementReferenceException,))
+        wait.until(report_is_loaded)
+        wait.until(EC.element_to_be_clickable((By.XPATH, X_PATHS['save_icon'])))
+
+    def _collect(self, data_type: Data_Type, from_date: str, to_date: str, file_path: str,
+                 export_format: Export_Format) -> str:
+        """
+        sets the date range, loads the report and exports it into file_path
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.wait import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        if self._data_type != data_type:
+            self._open_page(data_type)
+        driver = self._driver
+
+        wait = WebDriverWait(driver, 15)
+
+        load_button = wait.until(
+            EC.element_to_be_clickable((By.XPATH, X_PATHS['load_button'])))
+
+        # set from date
+        from_ = driver.find_element(By.XPATH, X_PATHS['from_date'])
+        from_.clear()
+        from_.send_keys(from_date)
+
+        # set to date
+        to_ = driver.find_element(By.XPATH, X_PATHS['to_date'])
+        to_.clear()
+        to_.send_keys(to_date)
+
+        # choose granularity Daily
+        driver.find_element(By.XPATH, DEPENDING_X_PATHS[data_type]['granularity']).click()
+
+        # click button Load and wait for the report
+        old_content = self._report_content()
+        load_button.click()
+        self._wait_for_report(old_content)
+
+        # click on save icon
+        driver.find_element(By.XPATH, X_PATHS['save_icon']).click()
+
+        # click on Excel or CSV data type
+        export_type = wait.until(
+            EC.element_to_be_clickable((By.XPATH, X_PATHS[f'{export_format}_type'])))
+        export_type.click()
+
+        return wait_for_download(file_path)
+
+    def collect(self, data_type: Data_Type, from_date: str, to_date: str, file_name: str,
+                retries: int = RETRIES, export_format: Export_Format = 'excel') -> str:
+        """
+        collects data for the set date range and returns the path of the saved file,
+        the page is reloaded only when data_type is changed or after timeout
+        """
+        from selenium.common.exceptions import TimeoutException
+
+        file_path = os.path.join(self.path_to_save, file_name)
+        for attempt in range(retries + 1):
+            # old export would be taken for the new one
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+            try:
+                return self._collect(data_type=data_type, from_date=from_date, to_date=to_date, file_path=file_path,
+                                     export_format=export_format)
+            except (TimeoutException, DownloadTimeout) as error:
+                remove_partial_downloads(self.path_to_save)
+                # reload the page on the next attempt
+                self._data_type = None
+                if attempt == retries:
+                    raise
+                print(f'Retrying {data_type} data from {from_date} till {to_date} after error: {error!r}')
+
+    def close(self) -> None:
+        """
+        closes the browser
+        """
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+            self._data_type = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FluxysCollectorPool:
+    """
+    class to collect data with several web drivers at once,
+    every driver saves files into its own download directory
+    """
+    def __init__(self, size: int = 4, path_to_save: str = None):
+        self.size = size
+        self._folders = [tempfile.mkdtemp(prefix='fluxys_', dir=path_to_save) for _ in range(size)]
+        self._collectors = [FluxysCollector(folder) for folder in self._folders]
+        self._idle_collectors = queue.Queue()
+        self._lock = threading.Lock()
+        for collector in self._collectors:
+            self._idle_collectors.put(collector)
+
+    def collect(self, data_type: Data_Type, from_date: str, to_date: str, file_name: str,
+                export_format: Export_Format = 'excel') -> str:
+        """
+        collects data for the set date range with the first idle driver and returns the path of the saved file,
+        the file gets a unique name so the driver can be reused before the file is read
+        """
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        collector = self._idle_collectors.get()
+        healthy = True
+        try:
+            file_path = collector.collect(data_type=data_type, from_date=from_date, to_date=to_date,
+                                          file_name=file_name, export_format=export_format)
+            unique_file_path = os.path.join(collector.path_to_save, f'{uuid.uuid4().hex}_{file_name}')
+            os.replace(file_path, unique_file_path)
+            return unique_file_path
+        except WebDriverException as error:
+            # after timeout the page is reloaded by the collector, other errors mean the browser is broken
+            healthy = isinstance(error, TimeoutException)
+            raise
+        finally:
+            if not healthy:
+                collector = self._replace(collector)
+            self._idle_collectors.put(collector)
+
+    def _replace(self, collector: FluxysCollector) -> FluxysCollector:
+        """
+        quits the broken browser and returns a new collector with the same download directory
+        (its browser is started on the first date range)
+        """
+        try:
+            collector.close()
+        except Exception as error:
+            # the driver may be already dead
+            print(f'Browser is not closed: {error!r}')
+        remove_partial_downloads(collector.path_to_save)
+        new_collector = FluxysCollector(collector.path_to_save)
+        with self._lock:
+            self._collectors[self._collectors.index(collector)] = new_collector
+        return new_collector
+
+    def close(self) -> None:
+        """
+        closes all browsers and deletes download directories
+        """
+        for collector in self._collectors:
+            collector.close()
+        for folder in self._folders:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 def collect_fluxys_data(data_type: Data_Type, from_date: str, to_date: str, file_name: str):
     """
     function to collect data from fluxys with selenium for the set date range
+    (to collect several date ranges use one FluxysCollector)
     """
-    # create driver
-    driver = create_driver(os.getcwd())
-    driver.get('https://gasdata.fluxys.com/en/transmission-ztp-trading-services/flow-data/')
-
-    wait = WebDriverWait(driver, 15)
-
-    # choose nominations and flows
-    driver.find_element(By.XPATH, DEPENDING_X_PATHS[data_type]['points_type']).click()
-
-    load_button = wait.until(
-        EC.element_to_be_clickable((By.XPATH, X_PATHS['load_button'])))
-
-    # set from date
-    from_ = driver.find_element(By.XPATH, X_PATHS['from_date'])
-    from_.clear()
-    from_.send_keys(from_date)
-
-    # set to date
-    to_ = driver.find_element(By.XPATH, X_PATHS['to_date'])
-    to_.clear()
-    to_.send_keys(to_date)
-
-    # choose granularity Daily
-    driver.find_element(By.XPATH, DEPENDING_X_PATHS[data_type]['granularity']).click()
-
-    # click button Load
-    load_button.click()
-    time.sleep(5)
-
-    # click on save icon
-    # save_icon = wait.until(
-    #     EC.element_to_be_clickable((By.XPATH, X_Paths['save_icon'])))
-    # save_icon.click()
-    # time.sleep(1)
-    driver.find_element(By.XPATH, X_PATHS['save_icon']).click()
-
-    # click on Excel data type
-    excel_type = wait.until(
-        EC.element_to_be_clickable((By.XPATH, X_PATHS['excel_type'])))
-    excel_type.click()
-    # driver.find_element(By.XPATH, X_Paths['excel_type']).click()
-
-    # waiting to save and close driver
-    while not os.path.exists(file_name):
-        time.sleep(1)
-    driver.close()
+    with FluxysCollector() as collector:
+        collector.collect(data_type=data_type, from_date=from_date, to_date=to_date, file_name=file_name)
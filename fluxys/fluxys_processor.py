@@ -1,10 +1,21 @@
 import os
+import sys
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import date, timedelta
-from typing import Literal, List, Mapping
-from fluxys_collector import Data_Type, collect_fluxys_data
+from typing import Literal, List, Mapping, Tuple, Union, get_args
+from concurrent.futures import ThreadPoolExecutor
+from fluxys_collector import Data_Type, Export_Format, FluxysCollector, FluxysCollectorPool, DownloadTimeout
+sys.path.insert(1, os.path.join(sys.path[0], '../GRTgaz'))
+from backfill import Backfill, Chunk_Size
+from parsed_storage import Output_Format, write_parsed
+from parse_cache import ParseCache
+from metrics import metrics
+from profiling import add_profile_argument, start_profiling
 
+# change it when parsing of the files is changed, so files parsed before are parsed again
+PARSER_VERSION = 'fluxys_processor/1'
 
 POINTS_COUNTRIES: Mapping[str, Mapping[Literal['from', 'to'], str]] = {
     'Alveringem': {
@@ -113,11 +124,34 @@ POINTS_COUNTRIES: Mapping[str, Mapping[Literal['from', 'to'], str]] = {
     }
 }
 
+# from and to countries of interconnection points to map them column-wise
+FROM_COUNTRIES: Mapping[str, str] = {point: countries['from'] for point, countries in POINTS_COUNTRIES.items()}
+TO_COUNTRIES: Mapping[str, str] = {point: countries['to'] for point, countries in POINTS_COUNTRIES.items()}
+
 columns_to_drop: Mapping['Data_Type', List] = {
     'domestic': ['Balancing Zone ', 'Client Type', 'Subgrid', 'Allocations (kWh)', 'GCV'],
     'interconnection': ['Allocations (kWh)', 'Measured GCV\n(kWh/m³(n))']
 }
 
+# columns from columns_to_drop that are used to get delivery_point, so they are read from the file
+COLUMNS_TO_KEEP: Mapping['Data_Type', List] = {
+    'domestic': ['Balancing Zone ', 'Client Type'],
+    'interconnection': []
+}
+
+VALUE_COLUMNS = ['Day Ahead Nominations (kWh)', 'Final Nominations (kWh)', 'Physical Flow (kWh)']
+
+# explicit types of columns for the csv export
+COLUMNS_TYPES: Mapping[str, str] = {
+    'Gas day': 'str',
+    'Balancing Zone ': 'str',
+    'Client Type': 'str',
+    'Nature': 'str',
+    'Interconnection Point': 'str',
+    'Direction': 'str',
+    **{column: 'float64' for column in VALUE_COLUMNS}
+}
+
 COLUMNS_TO_RENAME: Mapping['Data_Type', Mapping[str, str]] = {
     'domestic': {
         'Gas day': 'date',
@@ -135,9 +169,24 @@ FILE_NAMES: Mapping['Data_Type', str] = {
     'interconnection': 'FlowsNominations_IP.xlsx'
 }
 
+CSV_FILE_NAMES: Mapping['Data_Type', str] = {
+    'domestic': 'FlowsNominations_DE.csv',
+    'interconnection': 'FlowsNominations_IP.csv'
+}
+
+EXPORT_FILE_NAMES: Mapping['Export_Format', Mapping['Data_Type', str]] = {
+    'excel': FILE_NAMES,
+    'csv': CSV_FILE_NAMES
+}
+
 DATE_FORMAT = '%d/%m/%Y'
 
 
+class BadCsvExport(Exception):
+    """Raises if csv export can not be read or has not all needed columns"""
+    ...
+
+
 def change_dates_format(start_date: date, end_date: date) -> tuple[str, str]:
     """
     Change the format of the dates to fit the fluxys
@@ -147,69 +196,118 @@ def change_dates_format(start_date: date, end_date: date) -> tuple[str, str]:
     return from_date, to_date
 
 
-def collect_data(data_type: Data_Type, start_date: date, end_date: date) -> pd.DataFrame:
+def collect_data(data_type: Data_Type, start_date: date, end_date: date,
+                 collector: Union[FluxysCollector, FluxysCollectorPool] = None,
+                 export_format: Export_Format = 'csv', parse_cache: ParseCache = None) -> pd.DataFrame:
     """
     collects data from fluxys with set data_type, start_date and end_date
+    (if collector is set its browser is used instead of starting a new one)
+    if csv export can not be collected or read (BadCsvExport), data is collected again with excel export
+    (if parse_cache is set unchanged exported files are not parsed again)
     """
+    from selenium.common.exceptions import TimeoutException
+
+    if collector is None:
+        with FluxysCollector() as new_collector:
+            return collect_data(data_type=data_type, start_date=start_date, end_date=end_date,
+                                collector=new_collector, export_format=export_format, parse_cache=parse_cache)
     from_date, to_date = change_dates_format(start_date=start_date, end_date=end_date)
-    collect_fluxys_data(data_type=data_type,
-                        from_date=from_date,
-                        to_date=to_date,
-                        file_name=FILE_NAMES[data_type])
-    df = FluxysDataFrame(data_type).data_frame
-    os.unlink(FILE_NAMES[data_type])
+    try:
+        with metrics.stage('download', source='Fluxys', data_type=data_type):
+            file_name = collector.collect(data_type=data_type,
+                                          from_date=from_date,
+                                          to_date=to_date,
+                                          file_name=EXPORT_FILE_NAMES[export_format][data_type],
+                                          export_format=export_format)
+        metrics.inc('bytes_downloaded', os.path.getsize(file_name), source='Fluxys', data_type=data_type)
+        try:
+            parse = lambda file_: FluxysDataFrame(data_type, file_name=file_, export_format=export_format).data_frame
+            with metrics.stage('parse', source='Fluxys', data_type=data_type):
+                if parse_cache is None:
+                    df = parse(file_name)
+                else:
+                    df = parse_cache.parse(file_name, parse,
+                                           parser_version=f'{PARSER_VERSION}:{data_type}:{export_format}')
+            metrics.inc('rows_parsed', len(df.index), source='Fluxys', data_type=data_type)
+        finally:
+            os.unlink(file_name)
+    except (TimeoutException, DownloadTimeout, BadCsvExport) as error:
+        if export_format == 'excel':
+            raise
+        print(f'Failed to collect {data_type} data with {export_format} export ({error!r}), using excel export...')
+        return collect_data(data_type=data_type, start_date=start_date, end_date=end_date,
+                            collector=collector, export_format='excel', parse_cache=parse_cache)
     return df
 
 
-def get_current_data(data_type: Data_Type) -> pd.DataFrame:
+def get_current_data(data_type: Data_Type, parse_cache: ParseCache = None) -> pd.DataFrame:
     """
     function to get data for the past two days in the DataFrame form
+    (if parse_cache is set unchanged exported files are not parsed again)
     """
     end_date = date.today()
     start_date = end_date - timedelta(days=2)
     print(f'Collecting {data_type} data for the past 2 days...')
     df = collect_data(data_type=data_type,
                       start_date=start_date,
-                      end_date=end_date)
+                      end_date=end_date,
+                      parse_cache=parse_cache)
     return df
 
 
-def get_historical_data(data_type, start_year: int = 2015, end_year: int = date.today().year):
+def get_historical_data(data_type, start_year: int = 2015, end_year: int = None,
+                        chunk_size: Chunk_Size = 'year', folder: str = 'checkpoints',
+                        collector: Union[FluxysCollector, FluxysCollectorPool] = None,
+                        parse_cache: ParseCache = None):
     """
     function to get historical data with set data type from start_year till end_year
     default: start_year = 2015, end_year = current year
+    data is collected by chunks of chunk_size, finished chunks are saved in folder
+    and are not collected again when the backfill is restarted
+    (if collector is FluxysCollectorPool chunks are collected by all its drivers at once)
     """
-    df = pd.DataFrame()
-    for year in range(start_year, end_year + 1):
-        start_date = date(year, 1, 1)
-        end_date = date.today() if year == date.today().year else date(year, 12, 31)
-
-        print(f'Collecting {data_type} data for {year} year...')
-        temp_df = collect_data(data_type=data_type,
-                               start_date=start_date,
-                               end_date=end_date)
-        df = pd.concat([df, temp_df], sort=False, axis=0)
-        df.reset_index(drop=True, inplace=True)
-    return df
+    # today is read on every call, not once on import, a long running daemon would stop at its start year
+    end_year = date.today().year if end_year is None else end_year
+    if collector is None:
+        # the browser is started only if there are chunks to collect and is closed once at the end
+        with FluxysCollector() as new_collector:
+            return get_historical_data(data_type=data_type, start_year=start_year, end_year=end_year,
+                                       chunk_size=chunk_size, folder=folder, collector=new_collector,
+                                       parse_cache=parse_cache)
+    start_date = date(start_year, 1, 1)
+    end_date = date.today() if end_year == date.today().year else date(end_year, 12, 31)
+    backfill = Backfill(name=f'Fluxys_{data_type}', folder=folder, chunk_size=chunk_size)
+    workers = collector.size if isinstance(collector, FluxysCollectorPool) else 1
+    return backfill.run(fetch=lambda chunk_start, chunk_end: collect_data(data_type=data_type,
+                                                                          start_date=chunk_start,
+                                                                          end_date=chunk_end,
+                                                                          collector=collector,
+                                                                          parse_cache=parse_cache),
+                        start_date=start_date,
+                        end_date=end_date,
+                        workers=workers)
+
+
+def get_all_historical_data(data_types: Tuple['Data_Type', ...] = ('domestic', 'interconnection'),
+                            workers: int = 4, **kwargs) -> Mapping['Data_Type', pd.DataFrame]:
+    """
+    function to get historical data of several data types,
+    date ranges of all data types are collected by the pool of workers browsers
+    (kwargs are passed to get_historical_data)
+    """
+    with FluxysCollectorPool(size=workers) as pool, ThreadPoolExecutor(max_workers=len(data_types)) as executor:
+        futures = {data_type: executor.submit(get_historical_data, data_type=data_type, collector=pool, **kwargs)
+                   for data_type in data_types}
+        return {data_type: future.result() for data_type, future in futures.items()}
 
 
 class FluxysDataFrame:
     """
     class to set dataframe for the fluxys
     """
-    def __init__(self, data_type: Data_Type):
-        self._df = pd.read_excel(FILE_NAMES[data_type])
-        self._columns_to_rename: Mapping['Data_Type', Mapping[str, str]] = {
-            'domestic': {
-                'Gas day': 'date',
-                'Nature': 'curve_name'
-            },
-            'interconnection': {
-                'Interconnection Point': 'delivery_point',
-                'Direction': 'curve_name',
-                'Gas day': 'date'
-            }
-        }
+    def __init__(self, data_type: Data_Type, file_name: str = None, export_format: Export_Format = 'excel'):
+        file_name = EXPORT_FILE_NAMES[export_format][data_type] if file_name is None else file_name
+        self._df = self._read_file(data_type=data_type, file_name=file_name, export_format=export_format)
         self._get_countries(data_type=data_type)
         self._rename_columns(data_type=data_type)
         self._change_view()
@@ -219,7 +317,30 @@ class FluxysDataFrame:
         # replace NaN values with 0
         # self._df.value = self._df.apply(lambda x: 0 if np.isnan(x.value) else x.value, axis=1)
         # drop rows with NaN values
-        self._df.drop(self._df[np.isnan(self._df.value)].index, inplace = True)
+        rows_with_nan = self._df[np.isnan(self._df.value)].index
+        self._df.drop(rows_with_nan, inplace = True)
+        metrics.inc('rows_dropped', len(rows_with_nan), source='Fluxys', data_type=data_type)
+
+    @staticmethod
+    def _read_file(data_type: Data_Type, file_name: str, export_format: Export_Format) -> pd.DataFrame:
+        """
+        reads exported file, columns from columns_to_drop are not read
+        """
+        columns_to_skip = set(columns_to_drop[data_type]) - set(COLUMNS_TO_KEEP[data_type])
+        usecols = lambda column: column not in columns_to_skip
+        if export_format == 'excel':
+            return pd.read_excel(file_name, usecols=usecols)
+
+        try:
+            df = pd.read_csv(file_name, usecols=usecols, dtype=COLUMNS_TYPES)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError) as error:
+            # values which can not be converted to COLUMNS_TYPES and bad encoding raise ValueError
+            raise BadCsvExport(f'{file_name} can not be read: {error!r}') from error
+        missing_columns = (set(COLUMNS_TO_RENAME[data_type]) | set(COLUMNS_TO_KEEP[data_type])
+                           | set(VALUE_COLUMNS)) - set(df.columns)
+        if missing_columns:
+            raise BadCsvExport(f'there are no columns {sorted(missing_columns)} in {file_name}')
+        return df
 
     def _get_countries(self, data_type: Data_Type) -> None:
         """
@@ -230,17 +351,19 @@ class FluxysDataFrame:
             self._df[['from_country', 'to_country']] = ['BE', 'BE']
             self._df['delivery_point'] = self._df['Balancing Zone '] + '_' + self._df['Client Type']
         else:
-            self._df[['from_country', 'to_country']] = self._df.apply(lambda row: pd.Series(
-                [
-                    POINTS_COUNTRIES[row['Interconnection Point']]['from'],
-                    POINTS_COUNTRIES[row['Interconnection Point']]['to']
-                ]), axis=1)
+            points = self._df['Interconnection Point']
+            unknown_points = set(points.unique()) - POINTS_COUNTRIES.keys()
+            if unknown_points:
+                raise KeyError(f'there are no countries in POINTS_COUNTRIES for interconnection points: '
+                               f'{sorted(map(str, unknown_points))}')
+            self._df['from_country'] = points.map(FROM_COUNTRIES)
+            self._df['to_country'] = points.map(TO_COUNTRIES)
 
     def _rename_columns(self, data_type: Data_Type) -> None:
         """
         renames columns as set in database
         """
-        self._df = self._df.rename(columns=self._columns_to_rename[data_type])
+        self._df = self._df.rename(columns=COLUMNS_TO_RENAME[data_type])
 
     def _change_view(self) -> None:
         """
@@ -270,10 +393,15 @@ class FluxysDataFrame:
         """
         extracts nomination type and puts it in curve_name column
         """
-        self._df[['curve_name', 'flow_type']] = self._df.apply(lambda row: pd.Series([
-            f'{row.curve_name}_{row.flow_type[:row.flow_type.rfind("_")]}',
-            'nomination']) if row.flow_type.find('nominations') != -1
-            else pd.Series([row.curve_name, row.flow_type]), axis=1)
+        flow_types = self._df['flow_type']
+        nominations = flow_types.str.contains('nominations', regex=False)
+        # nomination type is computed once for every distinct flow_type ('final_nominations' -> 'final')
+        nomination_types = {flow_type: flow_type[:flow_type.rfind('_')]
+                            for flow_type in flow_types[nominations].unique()}
+        # missing curve_name is written as 'nan' as when it is formatted into a string
+        self._df.loc[nominations, 'curve_name'] = (self._df.loc[nominations, 'curve_name'].fillna('nan') + '_'
+                                                   + flow_types[nominations].map(nomination_types))
+        self._df.loc[nominations, 'flow_type'] = 'nomination'
 
     @property
     def data_frame(self) -> pd.DataFrame:
@@ -284,16 +412,37 @@ class FluxysDataFrame:
 
 
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='collects Fluxys data')
+    arg_parser.add_argument('--output-format', choices=get_args(Output_Format), default='parquet',
+                            help='parquet files partitioned by data type and year or one file for every data type')
+    arg_parser.add_argument('--no-parse-cache', action='store_true',
+                            help='parse all files again instead of taking unchanged files from the parse cache')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
+
     data_types = ('domestic', 'interconnection')
     data_type = data_types[0]
     folder = 'parsed_data'
+    parse_cache = None if args.no_parse_cache else ParseCache(folder=f'{folder}/parse_cache')
     
     # to get all data
-    # historical_data = get_historical_data(data_type)
-    # historical_data.to_csv(f'{folder}/all_Fluxys_{data_type}.csv', index=False)
+    # historical_data = get_all_historical_data(folder=f'{folder}/checkpoints', parse_cache=parse_cache)
+    # for data_type, df in historical_data.items():
+    #     if args.output_format == 'parquet':
+    #         write_parsed(df, source='Fluxys', data_type=data_type, folder=f'{folder}/parquet')
+    #     elif args.output_format == 'csv':
+    #         df.to_csv(f'{folder}/all_Fluxys_{data_type}.csv', index=False)
+    #     else:
+    #         df.to_excel(f'{folder}/all_Fluxys_{data_type}.xlsx', index=False)
     
     # to get current data
-    current_data = get_current_data(data_type)
+    current_data = get_current_data(data_type, parse_cache=parse_cache)
     current_date = date.today().strftime('%d.%m.%Y')
-    current_data.to_csv(f'{folder}/Fluxys_{data_type}_{current_date}.csv', index=False)
+    if args.output_format == 'parquet':
+        write_parsed(current_data, source='Fluxys', data_type=data_type, folder=f'{folder}/parquet')
+    elif args.output_format == 'csv':
+        current_data.to_csv(f'{folder}/Fluxys_{data_type}_{current_date}.csv', index=False)
+    else:
+        current_data.to_excel(f'{folder}/Fluxys_{data_type}_{current_date}.xlsx', index=False)
  
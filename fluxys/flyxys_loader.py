@@ -1,19 +1,66 @@
 import sys
 import os
+import argparse
 import pandas as pd
+from datetime import date
 sys.path.insert(1, os.path.join(sys.path[0], '../GRTgaz'))
 from grtgaz_loader import *
+from watermarks import WatermarkStore, OVERLAP_DAYS
+from profiling import add_profile_argument, start_profiling
+from parsed_storage import iter_parsed
+from fluxys_collector import FluxysCollector
+from fluxys_processor import collect_data
 
 
-additional_columns['source'] = 'Fluxys'
+SOURCE = 'Fluxys'
+
+
+def load_incremental(store: WatermarkStore, overlap: int = OVERLAP_DAYS,
+                     data_types=('domestic', 'interconnection'), start_date: date = date(2015, 1, 1)):
+    """
+    collects and inserts data of every data type from its watermark minus overlap days till today,
+    the watermark is moved only when data is inserted
+    """
+    loader = GRTgazLoader(source=SOURCE)
+    with FluxysCollector() as collector:
+        for data_type in data_types:
+            store.run(source=SOURCE, data_type=data_type,
+                      fetch=lambda start, end: collect_data(data_type=data_type, start_date=start, end_date=end,
+                                                            collector=collector),
+                      load=loader.insert_grtgaz, default_start=start_date, overlap=overlap)
 
 
 if __name__ == '__main__':
-    data_types = ('domestic', 'interconnection')
-    data_type = data_types[0]
-    folder = 'parsed_data'
-    
-    
-    result = pd.read_csv(f'{folder}/all_Fluxys_{data_type}.csv', index_col=False)
-    GRTgazLoader().insert_grtgaz(df_fs=result)
-    
+    arg_parser = argparse.ArgumentParser(description='loads Fluxys data into the database')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='collect and load data from the last loaded gas day minus overlap till today')
+    arg_parser.add_argument('--overlap', type=int, default=OVERLAP_DAYS,
+                            help='days before the last loaded gas day to collect again')
+    arg_parser.add_argument('--state-file', default='parsed_data/watermarks.json',
+                            help='file with the last loaded gas days')
+    arg_parser.add_argument('--input-format', choices=('csv', 'parquet'), default='parquet',
+                            help='format of parsed data written by fluxys_processor.py')
+    arg_parser.add_argument('--start-date', type=date.fromisoformat, default=None,
+                            help='first gas day to load from parquet files (YYYY-MM-DD)')
+    arg_parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help='last gas day to load from parquet files (YYYY-MM-DD)')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
+
+    if args.incremental:
+        load_incremental(WatermarkStore(args.state_file), overlap=args.overlap)
+    else:
+        data_types = ('domestic', 'interconnection')
+        data_type = data_types[0]
+        folder = 'parsed_data'
+
+        if args.input_format == 'parquet':
+            GRTgazLoader(source=SOURCE).insert_batches(iter_parsed(SOURCE, data_type, columns=loader_columns,
+                                                                   start_date=args.start_date,
+                                                                   end_date=args.end_date,
+                                                                   folder=f'{folder}/parquet'))
+        else:
+            result = pd.read_csv(f'{folder}/all_Fluxys_{data_type}.csv', index_col=False)
+            GRTgazLoader(source=SOURCE).insert_grtgaz(df_fs=result)
+    connect.close()
@@ -0,0 +1,643 @@
+"""
+runs collection and loading of several sources at once, for example from cron:
+
+    python gpe.py run --sources grtgaz,fluxys,ng,42fs --mode incremental
+
+jobs of all sources work in one process, so they share the DB connection pool and the dimension cache,
+the exit status is 1 if any job failed;
+or runs the sources again and again with their intervals and keeps everything warm between runs:
+
+    python gpe.py daemon --interval grtgaz=3600 --interval fluxys=3600 --port 8321
+
+with health (/health) and metrics (/metrics) of the runs on the local port;
+metrics of the run (time of stages, bytes, rows, DB round trips, cache hits) are written
+to a JSON file and to a Prometheus textfile collector file;
+with --query-stats statements sent to the database are counted by statement and by loader method:
+
+    python gpe.py run --sources grtgaz --mode current --query-stats 500 --explain 3
+"""
+import os
+import re
+import sys
+import json
+import glob
+import time
+import signal
+import argparse
+import importlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, timedelta
+from dataclasses import asdict, dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Literal, Mapping, Optional, Tuple, get_args
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_FOLDERS: Mapping[str, str] = {'grtgaz': 'GRTgaz', 'fluxys': 'fluxys', 'ng': 'national_grid', '42fs': '42fs'}
+for source_folder in SOURCE_FOLDERS.values():
+    sys.path.insert(1, os.path.join(ROOT, source_folder))
+
+import pandas as pd
+from loguru import logger
+from connection import connect, get_engine
+from watermarks import WatermarkStore, OVERLAP_DAYS
+from parse_cache import ParseCache
+from parsed_storage import write_parsed
+from dimension_cache import dimensions
+from metrics import metrics
+from query_stats import QueryStats, REPEAT_THRESHOLD
+from profiling import add_profile_argument, start_profiling
+
+Source = Literal['grtgaz', 'fluxys', 'ng', '42fs']
+Mode = Literal['current', 'historical', 'incremental']
+SOURCES: Tuple['Source', ...] = get_args(Source)
+# names of the sources in metrics, the same as in the database
+SOURCE_NAMES: Mapping['Source', str] = {'grtgaz': 'GRTgaz', 'fluxys': 'Fluxys', 'ng': 'NationalGrid', '42fs': '42fs'}
+# jobs of one source working at the same time
+# (every Fluxys job starts a browser, National Grid files are parsed by several processes)
+SOURCE_LIMITS: Mapping['Source', int] = {'grtgaz': 3, 'fluxys': 1, 'ng': 1, '42fs': 2}
+CURRENT_DAYS = 2  # days before today collected in current mode
+# 42 Financial Services workbooks are put here by hand
+WORKBOOKS_FOLDER = os.path.join(ROOT, '42fs')
+# seconds between runs of the source in daemon mode
+DAEMON_INTERVALS: Mapping['Source', int] = {'grtgaz': 3600, 'fluxys': 3600, 'ng': 3600, '42fs': 86400}
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 8321
+# failed runs of one source in a row after which the daemon is reported unhealthy
+UNHEALTHY_FAILURES = 3
+METRICS_FOLDER = os.path.join(ROOT, 'metrics')
+METRICS_TEXTFILE = os.path.join(METRICS_FOLDER, 'gpe.prom')
+
+
+def data_folder(source: Source, data_root: str = None) -> str:
+    """
+    returns the folder with parsed data, checkpoints, caches and watermarks of the source
+    (parsed_data next to the code of the source by default, as the loaders of the sources use it)
+    """
+    if data_root is None:
+        return os.path.join(ROOT, SOURCE_FOLDERS[source], 'parsed_data')
+    return os.path.join(os.path.abspath(data_root), source)
+
+
+@dataclass
+class JobResult:
+    source: str
+    name: str
+    ok: bool
+    rows: int
+    seconds: float
+    error: str = ''
+
+
+class Job:
+    """
+    class to collect and load one data type of the source
+    """
+    def __init__(self, source: Source, name: str, run: Callable[['Job'], None]):
+        self.source = source
+        self.name = name
+        self.rows = 0
+        self._run = run
+
+    def counted(self, load: Callable[[pd.DataFrame], object]) -> Callable[[pd.DataFrame], object]:
+        """
+        returns load which also counts loaded rows
+        """
+        def load_and_count(df: pd.DataFrame):
+            result = load(df)
+            self.rows += len(df.index)
+            return result
+        return load_and_count
+
+    def run(self, limit: threading.Semaphore) -> JobResult:
+        """
+        runs the job when less than the limit of jobs of the source are running,
+        errors are returned in the result and do not stop other jobs
+        (all metrics counted by the job are labeled with its source)
+        """
+        with limit, metrics.labels(source=SOURCE_NAMES[self.source]):
+            start = time.perf_counter()
+            logger.info(f'{self.source} {self.name}: started')
+            try:
+                self._run(self)
+            # loaders exit on insert errors
+            except (Exception, SystemExit) as error:
+                logger.exception(f'{self.source} {self.name}: failed')
+                return JobResult(self.source, self.name, ok=False, rows=self.rows,
+                                 seconds=time.perf_counter() - start, error=repr(error))
+            seconds = time.perf_counter() - start
+            logger.info(f'{self.source} {self.name}: {self.rows} rows loaded in {seconds:.1f} s')
+            return JobResult(self.source, self.name, ok=True, rows=self.rows, seconds=seconds)
+
+
+def write_metrics(json_file: str = None, textfile: str = None, results: List[JobResult] = ()) -> None:
+    """
+    writes metrics of the process and results of the jobs, errors of writing do not fail the run
+    """
+    try:
+        metrics.write(json_file, textfile, results=[asdict(result) for result in results])
+    except OSError:
+        logger.exception('Metrics were not written')
+
+
+class Resources:
+    """
+    class to keep HTTP sessions and browsers between runs,
+    the daemon keeps them warm for its whole life, a single run closes them at its end
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http_sessions = {}
+        self._fluxys_collectors = {}
+
+    def http_session(self, source: Source):
+        """
+        returns HTTP session of the source, the session is shared by all jobs of the source
+        """
+        import requests
+        with self._lock:
+            if source not in self._http_sessions:
+                self._http_sessions[source] = requests.Session()
+            return self._http_sessions[source]
+
+    def fluxys_collector(self, data_type: str, path_to_save: str):
+        """
+        returns the browser of the data type, it is started on first use and its page is kept open
+        """
+        from fluxys_collector import FluxysCollector
+        with self._lock:
+            if data_type not in self._fluxys_collectors:
+                self._fluxys_collectors[data_type] = FluxysCollector(path_to_save=path_to_save)
+            return self._fluxys_collectors[data_type]
+
+    def discard_fluxys_collector(self, data_type: str) -> None:
+        """
+        closes the browser of the data type (after errors), the next run starts a new one
+        """
+        with self._lock:
+            collector = self._fluxys_collectors.pop(data_type, None)
+        if collector is not None:
+            try:
+                collector.close()
+            except Exception:
+                logger.exception(f'fluxys {data_type}: browser was not closed')
+
+    def close(self) -> None:
+        for data_type in list(self._fluxys_collectors):
+            self.discard_fluxys_collector(data_type)
+        with self._lock:
+            for http_session in self._http_sessions.values():
+                http_session.close()
+            self._http_sessions.clear()
+
+
+def grtgaz_jobs(mode: Mode, overlap: int, resources: Resources, data_root: str = None) -> List[Job]:
+    from grtgaz_parser import GRTgazParser, DATA_TYPES
+    from grtgaz_loader import GRTgazLoader
+    from raw_archive import RawArchive
+
+    folder = data_folder('grtgaz', data_root)
+    os.makedirs(folder, exist_ok=True)
+    store = WatermarkStore(os.path.join(folder, 'watermarks.json'))
+    archive = RawArchive(folder=os.path.join(folder, 'raw_archive'), offline=False)
+    parse_cache = ParseCache(folder=os.path.join(folder, 'parse_cache'))
+
+    def run(job: Job, data_type: str) -> None:
+        load = job.counted(GRTgazLoader(source='GRTgaz').insert_grtgaz)
+        parser = GRTgazParser(data_type, session=resources.http_session('grtgaz'), archive=archive,
+                              parse_cache=parse_cache, folder=folder)
+        match mode:
+            case 'current':
+                load(parser.get_current_data())
+            case 'historical':
+                df = parser.get_historical_data(folder=os.path.join(folder, 'checkpoints'))
+                write_parsed(df, source='GRTgaz', data_type=data_type, folder=os.path.join(folder, 'parquet'))
+                load(df)
+            case 'incremental':
+                store.run(source='GRTgaz', data_type=data_type, fetch=parser.get_data_between, load=load,
+                          default_start=date(2015, 4, 1), overlap=overlap)
+
+    return [Job('grtgaz', data_type, lambda job, data_type=data_type: run(job, data_type))
+            for data_type in DATA_TYPES]
+
+
+def fluxys_jobs(mode: Mode, overlap: int, resources: Resources, data_root: str = None) -> List[Job]:
+    from fluxys_processor import collect_data, get_historical_data
+    from grtgaz_loader import GRTgazLoader
+    from flyxys_loader import SOURCE
+
+    folder = data_folder('fluxys', data_root)
+    os.makedirs(folder, exist_ok=True)
+    store = WatermarkStore(os.path.join(folder, 'watermarks.json'))
+    parse_cache = ParseCache(folder=os.path.join(folder, 'parse_cache'))
+
+    def run(job: Job, data_type: str) -> None:
+        load = job.counted(GRTgazLoader(source=SOURCE).insert_grtgaz)
+        # every job downloads into its own folder
+        downloads = os.path.join(folder, 'downloads', data_type)
+        os.makedirs(downloads, exist_ok=True)
+        collector = resources.fluxys_collector(data_type, downloads)
+        fetch = lambda start, end: collect_data(data_type=data_type, start_date=start, end_date=end,
+                                                collector=collector, parse_cache=parse_cache)
+        try:
+            match mode:
+                case 'current':
+                    load(fetch(date.today() - timedelta(days=CURRENT_DAYS), date.today()))
+                case 'historical':
+                    df = get_historical_data(data_type, folder=os.path.join(folder, 'checkpoints'),
+                                             collector=collector, parse_cache=parse_cache)
+                    write_parsed(df, source=SOURCE, data_type=data_type, folder=os.path.join(folder, 'parquet'))
+                    load(df)
+                case 'incremental':
+                    store.run(source=SOURCE, data_type=data_type, fetch=fetch, load=load,
+                              default_start=date(2015, 1, 1), overlap=overlap)
+        except BaseException:
+            # the browser may be broken, a new one is started next time
+            resources.discard_fluxys_collector(data_type)
+            raise
+
+    return [Job('fluxys', data_type, lambda job, data_type=data_type: run(job, data_type))
+            for data_type in ('domestic', 'interconnection')]
+
+
+def ng_jobs(mode: Mode, overlap: int, resources: Resources, data_root: str = None) -> List[Job]:
+    from national_grid_collector import urls
+    from national_grid_loader import NationalGridLoader, additional_columns, fetch_between
+
+    folder = data_folder('ng', data_root)
+    os.makedirs(folder, exist_ok=True)
+    store = WatermarkStore(os.path.join(folder, 'watermarks.json'))
+    parse_cache = ParseCache(folder=os.path.join(folder, 'parse_cache'))
+    file_name = os.path.join(folder, 'NG')
+    source, data_type = additional_columns['source'], additional_columns['flow_type']
+    first_day = date(min(urls), 4, 1)
+
+    def run(job: Job) -> None:
+        load = job.counted(NationalGridLoader().insert_national_grid)
+        fetch = lambda start, end: fetch_between(file_name, start, end, parse_cache=parse_cache)
+        match mode:
+            case 'current':
+                load(fetch(date.today() - timedelta(days=CURRENT_DAYS), date.today()))
+            case 'historical':
+                df = fetch(first_day, date.today())
+                write_parsed(df, source=source, data_type=data_type, folder=os.path.join(folder, 'parquet'))
+                load(df)
+            case 'incremental':
+                store.run(source=source, data_type=data_type, fetch=fetch, load=load,
+                          default_start=first_day, overlap=overlap)
+
+    return [Job('ng', data_type, run)]
+
+
+def workbook_year(file_name: str) -> Optional[int]:
+    """
+    returns the year of the 42 Financial Services workbook from its name (ClosingDayPricesGAS2023.xlsx),
+    None if the name has no year
+    """
+    match = re.search(r'(\d{4})\.xlsx$', os.path.basename(file_name))
+    return int(match.group(1)) if match else None
+
+
+def fs42_jobs(mode: Mode, overlap: int, resources: Resources, data_root: str = None) -> List[Job]:
+    # module name starts with a digit, so it can not be imported by the import statement
+    loader_module = importlib.import_module('42fs_loader')
+    from gas_parser import GASParser
+    from power_parser import POWERParser
+
+    folder = data_folder('42fs', data_root)
+    os.makedirs(folder, exist_ok=True)
+    store = WatermarkStore(os.path.join(folder, 'watermarks.json'))
+    parse_cache = ParseCache(folder=os.path.join(folder, 'parse_cache'))
+    parsers = {'gas': (GASParser, 'ClosingDayPricesGAS*.xlsx'), 'power': (POWERParser, 'ClosingDayPricesPOWER*.xlsx')}
+
+    def run(job: Job, market_type: str) -> None:
+        parser, pattern = parsers[market_type]
+        # workbooks are named by years, the last one is the newest
+        file_names = sorted(glob.glob(os.path.join(WORKBOOKS_FOLDER, pattern)))
+        if not file_names:
+            raise FileNotFoundError(f'there are no files {pattern} in {WORKBOOKS_FOLDER}')
+        parse = lambda file_name: parser(file_name, parse_cache=parse_cache).df
+        load = job.counted(lambda df: loader_module.Loader42fs().insert_42fs(df_fs=df, market_type=market_type))
+        match mode:
+            case 'current':
+                load(parse(file_names[-1]))
+            case 'historical':
+                for file_name in file_names:
+                    load(parse(file_name))
+            case 'incremental':
+                def fetch(start: date, end: date) -> pd.DataFrame:
+                    # the window can start in the workbook of the previous year
+                    # (workbooks without a year in the name are always read)
+                    dfs = [parse(file_name) for file_name in file_names
+                           if workbook_year(file_name) is None or start.year <= workbook_year(file_name) <= end.year]
+                    if not dfs:
+                        return pd.DataFrame()
+                    df = pd.concat(dfs, sort=False, axis=0, ignore_index=True)
+                    return df.loc[pd.to_datetime(df['date']).between(pd.Timestamp(start), pd.Timestamp(end))]
+                store.run(source='42fs', data_type=market_type, fetch=fetch, load=load,
+                          default_start=date(2015, 1, 1), overlap=overlap)
+
+    return [Job('42fs', market_type, lambda job, market_type=market_type: run(job, market_type))
+            for market_type in parsers]
+
+
+SOURCE_JOBS: Mapping['Source', Callable[..., List[Job]]] = {
+    'grtgaz': grtgaz_jobs, 'fluxys': fluxys_jobs, 'ng': ng_jobs, '42fs': fs42_jobs}
+
+
+def run(sources: List[Source], mode: Mode, overlap: int = OVERLAP_DAYS, limits: Mapping['Source', int] = None,
+        workers: int = None, data_root: str = None, resources: Resources = None) -> List[JobResult]:
+    """
+    runs jobs of all sources at the same time,
+    at most limits[source] jobs of one source and at most workers jobs at all
+    (HTTP sessions and browsers are taken from resources, if it is None they are closed at the end)
+    """
+    if resources is None:
+        resources = Resources()
+        try:
+            return run(sources, mode, overlap=overlap, limits=limits, workers=workers, data_root=data_root,
+                       resources=resources)
+        finally:
+            resources.close()
+    limits = {**SOURCE_LIMITS, **(limits or {})}
+    jobs: List[Job] = []
+    results: List[JobResult] = []
+    for source in sources:
+        try:
+            jobs.extend(SOURCE_JOBS[source](mode, overlap, resources=resources, data_root=data_root))
+        except Exception as error:
+            logger.exception(f'{source}: jobs were not created')
+            results.append(JobResult(source, mode, ok=False, rows=0, seconds=0, error=repr(error)))
+    if not jobs:
+        return results
+    semaphores: Dict[str, threading.Semaphore] = {source: threading.Semaphore(limits[source]) for source in sources}
+    with ThreadPoolExecutor(max_workers=workers or len(jobs), thread_name_prefix='gpe') as executor:
+        results.extend(executor.map(lambda job: job.run(semaphores[job.source]), jobs))
+    return results
+
+
+def print_summary(results: List[JobResult]) -> None:
+    print(f'{"source":<8} {"job":<16} {"status":<7} {"rows":>10} {"seconds":>9}  error')
+    for result in results:
+        status = 'ok' if result.ok else 'failed'
+        print(f'{result.source:<8} {result.name:<16} {status:<7} {result.rows:>10} {result.seconds:>9.1f}  '
+              f'{result.error}')
+    print(f'{sum(result.ok for result in results)} of {len(results)} jobs succeeded, '
+          f'{sum(result.rows for result in results)} rows loaded, '
+          f'{len(dimensions)} dictionary ids cached ({dimensions.hits} hits, {dimensions.misses} misses)')
+
+
+@dataclass
+class SourceState:
+    interval: float
+    next_run: float
+    running: bool = False
+    runs: int = 0
+    failures: int = 0
+    failures_in_row: int = 0
+    last_start: Optional[float] = None
+    last_seconds: Optional[float] = None
+    last_rows: Optional[int] = None
+    last_ok: Optional[bool] = None
+    last_error: str = ''
+
+
+class Daemon:
+    """
+    class to run every source again and again with its interval in one process,
+    the DB engine, the reflected schema, the dimension cache, HTTP sessions and browsers
+    are kept between runs, so a run takes little more than the download
+    """
+    def __init__(self, sources: List[Source], mode: Mode = 'incremental', intervals: Mapping['Source', float] = None,
+                 overlap: int = OVERLAP_DAYS, limits: Mapping['Source', int] = None, data_root: str = None,
+                 metrics_json: str = None, metrics_textfile: str = None):
+        """
+        metrics_json, metrics_textfile: files rewritten with metrics after every run of a source
+        """
+        intervals = {**DAEMON_INTERVALS, **(intervals or {})}
+        self.mode = mode
+        self.overlap = overlap
+        self.limits = limits
+        self.data_root = data_root
+        self.metrics_json = metrics_json
+        self.metrics_textfile = metrics_textfile
+        self.started = time.time()
+        self.states: Dict[str, SourceState] = {source: SourceState(interval=intervals[source], next_run=self.started)
+                                               for source in sources}
+        self.resources = Resources()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _run_source(self, source: Source) -> None:
+        state = self.states[source]
+        start = time.time()
+        results: List[JobResult] = []
+        try:
+            results = run([source], self.mode, overlap=self.overlap, limits=self.limits, data_root=self.data_root,
+                          resources=self.resources)
+        except Exception as error:
+            logger.exception(f'{source}: run failed')
+            results = [JobResult(source, self.mode, ok=False, rows=0, seconds=0, error=repr(error))]
+        finally:
+            ok = bool(results) and all(result.ok for result in results)
+            with self._lock:
+                state.running = False
+                state.runs += 1
+                state.last_seconds = time.time() - start
+                state.last_rows = sum(result.rows for result in results)
+                state.last_ok = ok
+                state.last_error = '; '.join(f'{result.name}: {result.error}' for result in results if not result.ok)
+                state.failures += not ok
+                state.failures_in_row = 0 if ok else state.failures_in_row + 1
+                # runs start every interval, a run longer than the interval is followed by the next one at once
+                state.next_run = start + state.interval
+            write_metrics(self.metrics_json, self.metrics_textfile, results)
+
+    def serve_forever(self, poll_interval: float = 1.0) -> None:
+        """
+        starts runs of the sources when they are due until stop() is called,
+        waits for running runs and closes browsers and HTTP sessions at the end
+        """
+        with ThreadPoolExecutor(max_workers=len(self.states), thread_name_prefix='gpe-daemon') as executor:
+            while not self._stop.is_set():
+                now = time.time()
+                for source, state in self.states.items():
+                    with self._lock:
+                        due = not state.running and state.next_run <= now
+                        if due:
+                            state.running = True
+                            state.last_start = now
+                    if due:
+                        executor.submit(self._run_source, source)
+                self._stop.wait(poll_interval)
+            logger.info('Daemon is stopping, waiting for running sources')
+        self.resources.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def health(self) -> Tuple[bool, Mapping[str, Any]]:
+        """
+        returns if the daemon is healthy (no source failed UNHEALTHY_FAILURES times in a row) and states of sources
+        """
+        with self._lock:
+            sources = {source: asdict(state) for source, state in self.states.items()}
+        healthy = all(state['failures_in_row'] < UNHEALTHY_FAILURES for state in sources.values())
+        return healthy, {'status': 'ok' if healthy else 'failing', 'mode': self.mode,
+                         'uptime_seconds': round(time.time() - self.started, 1), 'sources': sources,
+                         'dimension_cache': {'ids': len(dimensions), 'hits': dimensions.hits,
+                                             'misses': dimensions.misses}}
+
+    def metrics(self) -> str:
+        """
+        returns metrics of runs and of the process in Prometheus text format
+        """
+        lines = ['# TYPE gpe_uptime_seconds gauge', f'gpe_uptime_seconds {time.time() - self.started:.1f}']
+        with self._lock:
+            states = {source: asdict(state) for source, state in self.states.items()}
+        for name, field, metric_type in (('gpe_source_runs_total', 'runs', 'counter'),
+                                         ('gpe_source_failures_total', 'failures', 'counter'),
+                                         ('gpe_source_last_success', 'last_ok', 'gauge'),
+                                         ('gpe_source_last_run_timestamp_seconds', 'last_start', 'gauge'),
+                                         ('gpe_source_last_run_duration_seconds', 'last_seconds', 'gauge'),
+                                         ('gpe_source_last_run_rows', 'last_rows', 'gauge')):
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(f'{name}{{source="{source}"}} {float(state[field])}'
+                         for source, state in states.items() if state[field] is not None)
+        # hits and misses of the dimension cache are counted by metrics
+        lines.extend(['# TYPE gpe_dimension_cache_ids gauge', f'gpe_dimension_cache_ids {len(dimensions)}'])
+        return '\n'.join(lines) + '\n' + metrics.to_prometheus()
+
+
+def serve_status(daemon: Daemon, host: str = DAEMON_HOST, port: int = DAEMON_PORT) -> ThreadingHTTPServer:
+    """
+    starts HTTP server with health (/health, JSON) and metrics (/metrics, Prometheus text) of the daemon
+    in a background thread
+    """
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match self.path.split('?')[0]:
+                case '/health':
+                    healthy, state = daemon.health()
+                    self._send(200 if healthy else 503, 'application/json', json.dumps(state, indent=1))
+                case '/metrics':
+                    self._send(200, 'text/plain; version=0.0.4', daemon.metrics())
+                case _:
+                    self._send(404, 'text/plain', 'not found\n')
+
+        def _send(self, status: int, content_type: str, body: str) -> None:
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(f'{self.address_string()} {format % args}')
+
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    threading.Thread(target=server.serve_forever, name='gpe-status', daemon=True).start()
+    logger.info(f'Health and metrics are served on http://{host}:{server.server_port}')
+    return server
+
+
+def parse_sources(value: str) -> List[Source]:
+    sources = [source.strip() for source in value.split(',') if source.strip()]
+    unknown = sorted(set(sources) - set(SOURCES))
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown sources {unknown}, choose from {list(SOURCES)}')
+    return list(dict.fromkeys(sources))
+
+
+def parse_source_number(value: str) -> Tuple[str, int]:
+    source, _, number = value.partition('=')
+    if source not in SOURCES or not number.isdigit() or int(number) < 1:
+        raise argparse.ArgumentTypeError(f'value must be SOURCE=N with SOURCE from {list(SOURCES)} and N > 0')
+    return source, int(number)
+
+
+def add_common_arguments(parser: argparse.ArgumentParser, default_mode: Mode) -> None:
+    parser.add_argument('--sources', type=parse_sources, default=list(SOURCES),
+                        help=f'comma separated sources (default {",".join(SOURCES)})')
+    parser.add_argument('--mode', choices=get_args(Mode), default=default_mode,
+                        help='past two days, all data or data from the last loaded gas day minus overlap')
+    parser.add_argument('--overlap', type=int, default=OVERLAP_DAYS,
+                        help='days before the last loaded gas day to collect again in incremental mode')
+    parser.add_argument('--limit', type=parse_source_number, action='append', default=[],
+                        help='jobs of the source running at the same time, e.g. fluxys=2 '
+                             f'(default {", ".join(f"{s}={n}" for s, n in SOURCE_LIMITS.items())})')
+    parser.add_argument('--data-root', default=None,
+                        help='folder for data of all sources (default parsed_data next to every source)')
+    parser.add_argument('--metrics-textfile', default=METRICS_TEXTFILE,
+                        help='Prometheus textfile collector file written with metrics of the run '
+                             '(e.g. into the textfile directory of node_exporter)')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='collects and loads data of several sources at once')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='collect and load data once')
+    add_common_arguments(run_parser, default_mode='incremental')
+    run_parser.add_argument('--workers', type=int, default=None,
+                            help='jobs running at the same time (default all jobs)')
+    run_parser.add_argument('--metrics-json', default=None,
+                            help='JSON file written with metrics of the run (default metrics/run_<time>.json)')
+    run_parser.add_argument('--query-stats', type=int, nargs='?', const=REPEAT_THRESHOLD, default=None,
+                            metavar='N',
+                            help='count statements sent to the database and report statements executed more '
+                                 f'than N times (default {REPEAT_THRESHOLD}) into metrics/queries_<time>.json')
+    run_parser.add_argument('--explain', type=int, default=0, metavar='TOP',
+                            help='with --query-stats, EXPLAIN (ANALYZE, BUFFERS) TOP most frequent statements '
+                                 'in transactions which are rolled back')
+    add_profile_argument(run_parser)
+    daemon_parser = commands.add_parser('daemon', help='collect and load data with intervals until stopped')
+    add_common_arguments(daemon_parser, default_mode='incremental')
+    daemon_parser.add_argument('--interval', type=parse_source_number, action='append', default=[],
+                               help='seconds between runs of the source, e.g. grtgaz=1800 '
+                                    f'(default {", ".join(f"{s}={n}" for s, n in DAEMON_INTERVALS.items())})')
+    daemon_parser.add_argument('--host', default=DAEMON_HOST, help='address of health and metrics endpoints')
+    daemon_parser.add_argument('--port', type=int, default=DAEMON_PORT, help='port of health and metrics endpoints')
+    daemon_parser.add_argument('--metrics-json', default=os.path.join(METRICS_FOLDER, 'daemon.json'),
+                               help='JSON file rewritten with metrics after every run of a source')
+    args = arg_parser.parse_args()
+
+    limits = dict(args.limit)
+    workers = getattr(args, 'workers', None) or sum({**SOURCE_LIMITS, **limits}[source] for source in args.sources)
+    # every running job uses two sessions: ids are resolved while data is inserted
+    os.environ.setdefault('DATABASE_POOL_SIZE', str(2 * workers))
+    if args.command == 'daemon':
+        daemon = Daemon(args.sources, mode=args.mode, intervals=dict(args.interval), overlap=args.overlap,
+                        limits=limits, data_root=args.data_root, metrics_json=args.metrics_json,
+                        metrics_textfile=args.metrics_textfile)
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *_: daemon.stop())
+        status_server = serve_status(daemon, host=args.host, port=args.port)
+        try:
+            daemon.serve_forever()
+        finally:
+            status_server.shutdown()
+            connect.close()
+        sys.exit(0)
+
+    started = datetime.now()
+    start_profiling(args.profile)
+    query_stats = None
+    if args.query_stats is not None:
+        query_stats = QueryStats(threshold=args.query_stats)
+        query_stats.attach(get_engine())
+    try:
+        results = run(args.sources, args.mode, overlap=args.overlap, limits=limits, workers=workers,
+                      data_root=args.data_root)
+        if query_stats is not None:
+            query_stats.log_offenders()
+            if args.explain:
+                query_stats.explain(top=args.explain)
+            query_stats.detach()
+            query_stats.write(os.path.join(METRICS_FOLDER, f'queries_{started:%Y%m%d_%H%M%S}.json'))
+    finally:
+        connect.close()
+    metrics_json = args.metrics_json or os.path.join(METRICS_FOLDER, f'run_{started:%Y%m%d_%H%M%S}.json')
+    write_metrics(metrics_json, args.metrics_textfile, results)
+    print_summary(results)
+    sys.exit(0 if results and all(result.ok for result in results) else 1)
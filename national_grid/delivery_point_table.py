@@ -1,7 +1,8 @@
 import os
 import sys
 sys.path.insert(1, os.path.join(sys.path[0], '../GRTgaz'))
-from connection import engine, base, session
+from connection import get_engine, get_session
+from table_classes import get_table
 from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 
@@ -9,10 +10,10 @@ from datetime import datetime
 class DeliveryPointDict:
     def __init__(self):
         # delivery_point_dict
-        self._delivery_point_dict = base.classes.delivery_point_dict
+        self._delivery_point_dict = get_table('delivery_point_dict')
 
     def search_data(self, id_type: int, id_country: int, id_source: int, point_name: str):
-        search_record = session.query(
+        search_record = get_session().query(
             self._delivery_point_dict.id).filter(
             self._delivery_point_dict.id_type == id_type,
             self._delivery_point_dict.id_country == id_country,
@@ -35,7 +36,7 @@ class DeliveryPointDict:
                                  f'\npoint_name = {point_name}')
 
     def insert_new_data(self, id_type: int, id_country: int, id_source: int, point_name: str):
-        insert_statement = insert(self._delivery_point_dict, bind=engine).values(
+        insert_statement = insert(self._delivery_point_dict, bind=get_engine()).values(
             id_type=id_type,
             id_country=id_country,
             id_source=id_source,
@@ -47,6 +48,6 @@ class DeliveryPointDict:
             index_elements=['point_name', 'id_type'],
             set_={'update_time': insert_statement.excluded.update_time},
         )
-        inserted_row = session.execute(update_statement)
-        session.commit()
+        inserted_row = get_session().execute(update_statement)
+        get_session().commit()
         return inserted_row.inserted_primary_key[0]
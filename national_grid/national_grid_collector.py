@@ -1,9 +1,17 @@
+import os
+import sys
+import random
 import requests
+from dataclasses import dataclass
 from datetime import date
-from typing import Mapping
+from typing import Iterable, Mapping, Optional
+from urllib.parse import urlsplit
 import asyncio
-import aiohttp
 from loguru import logger
+sys.path.insert(1, os.path.join(sys.path[0], '../GRTgaz'))
+from backfill import Backfill
+from raw_archive import RawArchive, ArchiveMiss, is_closed_period
+from metrics import metrics
 
 urls: Mapping[int, str] = {
     2015: 'https://www.nationalgas.com/document/69706/download',
@@ -17,50 +25,208 @@ urls: Mapping[int, str] = {
     2023: 'https://www.nationalgas.com/document/130966/download'
     }
 
+# the last gas day in the files of urls (the file of the year has data till the end of March of the next year)
+LAST_GAS_DAY = date(max(urls) + 1, 3, 31)
 
-async def fetch(session: aiohttp.ClientSession, year: int) -> tuple[bytes, int]:
-    async with session.get(url=urls[year], ssl=False) as result:
-        return await result.read(), year
+# set it to collect from another server (e.g. the fixture server of benchmarks/fixture_server.py),
+# paths of urls are requested from it
+BASE_URL_ENV_VAR = 'NATIONAL_GRID_BASE_URL'
 
+CONCURRENCY = 4  # files downloaded at once
+TIMEOUT = 300  # seconds for one request
+RETRIES = 3
+BACKOFF = 2  # seconds, the longest delay before the n-th retry is BACKOFF * 2 ** (n - 1)
+CHUNK_SIZE = 64 * 1024
 
-async def main() -> dict:
-    results = dict()
-    async with aiohttp.ClientSession() as session:
-        pending = [
-            asyncio.create_task(fetch(session, year)) for year in list(urls.keys())
-        ]
-        while pending:
-            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
-            for done_task in done:
-                if not done_task.exception():
-                    result, year = await done_task
-                    results[year] = result
-                    logger.success(f'Received data for {year} year')
-                else:
-                    logger.error(f'Error when receiving data for {year} year')
-    return results
 
+@dataclass(slots=True)
+class DownloadResult:
+    """
+    class to set the result of downloading the file for one year
+    """
+    year: int
+    file_name: str
+    size: int = 0
+    attempts: int = 0
+    error: Optional[str] = None
 
-def save_historical_data(file_name: str) -> None:
-    result = asyncio.run(main())
-    for key, value in result.items():
-        with open(f'{file_name}_{key}.xls', 'wb') as f:
-            f.write(value)
+    @property
+    def ok(self) -> bool:
+        """
+        returns True if the file is saved
+        """
+        return self.error is None
 
 
-def save_current_data(file_name: str) -> None:
-    response = requests.get(url=urls[date.today().year])
-    with open(f'{file_name}.xls', 'wb') as f:
-        f.write(response.content)
-        
-def save_current_data(file_name: str) -> None:
-    response = requests.get(url=urls[date.today().year])
-    with open(f'{file_name}.xls', 'wb') as f:
-        f.write(response.content)
+def is_closed_year(year: int) -> bool:
+    """
+    checks if the file for the year can not change anymore,
+    the file for the year has data till the end of March of the next year
+    """
+    return is_closed_period(date(year + 1, 3, 31))
+
+
+def year_url(year: int, base_url: str = None) -> str:
+    """
+    returns the URL of the file for the year on base_url
+    (default environmental variable NATIONAL_GRID_BASE_URL or the site from urls)
+    """
+    base_url = base_url or os.environ.get(BASE_URL_ENV_VAR)
+    if not base_url:
+        return urls[year]
+    return base_url.rstrip('/') + urlsplit(urls[year]).path
+
+
+async def download(session: 'aiohttp.ClientSession', url: str, file_name: str,
+                   headers: Mapping[str, str] = None) -> tuple[int, Optional[Mapping[str, str]]]:
+    """
+    streams the file from url to disk by chunks and returns its size and response headers,
+    the file is renamed to file_name only when it is fully downloaded
+    (if the server answers that the file is not modified returns size 0 and no headers)
+    """
+    temp_file_name = f'{file_name}.part'
+    size = 0
+    try:
+        async with session.get(url=url, ssl=False, headers=headers) as result:
+            if result.status == 304:
+                return size, None
+            result.raise_for_status()
+            with open(temp_file_name, 'wb') as f:
+                async for chunk in result.content.iter_chunked(CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            response_headers = dict(result.headers)
+    except BaseException:
+        if os.path.exists(temp_file_name):
+            os.unlink(temp_file_name)
+        raise
+    os.replace(temp_file_name, file_name)
+    return size, response_headers
+
+
+async def fetch(session: 'aiohttp.ClientSession', semaphore: asyncio.Semaphore, year: int, file_name: str,
+                retries: int = RETRIES, backoff: float = BACKOFF, archive: RawArchive = None,
+                base_url: str = None) -> DownloadResult:
+    """
+    downloads the file for the year into file_name,
+    failed downloads are repeated after exponential backoff with jitter
+    (if archive is set the file is taken from it when it is not changed)
+    """
+    import aiohttp
+
+    result = DownloadResult(year=year, file_name=file_name)
+    url = year_url(year, base_url)
+    key = None if archive is None else archive.key(url)
+    if archive is not None and (archive.offline or is_closed_year(year)):
+        if archive.has(key):
+            await asyncio.to_thread(archive.restore, key, file_name)
+            metrics.inc('raw_archive_fetches', source='NationalGrid', result='archive')
+            logger.success(f'Took data for {year} year from archive')
+            return result
+        if archive.offline:
+            result.error = f'{ArchiveMiss.__name__}: there is no archived file for {url}'
+            logger.error(f'Error when receiving data for {year} year: {result.error}')
+            return result
+
+    for attempt in range(retries + 1):
+        result.attempts = attempt + 1
+        try:
+            headers = None if archive is None else archive.conditional_headers(key)
+            async with semaphore:
+                result.size, response_headers = await download(session, url, file_name, headers=headers)
+            result.error = None
+            if response_headers is None:
+                await asyncio.to_thread(archive.restore, key, file_name)
+                metrics.inc('raw_archive_fetches', source='NationalGrid', result='not_modified')
+                logger.success(f'Data for {year} year is not modified, took it from archive')
+            else:
+                metrics.inc('bytes_downloaded', result.size, source='NationalGrid')
+                if archive is not None:
+                    await asyncio.to_thread(archive.store, key, file_name, url, None, response_headers)
+                logger.success(f'Received data for {year} year ({result.size} bytes)')
+            return result
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            result.error = f'{type(error).__name__}: {error}'
+            # client errors except too many requests will not be fixed by retrying
+            if isinstance(error, aiohttp.ClientResponseError) and 400 <= error.status < 500 and error.status != 429:
+                break
+            if attempt < retries:
+                delay = random.uniform(0, backoff * 2 ** attempt)
+                logger.warning(f'Error when receiving data for {year} year: {result.error}, '
+                               f'retrying in {delay:.1f} seconds')
+                await asyncio.sleep(delay)
+    metrics.inc('download_errors', source='NationalGrid')
+    logger.error(f'Error when receiving data for {year} year: {result.error}')
+    return result
+
+
+async def main(file_name: str, years: Iterable[int] = None, concurrency: int = CONCURRENCY,
+               timeout: float = TIMEOUT, retries: int = RETRIES, backoff: float = BACKOFF,
+               archive: RawArchive = None, base_url: str = None) -> Mapping[int, DownloadResult]:
+    """
+    downloads files for the years (default all years from urls) into files 'file_name' + year,
+    no more than concurrency files are downloaded at once
+    (from base_url if it is set, see year_url)
+    """
+    # aiohttp is imported only when files are downloaded, processing of saved files does not need it
+    import aiohttp
+
+    years = urls.keys() if years is None else years
+    semaphore = asyncio.Semaphore(concurrency)
+    with metrics.stage('download', source='NationalGrid'):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            results = await asyncio.gather(*[
+                fetch(session, semaphore, year, f'{file_name}_{year}.xls', retries=retries, backoff=backoff,
+                      archive=archive, base_url=base_url)
+                for year in years
+            ])
+    return {result.year: result for result in results}
+
+
+def save_historical_data(file_name: str, folder: str = 'checkpoints', **kwargs) -> Mapping[int, DownloadResult]:
+    """
+    saves files for all years, years saved by the previous runs are not downloaded again,
+    returns the report for every downloaded year
+    (kwargs are passed to main)
+    """
+    backfill = Backfill(name='NationalGrid', folder=folder, chunk_size='year')
+    # the file of the year is changed till the end of March of the next year, so it is downloaded again till then
+    # (even if it was marked as done before)
+    chunks = {chunk.start.year: chunk for chunk in backfill.chunks(date(min(urls), 1, 1), date.today())
+              if not backfill.is_done(chunk) or not is_closed_year(chunk.start.year)}
+    report = asyncio.run(main(file_name, years=[year for year in chunks if year in urls], **kwargs))
+    for year, result in report.items():
+        if result.ok and is_closed_year(year):
+            backfill.mark_done(chunks[year])
+    failed_years = sorted(year for year, result in report.items() if not result.ok)
+    if failed_years:
+        logger.error(f'Data was not received for years: {failed_years}')
+    return report
+
+
+def save_current_data(file_name: str, timeout: float = TIMEOUT, archive: RawArchive = None,
+                      base_url: str = None) -> None:
+    """
+    saves the file for the current year
+    (if archive is set the file is taken from it when it is not changed)
+    """
+    url = year_url(date.today().year, base_url)
+    if archive is not None:
+        archive.fetch(url, f'{file_name}.xls', timeout=timeout)
+        return
+    temp_file_name = f'{file_name}.xls.part'
+    with requests.get(url=url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(temp_file_name, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+    os.replace(temp_file_name, f'{file_name}.xls')
 
 
 if __name__ == '__main__':
     current_date = date.today().strftime('%d.%m.%Y')
     folder = 'parsed_data'
-    # save_current_data(f'{folder}/NG_{current_date}')
-    save_historical_data(f'{folder}/NG')
+    # set offline=True to take files from archive without requests
+    raw_archive = RawArchive(folder=f'{folder}/raw_archive', offline=False)
+    # save_current_data(f'{folder}/NG_{current_date}', archive=raw_archive)
+    save_historical_data(f'{folder}/NG', folder=f'{folder}/checkpoints', archive=raw_archive)
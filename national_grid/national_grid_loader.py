@@ -1,13 +1,25 @@
 import os
 import sys
+import asyncio
+import argparse
 import pandas as pd
 import numpy as np
 import tqdm
-from typing import Literal, Mapping, Union
+from datetime import date
+from typing import Iterable, Literal, Mapping, Union
 sys.path.insert(1, os.path.join(sys.path[0], '../GRTgaz'))
-from connection import connect, session, base
-from table_classes import CurvesDict, Curves, FlowCurves
+from connection import connect, get_session
+from table_classes import CurvesDict, Curves, FlowCurves, get_table
 from delivery_point_table import DeliveryPointDict
+from watermarks import WatermarkStore, OVERLAP_DAYS
+from national_grid_collector import main as collect_files, urls, LAST_GAS_DAY
+from national_grid_processor import gas_year, get_data_between
+from parsed_storage import iter_parsed
+from pipeline import Pipeline, iter_batches, QUEUE_SIZE
+from dimension_cache import dimensions
+from metrics import metrics
+from profiling import add_profile_argument, start_profiling
+from parse_cache import ParseCache
 
 attr_dict: Mapping[str, 'one_attr_tables'] = {
     'unit': 'units_dict', 'point_type': 'delivery_point_types_dict',
@@ -21,6 +33,15 @@ new_columns: Mapping[str, str] = {
     'source': 'id_source', 'flow_type': 'id_type',
     'sector': 'id_sector'}
 
+# columns of parsed data used by the loader, other columns are not read from parquet files
+loader_columns = ['date', 'delivery_point', 'point_type', 'curve_name', 'value']
+# columns of the record in delivery_point_dict, in the order of the dimension cache key
+delivery_point_columns = ['id_point_type', 'from_country', 'id_source', 'delivery_point']
+# columns of the record in flow_curves (same as in GRTgaz loader)
+flow_curves_columns = ['id_source', 'id_point', 'id_unit', 'from_country', 'to_country',
+                       'from_company', 'to_company', 'id_type', 'curve_name']
+curves_dict_columns = ['id_sector', 'id_flow_curves']
+
 one_attr_tables = Literal['units_dict', 'delivery_point_types_dict', 'country_dict',
 'source_dict', 'flow_types', 'sector_dict']
 
@@ -42,25 +63,25 @@ def search_record_in_table(table_name: one_attr_tables, attr: str) -> int:
     table = field = None
     match table_name:
         case 'units_dict':
-            table = base.classes.units_dict
+            table = get_table('units_dict')
             field = table.unit_name
         case 'delivery_point_types_dict':
-            table = base.classes.delivery_point_types_dict
+            table = get_table('delivery_point_types_dict')
             field = table.point_type
         case 'country_dict':
-            table = base.classes.country_dict
+            table = get_table('country_dict')
             field = table.country_2
         case 'flow_types':
-            table = base.classes.flow_types
+            table = get_table('flow_types')
             field = table.flow_type
         case 'source_dict':
-            table = base.classes.source_dict
+            table = get_table('source_dict')
             field = table.source_name
         case 'sector_dict':
-            table = base.classes.sector_dict
+            table = get_table('sector_dict')
             field = table.sector_name
 
-    search_record = session.query(
+    search_record = get_session().query(
         table.id).filter(
         field == attr).all()
 
@@ -83,56 +104,139 @@ class NationalGridLoader:
         self.flow_curves = FlowCurves()
         self.dp_dict = DeliveryPointDict()
 
-    def insert_national_grid(self, df_fs: pd.DataFrame = None):
+    def resolve_ids(self, data: pd.DataFrame) -> pd.DataFrame:
         """
-        insert data in database
+        converts all string data to id,
+        every distinct value or combination of values is searched in database only once
+        and found ids are kept in the dimension cache shared by all loaders
         """
-        data = df_fs
-
         # convert all string data to id where possible
         for col_name, value in additional_columns.items():
             data[col_name] = value
         for old_col, new_col in new_columns.items():
-            data[new_col] = data.apply(
-                lambda x: search_record_in_table(
-                    table_name=attr_dict[old_col], attr=x[old_col]), axis=1)
+            table_name = attr_dict[old_col]
+            ids = {attr: dimensions.get((table_name, attr),
+                                        lambda: search_record_in_table(table_name=table_name, attr=attr))
+                   for attr in data[old_col].unique()}
+            data[new_col] = data[old_col].map(ids)
 
         # get id_point from table delivery_point_dict
-        data['id_point'] = data.apply(
-            lambda x: self.dp_dict.search_data(
+        points = data[delivery_point_columns].drop_duplicates()
+        points['id_point'] = [
+            dimensions.get(('delivery_point_dict', *x), lambda x=x: self.dp_dict.search_data(
                 id_type=x.id_point_type, id_country=x.from_country,
-                id_source=x.id_source, point_name=x.delivery_point), axis=1)
+                id_source=x.id_source, point_name=x.delivery_point)) for x in points.itertuples(index=False)]
+        data = data.merge(points, on=delivery_point_columns, how='left')
 
         # get id_flow_curves from table flow_curves
-        data['id_flow_curves'] = data.apply(
-            lambda x: self.flow_curves.search_data(
+        flow_curves = data[flow_curves_columns].drop_duplicates()
+        flow_curves['id_flow_curves'] = [
+            dimensions.get(('flow_curves', *x), lambda x=x: self.flow_curves.search_data(
                 id_source=x.id_source, id_point=x.id_point,
                 id_unit=x.id_unit, from_country=x.from_country,
                 from_company=x.from_company, to_company=x.to_company,
                 to_country=x.to_country, id_type=x.id_type,
-                curve_name=x.curve_name), axis=1)
+                curve_name=x.curve_name)) for x in flow_curves.itertuples(index=False)]
+        data = data.merge(flow_curves, on=flow_curves_columns, how='left')
 
         # get id_curve from table curves_dict
-        data['id_curve'] = data.apply(
-            lambda x: self.curves_dict.search_data(
-                id_sector=x.id_sector, id_flow_curves=x.id_flow_curves), axis=1)
+        curves_dict = data[curves_dict_columns].drop_duplicates()
+        curves_dict['id_curve'] = [
+            dimensions.get(('curves_dict', *x), lambda x=x: self.curves_dict.search_data(
+                id_sector=x.id_sector, id_flow_curves=x.id_flow_curves)) for x in curves_dict.itertuples(index=False)]
+        return data.merge(curves_dict, on=curves_dict_columns, how='left')
 
-        # insert data into table curves
+    def insert_curves(self, data: pd.DataFrame) -> None:
+        """
+        inserts data into table curves
+        """
         data = data[['id_curve', 'date', 'value']].to_numpy()
         for row in tqdm.tqdm(data):
             try:
                 self.curves.insert_new_data(id_curve=row[0],
                                             date=row[1],
-                                            value=np.float64(row[2]))
+                                            value=float(row[2]))
             except:
                 sys.exit(1)
-        connect.close()
+        metrics.inc('rows_written', len(data), source='NationalGrid')
+
+    def insert_batches(self, batches: Iterable[pd.DataFrame], queue_size: int = QUEUE_SIZE):
+        """
+        resolves ids and inserts data by batches,
+        ids of the next batches are resolved while the previous batch is inserted
+        and at most queue_size batches wait for every stage
+        """
+        Pipeline(stages=[self.resolve_ids, self.insert_curves], queue_size=queue_size,
+                 # sessions of the stage threads go back to the shared pool, the engine is kept warm
+                 on_stage_exit=lambda: get_session().close(),
+                 name='NationalGrid loader').run(batches)
         return 'ok'
 
+    def insert_national_grid(self, df_fs: pd.DataFrame = None):
+        """
+        insert data in database
+        """
+        return self.insert_batches(iter_batches(df_fs))
+
+
+def fetch_between(file_name: str, start_date: date, end_date: date, parse_cache: ParseCache = None) -> pd.DataFrame:
+    """
+    downloads files of the years from start_date till end_date into files 'file_name' + year
+    and returns data of these days
+    (days after LAST_GAS_DAY are not in the files of urls, so they are not collected)
+    """
+    end_date = min(end_date, LAST_GAS_DAY)
+    if start_date > end_date:
+        return pd.DataFrame(columns=loader_columns)
+    years = [year for year in range(gas_year(start_date), gas_year(end_date) + 1) if year in urls]
+    report = asyncio.run(collect_files(file_name, years=years))
+    failed_years = sorted(year for year, result in report.items() if not result.ok)
+    if failed_years:
+        raise RuntimeError(f'Data was not received for years: {failed_years}')
+    return get_data_between(file_name, start_date=start_date, end_date=end_date, parse_cache=parse_cache)
+
+
+def load_incremental(store: WatermarkStore, file_name: str, overlap: int = OVERLAP_DAYS,
+                     start_date: date = date(min(urls), 4, 1)):
+    """
+    downloads files of the years from the watermark minus overlap days till today into files 'file_name' + year,
+    inserts data of these days and moves the watermark only when data is inserted
+    """
+    store.run(source=additional_columns['source'], data_type=additional_columns['flow_type'],
+              fetch=lambda start, end: fetch_between(file_name, start, end),
+              load=NationalGridLoader().insert_national_grid,
+              default_start=start_date, overlap=overlap)
+
 
 if __name__ == '__main__':
-    folder = 'parsed_data/'
-    current_file_name = f'{folder}/NG.csv'
-    df = pd.read_csv(current_file_name, index_col=False)
+    arg_parser = argparse.ArgumentParser(description='loads National Grid data into the database')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='collect and load data from the last loaded gas day minus overlap till today')
+    arg_parser.add_argument('--overlap', type=int, default=OVERLAP_DAYS,
+                            help='days before the last loaded gas day to collect again')
+    arg_parser.add_argument('--state-file', default='parsed_data/watermarks.json',
+                            help='file with the last loaded gas days')
+    arg_parser.add_argument('--input-format', choices=('csv', 'parquet'), default='parquet',
+                            help='format of parsed data written by national_grid_processor.py')
+    arg_parser.add_argument('--start-date', type=date.fromisoformat, default=None,
+                            help='first gas day to load from parquet files (YYYY-MM-DD)')
+    arg_parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help='last gas day to load from parquet files (YYYY-MM-DD)')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
 
-    NationalGridLoader().insert_national_grid(df_fs=df)
+    folder = 'parsed_data/'
+    if args.incremental:
+        load_incremental(WatermarkStore(args.state_file), file_name=f'{folder}NG', overlap=args.overlap)
+    else:
+        if args.input_format == 'parquet':
+            # parquet files are read by batches while previous batches are loaded
+            NationalGridLoader().insert_batches(iter_parsed('NationalGrid', additional_columns['flow_type'],
+                                                            columns=loader_columns, start_date=args.start_date,
+                                                            end_date=args.end_date, folder=f'{folder}parquet'))
+        else:
+            current_file_name = f'{folder}/NG.csv'
+            df = pd.read_csv(current_file_name, index_col=False)
+            NationalGridLoader().insert_national_grid(df_fs=df)
+    connect.close()
@@ -1,8 +1,21 @@
 import pandas as pd
 from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Mapping, Tuple, Union
 import os
+import sys
+import argparse
+import multiprocessing
+from functools import partial
+sys.path.insert(1, os.path.join(sys.path[0], '../GRTgaz'))
+from parsed_storage import write_parsed
+from parse_cache import ParseCache
+from metrics import metrics
+from profiling import profiler, add_profile_argument, start_profiling
 
 DATE_FORMAT = '%d-%b-%Y'
+# change it when parsing of the files is changed, so files parsed before are parsed again
+PARSER_VERSION = 'national_grid_processor/1'
 FIRST_MONTHS = ['Today', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep']
 ALL_MONTHS = FIRST_MONTHS + ['Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar']
 
@@ -23,7 +36,9 @@ def delete_nan(df: pd.DataFrame) -> pd.DataFrame:
     deletes rows with nan
     """
     nans = list(df.loc[pd.isna(df["Gasday"]), :].index)
+    rows = len(df.index)
     df = df.drop(labels=range(nans[0], len(df.index)), axis=0)
+    metrics.inc('rows_dropped', rows - len(df.index), source='NationalGrid')
     return df
 
 
@@ -73,6 +88,14 @@ def change_view(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def read_sheets(file_name: Union[str, pd.ExcelFile], sheet_names: List[str]) -> Mapping[str, pd.DataFrame]:
+    """
+    reads all sheets 'sheet_names' from the file at once,
+    columns from columns_to_drop are not read
+    """
+    return pd.read_excel(file_name, sheet_name=sheet_names, usecols=lambda column: column not in columns_to_drop)
+
+
 def get_current_data() -> pd.DataFrame:
     """
     gets the current data in the DataFrame form
@@ -80,62 +103,136 @@ def get_current_data() -> pd.DataFrame:
     # read current data from file Todays sheet
     current_date = date.today().strftime('%d.%m.%Y')
     current_file_name = f'current_data_{current_date}.xls'
-    df = pd.read_excel(current_file_name, sheet_name='Today')
+    with pd.ExcelFile(current_file_name) as xls:
+        df = read_sheets(xls, ['Today'])['Today']
+
+        # delete rows with nan
+        df = delete_nan(df)
+
+        # read sheet with a month of a previous day
+        prev_date = get_previous_date(df)
+        prev_month = prev_date.strftime("%b")
+        temp_df = read_sheets(xls, [prev_month])[prev_month]
 
-    # delete rows with nan
-    df = delete_nan(df)
-    
-    # read sheet with a month of a previous day
-    prev_date = get_previous_date(df)
-    temp_df = pd.read_excel(current_file_name, sheet_name=prev_date.strftime("%b"))
-    
     # cut data only with a previous date
     temp_df = cut_data_with_date(temp_df, prev_date)
-    
+
     # join two dataframes
     df = join_dfs(df, temp_df)
 
-    # drop unnecessary columns
-    df = df.drop(columns_to_drop, axis=1)
     df = change_view(df)
     # os.unlink(current_file_name)
     return df
 
 
-def go_through_sheets(file_name: str, sheet_names: list) -> pd.DataFrame:
+def go_through_sheets(file_name: Union[str, pd.ExcelFile], sheet_names: list) -> pd.DataFrame:
     """
     gets data from sheets in the file 'file_name' into one DataFrame
     """
-    all_sheet_df = pd.DataFrame()
-    for sheet_name in sheet_names:
-        sheet_df = pd.read_excel(file_name, sheet_name=sheet_name)
-        if sheet_name == 'Today':
-            sheet_df = delete_nan(sheet_df)
-    all_sheet_df = join_dfs(all_sheet_df, sheet_df)
+    sheets = read_sheets(file_name, sheet_names)
+    if 'Today' in sheets:
+        sheets['Today'] = delete_nan(sheets['Today'])
+    if not sheets:
+        return pd.DataFrame()
+    all_sheet_df = pd.concat([sheets[sheet_name] for sheet_name in sheet_names], sort=False, axis=0)
+    all_sheet_df.reset_index(drop=True, inplace=True)
     return all_sheet_df
 
 
-def get_historical_data(file_name: str, start_year: int = 2015, end_year: int = date.today().year) -> pd.DataFrame:
+def read_year_file(year_file_name: str, year: int) -> pd.DataFrame:
+    """
+    reads the file with data of the year into one DataFrame
+    """
+    with pd.ExcelFile(year_file_name) as xls:
+        months = FIRST_MONTHS if year == 2015 else ALL_MONTHS
+        sheet_names = [sheet_name for sheet_name in xls.sheet_names if sheet_name in months]
+        return go_through_sheets(file_name=xls, sheet_names=sheet_names)
+
+
+def get_year_data(file_name: str, year: int, parse_cache: ParseCache = None) -> pd.DataFrame:
+    """
+    gets data from the file 'file_name' + year into one DataFrame
+    (if parse_cache is set the file is parsed only if it is changed since the last parsing)
     """
-    gets data from start_year till end_year from the files 'file_name' + year into one DataFrame
+    year_file_name = f'{file_name}_{year}.xls'
+    if parse_cache is None:
+        return read_year_file(year_file_name, year)
+    return parse_cache.parse(year_file_name, partial(read_year_file, year=year),
+                             parser_version=f'{PARSER_VERSION}:{year}')
+
+
+def parse_year_in_worker(file_name: str, year: int, parse_cache: ParseCache = None) -> Tuple[pd.DataFrame, Mapping]:
     """
-    out_df = pd.DataFrame()
-    for year in range(start_year, end_year + 1):
-        current_file_name = f'{file_name}_{year}.xls'
-        xls = pd.ExcelFile(current_file_name)
-        all_sheet_names = xls.sheet_names
-        if year == 2015:
-            sheet_names = list(set(all_sheet_names) & set(FIRST_MONTHS)) 
+    gets data of the year in a worker process and returns it with metrics counted while parsing it,
+    metrics of the worker are not seen by the parent process, so the parent adds them to its own
+    """
+    # a worker process parses several years, only counters of this year are returned
+    metrics.reset()
+    df = get_year_data(file_name, year, parse_cache)
+    return df, metrics.snapshot()
+
+
+def get_historical_data(file_name: str, start_year: int = 2015, end_year: int = None,
+                        workers: int = None, parse_cache: ParseCache = None) -> pd.DataFrame:
+    """
+    gets data from start_year till end_year from the files 'file_name' + year into one DataFrame,
+    files are read in parallel by workers processes (default number of CPUs)
+    (default end_year is the current year)
+    """
+    end_year = date.today().year if end_year is None else end_year
+    years = list(range(start_year, end_year + 1))
+    # files are parsed by other processes, so only wall time of the stage is counted
+    with metrics.stage('parse', source='NationalGrid'):
+        # other processes are not profiled, so the files are parsed in this process when it is profiled
+        if profiler.enabled:
+            year_dfs = list(map(get_year_data, [file_name] * len(years), years, [parse_cache] * len(years)))
         else:
-            sheet_names = list(set(all_sheet_names) & set(ALL_MONTHS)) 
-        year_df = go_through_sheets(file_name=current_file_name, sheet_names=sheet_names)
-        out_df = join_dfs(out_df, year_df)
-        out_df = out_df.drop(columns_to_drop, axis=1)
-    out_df = change_view(out_df)
+            # processes are spawned, not forked: callers have other threads (jobs, the DB pool, logging)
+            # and a forked child could get their locks held forever
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                year_dfs = []
+                for year_df, year_metrics in executor.map(parse_year_in_worker, [file_name] * len(years), years,
+                                                          [parse_cache] * len(years)):
+                    metrics.merge(year_metrics)
+                    year_dfs.append(year_df)
+        out_df = pd.concat(year_dfs, sort=False, axis=0)
+        out_df.reset_index(drop=True, inplace=True)
+        out_df = change_view(out_df)
+    metrics.inc('rows_parsed', len(out_df.index), source='NationalGrid')
     return out_df
-                              
+
+
+def gas_year(day: date) -> int:
+    """
+    returns the year of the file with data for the day, every file starts with April
+    """
+    return day.year if day.month >= 4 else day.year - 1
+
+
+def get_data_between(file_name: str, start_date: date, end_date: date, workers: int = None,
+                     parse_cache: ParseCache = None) -> pd.DataFrame:
+    """
+    gets data from start_date till end_date from the files 'file_name' + year into one DataFrame
+    (used by incremental runs)
+    """
+    df = get_historical_data(file_name, start_year=gas_year(start_date), end_year=gas_year(end_date),
+                             workers=workers, parse_cache=parse_cache)
+    df = df.loc[df['date'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))]
+    df.reset_index(drop=True, inplace=True)
+    return df
+
 
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='processes National Grid files')
+    arg_parser.add_argument('--output-format', choices=('csv', 'parquet'), default='parquet',
+                            help='parquet files partitioned by year or one csv file')
+    arg_parser.add_argument('--no-parse-cache', action='store_true',
+                            help='parse all files again instead of taking unchanged files from the parse cache')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    start_profiling(args.profile)
+
     folder = 'parsed_data'
 
     # current_date = date.today().strftime('%d.%m.%Y')
@@ -143,6 +240,10 @@ if __name__ == '__main__':
     # df = get_current_data()
     # df.to_csv(current_file_name, index=False)
     
-    df = get_historical_data(f'{folder}/NG')
-    df.to_csv(f'{folder}/NG.csv', index=False)
+    parse_cache = None if args.no_parse_cache else ParseCache(folder=f'{folder}/parse_cache')
+    df = get_historical_data(f'{folder}/NG', parse_cache=parse_cache)
+    if args.output_format == 'parquet':
+        write_parsed(df, source='NationalGrid', data_type='physical_flow', folder=f'{folder}/parquet')
+    else:
+        df.to_csv(f'{folder}/NG.csv', index=False)
     
\ No newline at end of file
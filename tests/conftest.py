@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules of the sources are imported by their folders, as the scripts do
+for source_folder in ('GRTgaz', 'fluxys', 'national_grid', '42fs', 'benchmarks'):
+    sys.path.insert(1, os.path.join(ROOT, source_folder))
@@ -0,0 +1,55 @@
+from datetime import date
+
+import pandas as pd
+
+from backfill import Backfill
+
+
+class Fetch:
+    """
+    fake fetch: returns one row for the first day of every chunk, chunks are counted
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def __call__(self, start: date, end: date) -> pd.DataFrame:
+        self.chunks.append((start, end))
+        return pd.DataFrame({'date': [pd.Timestamp(start)], 'value': [float(len(self.chunks))]})
+
+
+def test_open_chunk_is_never_marked_done(tmp_path):
+    today = date.today()
+    backfill = Backfill(name='test', folder=str(tmp_path), chunk_size='month')
+    fetch = Fetch()
+    backfill.run(fetch=fetch, start_date=date(today.year, today.month, 1), end_date=today)
+    open_chunk, = backfill.chunks(date(today.year, today.month, 1), today)
+    assert open_chunk.is_open()
+    assert not backfill.is_done(open_chunk)
+    # the next run collects the chunk of the current month again
+    Backfill(name='test', folder=str(tmp_path), chunk_size='month').run(
+        fetch=fetch, start_date=date(today.year, today.month, 1), end_date=today)
+    assert len(fetch.chunks) == 2
+
+
+def test_resume_skips_done_chunks(tmp_path):
+    start_date, end_date = date(2020, 1, 1), date(2022, 12, 31)
+    interrupted = Fetch()
+
+    def fail_in_2021(start: date, end: date) -> pd.DataFrame:
+        if start.year == 2021:
+            raise ConnectionError('interrupted')
+        return interrupted(start, end)
+
+    try:
+        Backfill(name='test', folder=str(tmp_path)).run(fetch=fail_in_2021, start_date=start_date, end_date=end_date)
+    except ConnectionError:
+        pass
+    assert interrupted.chunks == [(date(2020, 1, 1), date(2020, 12, 31))]
+
+    resumed = Fetch()
+    backfill = Backfill(name='test', folder=str(tmp_path))
+    df = backfill.run(fetch=resumed, start_date=start_date, end_date=end_date)
+    assert resumed.chunks == [(date(2021, 1, 1), date(2021, 12, 31)), (date(2022, 1, 1), date(2022, 12, 31))]
+    # data of the chunk finished before the interruption is read from its checkpoint
+    assert df['date'].tolist() == [pd.Timestamp(f'{year}-01-01') for year in (2020, 2021, 2022)]
+    assert all(backfill.is_done(chunk) for chunk in backfill.chunks(start_date, end_date))
@@ -0,0 +1,41 @@
+import pytest
+
+from connection import DatabaseConnection
+
+
+@pytest.fixture
+def database_env(monkeypatch):
+    # the engine is only created, no connection to the server is opened
+    monkeypatch.setenv('DATABASE_DIALECT', 'postgresql')
+    monkeypatch.setenv('DATABASE_DRIVER', 'psycopg2')
+    monkeypatch.setenv('SERVER_HOST_NAME', 'localhost')
+    monkeypatch.delenv('DATABASE_POOL_SIZE', raising=False)
+    monkeypatch.delenv('DATABASE_MAX_OVERFLOW', raising=False)
+
+
+def test_pool_size_is_read_when_engine_is_created(database_env, monkeypatch):
+    # gpe.py sets the pool size for its jobs after the connection module is imported
+    connection = DatabaseConnection(db_name='analytics_base')
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '12')
+    monkeypatch.setenv('DATABASE_MAX_OVERFLOW', '3')
+    try:
+        engine = connection.get_connection()
+        assert engine.pool.size() == 12
+        assert engine.pool._max_overflow == 3
+    finally:
+        connection.close()
+
+
+def test_default_pool_size(database_env):
+    connection = DatabaseConnection(db_name='analytics_base')
+    try:
+        assert connection.get_connection().pool.size() == 5
+    finally:
+        connection.close()
+
+
+def test_database_name_is_read_from_environment(database_env, monkeypatch):
+    monkeypatch.setenv('ANALYTICS_DATABASE_NAME', 'analytics_prod')
+    assert DatabaseConnection(db_name='analytics_base').create_db_connection_config().endswith('/analytics_prod')
+    monkeypatch.delenv('ANALYTICS_DATABASE_NAME')
+    assert DatabaseConnection(db_name='analytics_base').create_db_connection_config().endswith('/analytics_base')
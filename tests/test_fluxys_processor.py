@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fluxys_processor import POINTS_COUNTRIES, FluxysDataFrame
+
+
+def row_wise_get_countries(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    the row-wise implementation FluxysDataFrame._get_countries replaced (interconnection data)
+    """
+    df[['from_country', 'to_country']] = df.apply(lambda row: pd.Series(
+        [
+            POINTS_COUNTRIES[row['Interconnection Point']]['from'],
+            POINTS_COUNTRIES[row['Interconnection Point']]['to']
+        ]), axis=1)
+    return df
+
+
+def row_wise_divide_flow_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    the row-wise implementation FluxysDataFrame._divide_flow_types replaced
+    """
+    df[['curve_name', 'flow_type']] = df.apply(lambda row: pd.Series([
+        f'{row.curve_name}_{row.flow_type[:row.flow_type.rfind("_")]}',
+        'nomination']) if row.flow_type.find('nominations') != -1
+        else pd.Series([row.curve_name, row.flow_type]), axis=1)
+    return df
+
+
+def fluxys_data_frame(df: pd.DataFrame) -> FluxysDataFrame:
+    """
+    returns FluxysDataFrame with df, no file is read
+    """
+    data_frame = object.__new__(FluxysDataFrame)
+    data_frame._df = df
+    return data_frame
+
+
+def melted_frame() -> pd.DataFrame:
+    """
+    returns melted rows of all flow types, with a missing curve_name and missing values
+    """
+    return pd.DataFrame({
+        'delivery_point': ['Alveringem', 'Eynatten 1', 'Bras-Petange', 'Alveringem', 'Eynatten 1', 'Alveringem'],
+        'date': pd.to_datetime(['2023-04-01'] * 3 + ['2023-04-02'] * 3),
+        'curve_name': ['entry', 'exit', np.nan, 'entry', np.nan, 'exit'],
+        'from_country': ['FR', 'DE', 'LU', 'FR', 'DE', 'FR'],
+        'to_country': ['BE'] * 6,
+        'flow_type': ['day_ahead_nominations', 'final_nominations', 'physical_flow',
+                      'final_nominations', 'day_ahead_nominations', 'physical_flow'],
+        'value': [1.0, np.nan, 3.0, 4.0, 5.0, np.nan],
+    })
+
+
+def test_divide_flow_types_matches_row_wise_implementation():
+    expected = row_wise_divide_flow_types(melted_frame())
+    data_frame = fluxys_data_frame(melted_frame())
+    data_frame._divide_flow_types()
+    pd.testing.assert_frame_equal(data_frame.data_frame, expected, check_dtype=False)
+    assert data_frame.data_frame['curve_name'].tolist() == [
+        'entry_day_ahead', 'exit_final', np.nan, 'entry_final', 'nan_day_ahead', 'exit']
+
+
+def test_get_countries_matches_row_wise_implementation():
+    points = pd.DataFrame({'Interconnection Point': ['Alveringem', 'Eynatten 1', 'Bras-Petange', 'Alveringem'],
+                           'Direction': ['Entry', 'Exit', 'Entry', 'Exit']})
+    expected = row_wise_get_countries(points.copy())
+    data_frame = fluxys_data_frame(points.copy())
+    data_frame._get_countries(data_type='interconnection')
+    pd.testing.assert_frame_equal(data_frame.data_frame, expected, check_dtype=False)
+
+
+def test_get_countries_reports_all_unknown_points_at_once():
+    points = pd.DataFrame({'Interconnection Point': ['Alveringem', 'Unknown B', 'Unknown A', 'Unknown B']})
+    data_frame = fluxys_data_frame(points)
+    with pytest.raises(KeyError, match=r"\['Unknown A', 'Unknown B'\]"):
+        data_frame._get_countries(data_type='interconnection')
+    # the row-wise implementation stopped at the first unknown point
+    with pytest.raises(KeyError, match='Unknown B'):
+        row_wise_get_countries(points.copy())
@@ -0,0 +1,55 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import national_grid_loader
+from fixture_server import national_grid_workbook
+from national_grid_collector import DownloadResult, LAST_GAS_DAY, urls
+from watermarks import WatermarkStore
+
+# years after the last file of urls, their files can not be downloaded
+TODAY = date(max(urls) + 3, 10, 19)
+FIRST_DAY = date(max(urls), 4, 1)
+
+
+@pytest.fixture
+def downloaded_years(monkeypatch):
+    """
+    replaces downloads with synthetic files of the years and returns the downloaded years
+    """
+    years_downloaded = []
+
+    async def collect_files(file_name, years=None, **kwargs):
+        results = {}
+        for year in years:
+            with open(f'{file_name}_{year}.xls', 'wb') as f:
+                f.write(national_grid_workbook(year, points=2, today=TODAY))
+            years_downloaded.append(year)
+            results[year] = DownloadResult(year=year, file_name=f'{file_name}_{year}.xls')
+        return results
+
+    monkeypatch.setattr(national_grid_loader, 'collect_files', collect_files)
+    return years_downloaded
+
+
+def test_incremental_runs_after_the_last_file(tmp_path, downloaded_years):
+    store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    fetch = lambda start, end: national_grid_loader.fetch_between(str(tmp_path / 'NG'), start, end)
+    loaded = []
+
+    assert store.run(source='NationalGrid', data_type='physical_flow', fetch=fetch, load=loaded.append,
+                     default_start=FIRST_DAY, today=TODAY) == LAST_GAS_DAY
+    assert downloaded_years == [max(urls)]
+    assert loaded[0]['date'].max() == pd.Timestamp(LAST_GAS_DAY)
+
+    # the next run collects only the overlap before the last gas day
+    assert store.run(source='NationalGrid', data_type='physical_flow', fetch=fetch, load=loaded.append,
+                     default_start=FIRST_DAY, today=TODAY) == LAST_GAS_DAY
+    assert loaded[1]['date'].min() >= pd.Timestamp(date(max(urls) + 1, 3, 29))
+
+
+def test_current_days_after_the_last_file(tmp_path, downloaded_years):
+    df = national_grid_loader.fetch_between(str(tmp_path / 'NG'), date(TODAY.year, 10, 17), TODAY)
+    assert df.empty
+    assert downloaded_years == []
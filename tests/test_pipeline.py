@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def test_failing_stage_stops_the_pipeline_and_raises_its_error():
+    read = []
+    written = []
+
+    def batches():
+        for number in range(1_000):
+            read.append(number)
+            yield number
+
+    def parse(batch):
+        if batch == 3:
+            raise ValueError(f'bad batch {batch}')
+        return batch
+
+    def write(batch):
+        written.append(batch)
+
+    with pytest.raises(ValueError, match='bad batch 3'):
+        Pipeline([parse, write], queue_size=2).run(batches())
+    # reading stops soon after the error, not all batches are read
+    assert len(read) < 1_000
+    assert 3 not in written
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith('pipeline-')]
+
+
+def test_queues_bound_batches_in_flight():
+    stages = 3
+    queue_size = 1
+    batches = 30
+    lock = threading.Lock()
+    in_flight = [0]
+    max_in_flight = [0]
+
+    def read():
+        for number in range(batches):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            yield number
+
+    def write(batch):
+        # the slowest stage, batches wait for it in the queues
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+    assert Pipeline([lambda batch: batch] * (stages - 1) + [write], queue_size=queue_size).run(read()) == batches
+    # every stage holds one batch and every queue holds queue_size batches, one more is read
+    assert max_in_flight[0] <= stages * (queue_size + 1) + 1
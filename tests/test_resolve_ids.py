@@ -0,0 +1,78 @@
+import importlib
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import national_grid_loader
+from dimension_cache import dimensions
+
+loader_42fs = importlib.import_module('42fs_loader')
+
+
+@pytest.fixture(autouse=True)
+def empty_dimensions():
+    dimensions.clear()
+    yield
+    dimensions.clear()
+
+
+class Searches:
+    """
+    fake searches of dictionary records: every distinct key gets its own id, calls are counted
+    """
+    def __init__(self):
+        self.calls = []
+        self.ids = {}
+
+    def __call__(self, *key):
+        self.calls.append(key)
+        return self.ids.setdefault(key, len(self.ids) + 1)
+
+
+def test_national_grid_resolves_distinct_values_once(monkeypatch):
+    searches = Searches()
+    monkeypatch.setattr(national_grid_loader, 'search_record_in_table',
+                        lambda table_name, attr: searches(table_name, attr))
+    loader = object.__new__(national_grid_loader.NationalGridLoader)
+    for table in ('dp_dict', 'flow_curves', 'curves_dict'):
+        setattr(loader, table, SimpleNamespace(search_data=lambda table=table, **x: searches(table, *sorted(x.items()))))
+    data = pd.DataFrame({'date': pd.to_datetime(['2023-04-01', '2023-04-02'] * 3),
+                         'delivery_point': ['A', 'A', 'B', 'B', 'A', 'A'],
+                         'point_type': ['ugs', 'ugs', 'lng_terminal', 'lng_terminal', 'ugs', 'ugs'],
+                         'curve_name': ['Opening Stock'] * 4 + ['Closing Stock'] * 2,
+                         'value': range(6)})
+
+    df = loader.resolve_ids(data.copy())
+
+    # 6 dictionaries with one value each and 2 point types, 2 points, 3 flow curves and 3 curves
+    assert len(searches.calls) == len(set(searches.calls)) == 6 + 1 + 2 + 3 + 3
+    assert list(df['value']) == list(range(6))
+    assert df['id_curve'].nunique() == 3
+    assert (df.groupby(['delivery_point', 'curve_name'])['id_curve'].nunique() == 1).all()
+
+
+def test_42fs_resolves_distinct_instruments_once(monkeypatch):
+    searches = Searches()
+    loader = object.__new__(loader_42fs.Loader42fs)
+    loader.validate_instrument = lambda *x: searches('instrument', *x)
+    loader.validate_prices_curve = lambda source, id_instrument, price_type, description: searches(
+        'prices_curve', id_instrument, price_type)
+    loader.validate_curves_dict = lambda *x: searches('curves_dict', *x)
+    data = pd.DataFrame({'date': pd.to_datetime(['2023-01-02'] * 4 + ['2023-01-03'] * 2),
+                         'prices_name': ['gas'] * 6,
+                         'price': range(6),
+                         'hub': ['TTF', 'TTF', 'NBP', 'TTF', 'TTF', 'NBP'],
+                         'hub2': '-', 'unit': 'MWh', 'currency': 'EUR',
+                         'price_type': ['bid', 'ask', 'bid', 'bid', 'bid', 'bid'],
+                         'products': 'M+1', 'product_type': 'Month'})
+
+    df = loader.resolve_ids(data.copy(), 'Natural Gas')
+
+    instruments = [call for call in searches.calls if call[0] == 'instrument']
+    # products are dated, so the same hub on another day is another instrument
+    assert len(instruments) == len(set(instruments)) == 4
+    assert len(searches.calls) == len(set(searches.calls))
+    assert list(df['price']) == list(range(6))
+    assert df.loc[0, 'id_curve'] == df.loc[3, 'id_curve']
+    assert df.loc[0, 'id_curve'] != df.loc[1, 'id_curve']
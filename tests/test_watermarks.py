@@ -0,0 +1,54 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from watermarks import WatermarkStore
+
+TODAY = date(2023, 4, 10)
+
+
+def days(*days_: str) -> pd.DataFrame:
+    return pd.DataFrame({'date': pd.to_datetime(list(days_)), 'value': [1.0] * len(days_)})
+
+
+def test_watermark_is_not_moved_when_load_fails(tmp_path):
+    store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+
+    def load(df: pd.DataFrame):
+        raise ConnectionError('the database is down')
+
+    with pytest.raises(ConnectionError):
+        store.run(source='GRTgaz', data_type='physical_flow', fetch=lambda start, end: days('2023-04-08'),
+                  load=load, default_start=date(2023, 4, 1), today=TODAY)
+    assert store.get('GRTgaz', 'physical_flow') is None
+    assert not (tmp_path / 'watermarks.json').exists()
+
+
+def test_watermark_is_moved_after_load_and_never_back(tmp_path):
+    file_name = str(tmp_path / 'watermarks.json')
+    store = WatermarkStore(file_name)
+    loaded = []
+
+    def load(df: pd.DataFrame):
+        # the watermark is still the old one while data is loaded
+        loaded.append(store.get('GRTgaz', 'physical_flow'))
+
+    store.run(source='GRTgaz', data_type='physical_flow', fetch=lambda start, end: days('2023-04-07', '2023-04-08'),
+              load=load, default_start=date(2023, 4, 1), today=TODAY)
+    assert loaded == [None]
+    assert WatermarkStore(file_name).get('GRTgaz', 'physical_flow') == date(2023, 4, 8)
+
+    # the overlap window is collected again but a source returned only older days
+    windows = []
+
+    def fetch(start: date, end: date) -> pd.DataFrame:
+        windows.append((start, end))
+        return days('2023-04-06')
+
+    store.run(source='GRTgaz', data_type='physical_flow', fetch=fetch, load=load, default_start=date(2023, 4, 1),
+              overlap=2, today=TODAY)
+    assert windows == [(date(2023, 4, 6), TODAY)]
+    assert store.get('GRTgaz', 'physical_flow') == date(2023, 4, 8)
+    store.set('GRTgaz', 'physical_flow', date(2023, 1, 1))
+    assert WatermarkStore(file_name).get('GRTgaz', 'physical_flow') == date(2023, 4, 8)